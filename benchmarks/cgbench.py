@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## CG meter benchmarks: sampling, frame rate, step latency, CPU and Tk rendering
+
+Run from the project root folder:
+    python3 -m benchmarks.cgbench --output bench.json
+    python3 -m benchmarks.cgbench --replay capture.csv
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import tempfile
+import threading
+import numpy as np
+
+import constants
+# the benchmarks always run on the emulator, it must be set before the gauges module is imported
+constants.EMULATE_HX711 = True
+from modules.hx711_emulator import HX711, VirtualClock
+from modules.cg_gauge import CGModule
+from modules.cg_meter import CGMeter
+from utils.cgsolver import CGSolver
+from utils.capture import load_capture
+from utils.planemanager import PlaneManager
+
+GAUGE_COUNTS = (1, 3, 4, 6)
+READINGS = (1, 6, 30)           # the samples averaged by frame
+FIR_FILTER = {"rate": 80, "decimation": 8, "order": 2, "cutoff": 3, "taps": 31}  # a CIC then FIR chain, see cg_filter
+# (readings, "filter" entry of the modules) of each scenario, a filtered module reads its decimation by frame
+SETTINGS = [(readings, None) for readings in READINGS] + [(1, FIR_FILTER)]
+FRAMES = 200                    # frames measured by scenario
+SAMPLES = 2000                  # samples measured by module
+STEP_TOLERANCE = 2.0            # mm, the CG is settled when it stays within this distance of the expected one
+STEP_WINDOW = 3.0               # s of sensor time observed after the load step
+RENDER_FRAMES = 200
+FIRST_DOUT_PIN = 100            # fake pins of the emulated gauges
+
+class ReplaySignal:
+    """The load of a gauge replayed from a capture, looping at the end"""
+    def __init__(self, times : np.ndarray, values : np.ndarray):
+        self.__times = times - times[0]
+        self.__values = values
+        self.__duration = self.__times[-1] if self.__times[-1] > 0 else 1.0
+
+    def __call__(self, timestamp : float) -> float:
+        index = np.searchsorted(self.__times, timestamp % self.__duration, side='right') - 1
+        return float(self.__values[max(index, 0)])
+
+class StepSignal:
+    """A load changing from one value to another at a given time"""
+    def __init__(self, before : float, after : float, step_time : float):
+        self.before = before
+        self.after = after
+        self.step_time = step_time
+
+    def __call__(self, timestamp : float) -> float:
+        return self.before if timestamp < self.step_time else self.after
+
+def gauge_layout(count : int) -> dict[str, tuple[float,float]]:
+    """Gauges positions for a given count: the usual 3 wheels, else evenly spread on a circle"""
+    if count == 3:
+        return {'RightWheel': (-10.0, 125.0), 'LeftWheel': (-10.0, -125.0), 'TailWheel': (790.0, 0.0)}
+
+    layout = {}
+    for i in range(count):
+        angle = 2 * math.pi * i / count
+        layout[f'Gauge{i + 1}'] = (100.0 + 200.0 * math.cos(angle), 200.0 * math.sin(angle))
+    return layout
+
+def replay_layout(names : list[str], plane_name : str = None) -> dict[str, tuple[float,float]]:
+    """Gauges positions of a replayed capture: the plane ones if it has all the captured gauges,
+    else the usual 3 wheels or the circle of gauge_layout() with the names of the capture
+
+    Args:
+        names (list[str]): the gauges names of the capture
+        plane_name (str, optional): the plane of the capture in the planes config file. Defaults to None.
+
+    Returns:
+        dict[str, tuple[float,float]]: the position in mm by gauge name
+    """
+    if plane_name is not None:
+        planes = PlaneManager()
+        planes.load()
+        plane = planes.get_plane_by_name(plane_name)
+        if plane is None:
+            raise ValueError(f'Unknown plane {plane_name}')
+        positions = plane.gauge_positions
+        missing = [name for name in names if name not in positions]
+        if missing:
+            raise ValueError(f'The plane {plane_name} has no position for the gauges {missing}')
+        return {name: positions[name] for name in names}
+
+    layout = gauge_layout(len(names))
+    if set(layout.keys()) == set(names):
+        return layout
+    return dict(zip(names, layout.values()))
+
+def write_config(directory : str, names : list[str], filter : dict = None) -> str:
+    """Write a cgconfig file for emulated gauges, the config files of the application are not touched"""
+    modules = {}
+    for i, name in enumerate(names):
+        modules[name] = {"position": [0, 0], "ratio": 1.0, "gpio": {"dt": FIRST_DOUT_PIN + i, "sck": FIRST_DOUT_PIN - 1}}
+        if filter is not None:
+            modules[name]["filter"] = filter
+    # the config files are cached by name, a filtered config has its own
+    filename = os.path.join(directory, f'cgconfig_{len(names)}{"_filtered" if filter is not None else ""}.json')
+    with open(filename, 'w') as f:
+        json.dump({"Modules": modules, "CalibrationWeight": 100}, f, indent=4)
+    return filename
+
+def set_signals(names : list[str], signals : dict):
+    HX711.signals = {FIRST_DOUT_PIN + i: signals[name] for i, name in enumerate(names)}
+
+def new_meter(label : str, directory : str, names : list[str], filter : dict = None) -> CGMeter:
+    """A new meter, its gauges are zeroed without load as in the application"""
+    set_signals(names, {name: lambda t: 0.0 for name in names})
+    meter = CGMeter(f'bench-{label}-{time.monotonic_ns()}')
+    meter.initialize(write_config(directory, names, filter), supervise=False)
+    return meter
+
+def run_meter(meter : CGMeter, readings : int, stop : callable) -> tuple[list, float, float]:
+    """Read a meter at full rate until stop(frames) is True
+
+    Returns:
+        tuple[list, float, float]: the (sensor time, weights) frames, the wall time and the cpu time in seconds
+    """
+    frames = []
+    done = threading.Event()
+
+    def on_readings(weights):
+        if weights is None or done.is_set():
+            return
+        frames.append((HX711.clock.now(), weights))
+        if stop(frames):
+            done.set()
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    meter.start_reading(on_readings, readings, 0.0)
+    done.wait()
+    meter.stop_reading(wait=True)
+    return frames, time.perf_counter() - wall, time.process_time() - cpu
+
+def bench_module_samples(directory : str, samples : int) -> dict:
+    """Samples per second of one CGModule"""
+    names = ['Gauge1']
+    set_signals(names, {'Gauge1': lambda t: 0.0})
+    module = CGModule()
+    module.loadConfig('Gauge1', {"position": [0, 0], "ratio": 1.0, "gpio": {"dt": FIRST_DOUT_PIN, "sck": FIRST_DOUT_PIN - 1}})
+    module.initialize()
+    set_signals(names, {'Gauge1': lambda t: 100.0})
+
+    sensor_start = HX711.clock.now()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for _ in range(samples):
+        module.readSample()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    sensor = HX711.clock.now() - sensor_start
+    return {
+        'samples': samples,
+        'samples_per_s': samples / wall,
+        'sensor_samples_per_s': samples / sensor if sensor > 0 else None,
+        'cpu_us_per_sample': cpu / samples * 1e6
+    }
+
+def bench_meter_frames(directory : str, layout : dict, signals : dict, readings : int, frames : int, filter : dict = None) -> dict:
+    """Frames per second and cpu per frame of a CGMeter"""
+    names = list(layout.keys())
+    meter = new_meter(f'{len(names)}x{readings}', directory, names, filter)
+    set_signals(names, signals)
+    solver = CGSolver(layout)
+    result, wall, cpu = run_meter(meter, readings, lambda f: len(f) >= frames)
+
+    # the CG computing is part of the frame cost
+    start = time.perf_counter()
+    for _, weights in result:
+        try:
+            solver.solve(weights)
+        except ValueError:
+            pass
+    cg_time = time.perf_counter() - start
+
+    sensor = result[-1][0] - result[0][0] if len(result) > 1 else 0.0
+    return {
+        'gauges': len(names),
+        'readings': readings,
+        'filter': filter,
+        'frames': len(result),
+        'frames_per_s': len(result) / wall,
+        'sensor_frames_per_s': (len(result) - 1) / sensor if sensor > 0 else None,
+        'cpu_ms_per_frame': cpu / len(result) * 1e3,
+        'cg_us_per_frame': cg_time / len(result) * 1e6
+    }
+
+def bench_step_latency(directory : str, layout : dict, readings : int, filter : dict = None) -> dict:
+    """Sensor time from a load step to a CG settled within STEP_TOLERANCE"""
+    names = list(layout.keys())
+    before = {name: 200.0 for name in names}
+    after = dict(before)
+    after[names[-1]] = 260.0  # move some ballast on the last gauge
+    solver = CGSolver(layout)
+    expected = np.array(solver.solve(after))
+
+    meter = new_meter(f'step{len(names)}x{readings}', directory, names, filter)
+    step_time = HX711.clock.now() + 0.5
+    set_signals(names, {name: StepSignal(before[name], after[name], step_time) for name in names})
+    frames, _, _ = run_meter(meter, readings, lambda f: f[-1][0] >= step_time + STEP_WINDOW)
+
+    settled = None
+    for timestamp, weights in frames:
+        if timestamp < step_time:
+            continue
+        try:
+            error = np.linalg.norm(np.array(solver.solve(weights)) - expected)
+        except ValueError:
+            error = math.inf
+        if error > STEP_TOLERANCE:
+            settled = None
+        elif settled is None:
+            settled = timestamp
+
+    return {
+        'gauges': len(names),
+        'readings': readings,
+        'filter': filter,
+        'tolerance_mm': STEP_TOLERANCE,
+        'latency_ms': (settled - step_time) * 1e3 if settled is not None else None
+    }
+
+def bench_tk_render(frames : int) -> dict:
+    """Time to update the CG drawing and the labels of a frame, None without display"""
+    try:
+        import tkinter as tk
+        from utils.drawings import Circle
+        root = tk.Tk()
+    except Exception as e:
+        return {'available': False, 'reason': str(e)}
+
+    try:
+        canvas = tk.Canvas(root, width=800, height=400)
+        canvas.pack()
+        labels = [tk.Label(root) for _ in range(5)]
+        for label in labels:
+            label.pack()
+        circle = Circle(canvas, (400, 200))
+        circle.draw()
+        root.update()
+
+        durations = []
+        for i in range(frames):
+            start = time.perf_counter()
+            circle.move_to((300 + i % 200, 200))
+            circle.change_color('green' if i % 2 else 'red')
+            for label in labels:
+                label.configure(text=f'{i} g')
+            root.update_idletasks()
+            durations.append(time.perf_counter() - start)
+
+        durations = np.array(durations) * 1e3
+        return {
+            'available': True,
+            'frames': frames,
+            'mean_ms': float(durations.mean()),
+            'p95_ms': float(np.percentile(durations, 95)),
+            'max_ms': float(durations.max())
+        }
+    finally:
+        root.destroy()
+
+def run(frames : int, samples : int, replay : str = None, plane_name : str = None) -> dict:
+    HX711.clock = VirtualClock()
+    results = {'module_samples': None, 'meter_frames': [], 'step_latency': [], 'tk_render': None}
+    with tempfile.TemporaryDirectory() as directory:
+        results['module_samples'] = bench_module_samples(directory, samples)
+
+        if replay is not None:
+            times, weights = load_capture(replay)
+            layout = replay_layout(list(weights.keys()), plane_name)
+            signals = {name: ReplaySignal(times, weights[name]) for name in layout}
+            scenarios = [(layout, signals)]
+        else:
+            scenarios = []
+            for count in GAUGE_COUNTS:
+                layout = gauge_layout(count)
+                scenarios.append((layout, {name: lambda t: 200.0 for name in layout}))
+
+        for layout, signals in scenarios:
+            for readings, filter in SETTINGS:
+                results['meter_frames'].append(bench_meter_frames(directory, layout, signals, readings, frames, filter))
+                if replay is None:
+                    results['step_latency'].append(bench_step_latency(directory, layout, readings, filter))
+
+    HX711.clock = None
+    HX711.signals = {}
+    results['tk_render'] = bench_tk_render(RENDER_FRAMES)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(prog="cgbench", description="CG meter benchmarks, on the HX711 emulator in virtual time")
+    parser.add_argument("--output", default=None, help="json output file, default is the standard output")
+    parser.add_argument("--frames", type=int, default=FRAMES, help="frames measured by scenario")
+    parser.add_argument("--samples", type=int, default=SAMPLES, help="samples measured for the module")
+    parser.add_argument("--replay", default=None, help="replay the gauges loads of a headless capture (csv or json lines)")
+    parser.add_argument("--plane", default=None, help="plane of the replayed capture, its gauges positions are used")
+    args = parser.parse_args()
+
+    report = {
+        'app_version': constants.APP_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'time': time.time(),
+        'replay': args.replay,
+        'results': run(args.frames, args.samples, args.replay, args.plane)
+    }
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+
+if __name__ == "__main__":
+    main()
@@ -43,12 +43,18 @@ LOG_LEVEL      = logging.DEBUG      # logging level : DEBUG, INFO, WARNING, ERRO
 LOG_CONSOLE    = False              # True to log to console, False to log to file only
 EMULATE_HX711  = False              # True to emulate HX711, False to use GPIO
 MAIN_PLANE     = 'ExtraNG'          # which plane do you want to use as default
+ACQUISITION_PROCESS = False         # True to read the gauges in a child process, not slowed down by the UI
+TIMING_ENABLED = False              # True to time the measurement pipeline stages, see utils/timing.py
+TIMING_PERIOD  = 60                 # seconds between two logs of the timing summary, 0 for none
+TIMING_OVERLAY = False              # True to show the timing summary on the sketch
 
 # do not change constants below this line
 APP_ROOT_FOLDER     = os.path.dirname(os.path.abspath(__file__))
 APP_CONFIG_DIR      = "config"
 APP_CG_FILENAME     = os.path.join(APP_ROOT_FOLDER,APP_CONFIG_DIR,"cgconfig.json")
 APP_PLANES_FILENAME = os.path.join(APP_ROOT_FOLDER,APP_CONFIG_DIR,"planes.json")
+APP_HISTORY_FILENAME= os.path.join(APP_ROOT_FOLDER,APP_CONFIG_DIR,"history.db")
+DEFAULT_STATION     = "default"     # name of the CG meter station used when no name is given
 
 ORIGIN = (244, 204)  # this is the wing leading edge screen coordinates
 RWHEEL = (225, 100)  # this is right wheel screen coordinates
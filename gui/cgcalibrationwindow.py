@@ -28,13 +28,19 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
-import os
 import logging
-from constants import APP_NAME, APP_ROOT_FOLDER
+from constants import APP_NAME
 import tkinter as tk
 import wgkinter as wk
 from wgkinter.modal import NoTitleBarModalDialog
 from modules.cg_meter import CGMeter
+from modules.cg_snapshot import PHASE_WAITING
+from utils.imagecache import ImageCache
+from utils.planemanager import PlaneManager
+from gui.cgstripchart import CGStripChartWindow
+
+CALIBRATION_IMAGE_SIZE = (500, 211)     # size of the top view in the dialog
+CALIBRATION_POLL = 100                  # ms between two updates of the calibration progress
 
 class CGCalibrationWindow(NoTitleBarModalDialog):
     """The calibration modal dialog box to calibrate the different modules
@@ -46,6 +52,8 @@ class CGCalibrationWindow(NoTitleBarModalDialog):
             master (tk.Tk, optional): The parent window. Defaults to None.
 
         """
+        self.__calibration = None
+        self.__prompted = None
         super().__init__(master, title = "Calibration",geometry="800x450")
 
         """DO NOT ADD CODE BELOW THIS LINE AS IT WILL BE CALLED ONLY WHEN DIALOG IS DESTROYED"""
@@ -56,12 +64,27 @@ class CGCalibrationWindow(NoTitleBarModalDialog):
         Args:
             parent (tk.Frame): The parent frame
         """
-        btn_ok = wk.Button(parent)
-        btn_ok.configure(text='Finish', width=10)
-        btn_ok.pack(padx=5, pady=5, side="right")
-        btn_ok.configure(command=self.on_ok)
+        self.btn_ok = wk.Button(parent)
+        self.btn_ok.configure(text='Finish', width=10)
+        self.btn_ok.pack(padx=5, pady=5, side="right")
+        self.btn_ok.configure(command=self.on_ok)
+        self.btn_stop = wk.Button(parent)
+        self.btn_stop.configure(text='Stop', width=5, state="disabled")
+        self.btn_stop.pack(pady=5, side="right")
+        self.btn_stop.configure(command=self.on_stop)
         self.bind("<Return>", self.on_ok)
         self.bind("<Escape>", self.on_cancel)
+        self.btn_signals = wk.Button(parent)
+        self.btn_signals.configure(text='Signals', width=10)
+        self.btn_signals.pack(padx=5, pady=5, side="left")
+        self.btn_signals.configure(command=self.on_signals)
+        self.btn_all = wk.Button(parent)
+        self.btn_all.configure(text='Calibrate all', width=10)
+        self.btn_all.pack(pady=5, side="left")
+        self.btn_all.configure(command=self.on_calibrate_all)
+        self.lb_status = wk.Label(parent)
+        self.lb_status.configure(text='', anchor="w", font="{Arial} 9 {italic}")
+        self.lb_status.pack(fill="x", expand="true", padx=5, side="left")
         parent.pack(fill="x", side="bottom")
 
     def position(self):
@@ -92,8 +115,8 @@ class CGCalibrationWindow(NoTitleBarModalDialog):
             foreground="white",
             text='Calibrate')
         img = tk.Label(cal_frame)
-        logging.getLogger(APP_NAME).debug(f"Loading image {os.path.join(APP_ROOT_FOLDER,'gui','top_view_450.png')}")
-        self.img_extra_top_view = tk.PhotoImage(file=os.path.join(APP_ROOT_FOLDER,"gui","top_view_450.png"))
+        # decoded once for all the openings of the dialog
+        self.img_extra_top_view = ImageCache().get(PlaneManager().get_current_plane(), CALIBRATION_IMAGE_SIZE)
         img.configure(
             borderwidth=0,
             image=self.img_extra_top_view,
@@ -123,44 +146,125 @@ class CGCalibrationWindow(NoTitleBarModalDialog):
         return entry_weight
 
     def __disable_buttons(self):
-        for button in self.__buttons.values():
+        for button in list(self.__buttons.values()) + [self.btn_all, self.btn_signals, self.btn_ok]:
             button.configure(state="disabled")
+        self.btn_stop.configure(state="normal")
 
     def __enable_buttons(self):
-        for button in self.__buttons.values():
+        for button in list(self.__buttons.values()) + [self.btn_all, self.btn_signals, self.btn_ok]:
             button.configure(state="normal")
-        
-    def on_calibrate(self, module_name):
+        self.btn_stop.configure(state="disabled")
+
+    def __calibration_weight(self) -> int:
+        """The calibration weight entered, None after telling the user if it is not valid"""
         logger = logging.getLogger(APP_NAME)
-        logger.debug(f"Calbrating {module_name}")
         try:
             known_weight_grams = self.calibration_weigth.get()
         except BaseException as e:
             wk.MessageDialog(self, "Error", "The calibration weight must be a number")
             logger.error(f"The calibration weight must be a number: {str(e)}")
-            return
+            return None
 
         if known_weight_grams <= 0:
             wk.MessageDialog(self, "Error", "The calibration weight must be greater than 0")
             logger.error("The calibration weight must be greater than 0")
-            return
-        
-        dlg = wk.YesNoDialog(self, "Calibration", f"Calibrate {module_name} with {known_weight_grams} grams ?")
+            return None
+        return known_weight_grams
+
+    def __start(self, module_names : list[str], known_weight_grams : int, confirmed : bool = False):
+        """Calibrate the modules in the background, the dialog polls the progress
+
+        Args:
+            module_names (list[str]): the modules names, in the calibration order
+            known_weight_grams (int): the calibration weight in grams
+            confirmed (bool, optional): True if the weight is already on the first module. Defaults to False.
+        """
+        logger = logging.getLogger(APP_NAME)
         try:
-            if dlg.result is True:
-                logger.debug(f"Calibrating module {module_name} with known weight of {known_weight_grams}")
-                self.configure(cursor="watch")
-                self.__disable_buttons()
-                self.update()
-                CGMeter().calibrate_module(module_name, known_weight_grams)
-                self.configure(cursor="")
-                self.__enable_buttons()
-                wk.MessageDialog(self, "Calibration", f"{module_name} calibrated with success")
-                
+            logger.debug(f"Calibrating modules {module_names} with known weight of {known_weight_grams}")
+            self.__calibration = CGMeter().calibrate_modules(module_names, known_weight_grams)
+            self.__prompted = None
+            if confirmed:
+                self.__prompted = 0
+                self.__calibration.resume()
+            self.__disable_buttons()
+            self.after(CALIBRATION_POLL, self.__poll_calibration)
         except Exception as e:
+            self.__calibration = None
             logger.error(f"Error during calibration: {str(e)}")
             wk.MessageDialog(self, "Error", f"Error during calibration : {e}")
 
+    def __poll_calibration(self):
+        calibration = self.__calibration
+        if calibration is None:
+            return
+        status = calibration.status
+        if calibration.running:
+            if status.phase == PHASE_WAITING:
+                if self.__prompted != status.index:
+                    # once per module, the dialog blocks this poll and the calibration waits meanwhile
+                    self.__prompted = status.index
+                    dlg = wk.YesNoDialog(self, "Calibration", f"Put {status.known_weight:g} grams on {status.module} only.\nContinue ?")
+                    if dlg.result is True:
+                        calibration.resume()
+                    else:
+                        calibration.cancel()
+                self.lb_status.configure(text=f'Waiting for the weight on {status.module}...')
+            else:
+                self.lb_status.configure(text=f'{status}  {status.progress * 100:.0f}%')
+            self.after(CALIBRATION_POLL, self.__poll_calibration)
+            return
+
+        self.__calibration = None
+        self.__enable_buttons()
+        if calibration.result is not None:
+            self.lb_status.configure(text='')
+            ratios = ", ".join(f"{name} {ratio:.3f}" for name, ratio in calibration.result.items())
+            wk.MessageDialog(self, "Calibration", f"Calibrated with success\n{ratios}")
+        elif calibration.error is not None:
+            self.lb_status.configure(text='')
+            wk.MessageDialog(self, "Error", f"Error during calibration : {calibration.error}")
+        else:
+            self.lb_status.configure(text='Calibration cancelled')
+
+    def on_signals(self):
+        """Show the live signals of the gauges, e.g. to check a gauge is settled before calibrating it"""
+        CGStripChartWindow(self)
+
+    def on_calibrate(self, module_name):
+        logger = logging.getLogger(APP_NAME)
+        logger.debug(f"Calbrating {module_name}")
+        known_weight_grams = self.__calibration_weight()
+        if known_weight_grams is None:
+            return
+
+        dlg = wk.YesNoDialog(self, "Calibration", f"Calibrate {module_name} with {known_weight_grams} grams ?")
+        if dlg.result is True:
+            self.__start([module_name], known_weight_grams, confirmed=True)
+
+    def on_calibrate_all(self):
+        """Calibrate all the initialized gauges one after the other, the user is asked to move the weight between them"""
+        known_weight_grams = self.__calibration_weight()
+        if known_weight_grams is None:
+            return
+        names = [module.name for module in CGMeter().modules if module.initialized]
+        self.__start(names, known_weight_grams)
+
+    def on_stop(self):
+        if self.__calibration is not None:
+            self.__calibration.cancel()
+
+    def on_ok(self, event=None):
+        if self.__calibration is not None:
+            return
+        super().on_ok(event)
+
+    def on_cancel(self, event=None):
+        if self.__calibration is not None:
+            self.__calibration.cancel()
+            return
+        super().on_cancel(event)
+
   
 if __name__ == "__main__":
     raise Exception("This is a module, not a program. It should not be run directly.")
\ No newline at end of file
@@ -35,12 +35,14 @@ import logging.handlers
 
 ''' Personal imports '''
 import wgkinter as wk
-from constants import APP_NAME, APP_VERSION, APP_CG_FILENAME, MAIN_PLANE
-from gui.cgwindowbase import CGWindowBase
-from modules.cg_meter import CGMeter
-from gui.cgcalibrationwindow import CGCalibrationWindow
-from utils.planemanager import PlaneManager
-from utils.drawings import Circle, RoundedRectangle
+from constants import APP_NAME, APP_VERSION, APP_CG_FILENAME, MAIN_PLANE, TIMING_OVERLAY, ACQUISITION_PROCESS
+from gui.cgwindowbase import CGWindowBase, SKETCH_SIZE
+from utils.drawings import Circle, RoundedRectangle, Marker, Polyline
+from utils.imagecache import ImageCache
+from utils.startup import StartupTimer
+from utils.timing import PipelineTimer, STAGE_CG, STAGE_DISPLAY
+
+TRAIL_PERIOD = 0.2      # seconds between two redraws of the CG trail
 
 class CGMainApp(CGWindowBase):
     """The main application window"""
@@ -61,12 +63,42 @@ class CGMainApp(CGWindowBase):
 
         self.ref_cg_dwg = None
         self.cg_dwg = None
+        self.ballast_dwg = None
+        self.trail_dwg = None
+        self.__trail = None
+        self.__trail_time = 0
+        self.cgmeter = None
+        self.history = None
+        self.__last_frame = None
+        self.__snapshot = None
+        self.__overlay_time = 0
+        self.__plane_check_time = 0
+        self.__overlays = {}
+        self.__weights_color = self.lb_weights['total']['foreground']
     
     ''' Private methods call by threads'''
+    def __on_ready(self, event):
+        # the window is mapped, wait for the first frame to be drawn before the heavy work
+        if event.widget is not self.mainwindow:
+            return
+        self.mainwindow.unbind('<Map>', self.__ready_binding)
+        self.mainwindow.after_idle(self.__on_first_frame)
+
+    def __on_first_frame(self):
+        StartupTimer().mark("first frame")
+        self.load_sketch()
+        StartupTimer().mark("sketch decoded")
+        self.__initialize_cgmeter()
+
     def __initialize_cgmeter(self):
         self.mainwindow.configure(cursor="watch")
         self.mainwindow.update()
         self.message = "Loading default plane..."
+        # imported here with numpy, the window is shown before
+        from utils.planemanager import PlaneManager
+        from utils.trail import RingBuffer
+        self.__trail = RingBuffer()
+        StartupTimer().mark("numpy")
         #initalize the plane manager & UI
         PlaneManager().load()
         try:
@@ -78,21 +110,35 @@ class CGMainApp(CGWindowBase):
             self.__logger.error("Error loading plane: " + str(e))
 
         self.__update_UI()
+        self.set_models(PlaneManager().get_planes_names_list())
+        self.mainwindow.after_idle(self.__precompute_planes)
+        StartupTimer().mark("plane loaded")
 
         self.message = "Initializing CG gauges..."
-        CGMeter().initialize(APP_CG_FILENAME)
+        # imported here, the hardware stack is not needed to show the window
+        from modules.cg_meter import CGMeter
+        self.cgmeter = CGMeter()
+        self.cgmeter.initialize(APP_CG_FILENAME)
+        StartupTimer().mark("gauges initialized")
+
+        from utils.history import MeasurementHistory
+        self.history = MeasurementHistory()
+        self.history.start()
+        PlaneManager().load_signatures(self.history)
                 
         self.message = "Inialization done."
         self.message = ""
-        self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_exit')
+        self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_snapshot', 'btn_exit')
         self.mainwindow.configure(cursor="")
+        StartupTimer().mark("ready")
+        StartupTimer().log()
 
     def __tare_cggauges(self):
         try:
             self.mainwindow.configure(cursor="watch")
             self.mainwindow.update()
             self.message = "Taring CG gauges..."
-            CGMeter().tare()
+            self.cgmeter.tare()
             self.message = "Taring done."
             wk.MessageDialog(self.mainwindow, "CG Meter Tare", "Tare done successfully.")
             
@@ -102,11 +148,15 @@ class CGMainApp(CGWindowBase):
         finally:
             self.mainwindow.configure(cursor="")
             self.message = ""
-            self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_exit')    
+            self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_snapshot', 'btn_exit')    
        
     ''' Override methods'''
     def run(self):
-        self.mainwindow.after(1500, self.__initialize_cgmeter)
+        # initialize as soon as the window is shown instead of after a fixed delay
+        if self.mainwindow.winfo_ismapped():
+            self.mainwindow.after_idle(self.__on_first_frame)
+        else:
+            self.__ready_binding = self.mainwindow.bind('<Map>', self.__on_ready, add='+')
         uname = platform.uname()
         if uname.system != 'Windows':
             # below, does not work on windows platform
@@ -120,7 +170,13 @@ class CGMainApp(CGWindowBase):
 
     ''' Handlers methods'''
     def on_motion(self, event):
-        self.message = ("x: " + str(event.x) + " y: " + str(event.y))
+        from utils.planemanager import PlaneManager
+        plane = PlaneManager().get_current_plane()
+        try:
+            x, y = plane.screen_to_mm((event.x, event.y))
+            self.message = f'x: {event.x} y: {event.y} ({x:.0f} mm, {y:.0f} mm)'
+        except (AttributeError, ValueError):
+            self.message = ("x: " + str(event.x) + " y: " + str(event.y))
         
         if self.cg_dwg is not None:
             self.cg_dwg.move_to((event.x, event.y))
@@ -128,16 +184,35 @@ class CGMainApp(CGWindowBase):
     def on_exit(self):
         self.__goodbye()
 
+    def on_model_selected(self, name : str):
+        from utils.planemanager import PlaneManager
+        # the readings go on, the next frame is computed with the new plane
+        try:
+            PlaneManager().set_current_plane_by_name(name)
+            self.__last_frame = None
+            self.__update_UI()
+            if self.cgmeter is None or not self.cgmeter.reading:
+                # a snapshot CG shown was computed for the previous plane
+                self.cg_dwg.hide()
+                self.ballast_dwg.hide()
+            if self.message.startswith("The plane on the gauges"):
+                self.message = "Reading..."
+            self.__logger.info("Plane switched to %s", name)
+        except BaseException as e:
+            self.__logger.error("Error switching plane: %s", e)
+            self.message = "Error switching plane: " + str(e)
+
     def on_calibrate(self):
         self.disable_buttons()
         try:
+            from gui.cgcalibrationwindow import CGCalibrationWindow
             CGCalibrationWindow(self.mainwindow)
 
         except BaseException as e:
             self.__logger.error("Calibration failed: " + str(e))
             wk.MessageDialog(self.mainwindow, "CG Meter Calibration", "Calibration failed.\n" + str(e))
         finally:
-            self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_exit')
+            self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_snapshot', 'btn_exit')
 
     def on_tare(self):
         self.disable_buttons()
@@ -145,7 +220,7 @@ class CGMainApp(CGWindowBase):
         if answer.result == True:
             self.mainwindow.after(500, self.__tare_cggauges)
         else:    
-            self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_exit')
+            self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_snapshot', 'btn_exit')
 
     def on_start(self):
         self.disable_buttons('btn_stop')
@@ -160,11 +235,42 @@ class CGMainApp(CGWindowBase):
         self.cg_dwg.show()
 
         self.message = "Reading..."
-        CGMeter().start_reading(self.on_display_readings)
+        self.__last_frame = None
+        self.__clear_trail()
+        self.cgmeter.start_reading(self.on_display_readings, process=ACQUISITION_PROCESS)
                 
+    def on_snapshot(self):
+        self.disable_buttons('btn_stop')
+        self.enable_buttons('btn_stop')
+
+        for key in self.lb_weights:
+            self.lb_weights[key].place_hide()
+
+        for label in self.lb_cg_position:
+            label.place_hide()
+
+        self.ballast_dwg.hide()
+        self.message = "Waiting for stable weights..."
+        # the snapshot runs in its own thread, its progress is polled to keep the UI responsive
+        self.__snapshot = self.cgmeter.snapshot()
+        self.mainwindow.after(200, self.__poll_snapshot)
+
     def on_stop(self):
-        
-        CGMeter().stop_reading()
+        from utils.planemanager import PlaneManager
+        if self.__snapshot is not None:
+            # the snapshot ends in __poll_snapshot
+            self.__snapshot.cancel()
+            self.disable_buttons()
+            return
+
+        self.cgmeter.stop_reading()
+
+        # the last reading with a CG is the accepted measurement
+        if self.__last_frame is not None and self.history is not None:
+            self.history.record(self.__last_frame, ratios=self.cgmeter.calibration_ratios())
+            PlaneManager().add_signature(self.__last_frame.plane, self.__last_frame.weights)
+            self.__logger.info("Measurement recorded: %s", self.__last_frame)
+            self.__last_frame = None
 
         time.sleep(1.5)
 
@@ -177,53 +283,101 @@ class CGMainApp(CGWindowBase):
         self.cg_dwg.move_to((-100,-100))
         self.cg_dwg.change_color('white')
         self.cg_dwg.hide()
+        self.ballast_dwg.hide()
+        self.trail_dwg.hide()
 
         self.disable_buttons()
-        self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_exit')
+        self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_snapshot', 'btn_exit')
         self.message = ""
         
     def on_display_readings(self, weights):
+        from utils.planemanager import PlaneManager
+        from modules.cg_frame import CGFrame
+        timer = PipelineTimer()
+        start = timer.begin()
         try:
             if weights is not None:
                 self.__display_weights_values(weights)
-                CGpos = self.__display_cg_values(weights)
+                # a faulty gauge gives a plausible but wrong CG, it is not shown
+                faults = self.cgmeter.faults()
+                self.__display_faults(faults)
+                if not faults:
+                    self.__check_plane(weights)
+                # the CG is solved once by the frame, no CG if a gauge is faulty
+                start_cg = timer.begin()
+                frame = CGFrame(weights, PlaneManager().get_current_plane(), station=self.cgmeter.name,
+                                positions=self.cgmeter.gauge_positions(), faults=faults)
+                timer.end(STAGE_CG, start_cg)
+                CGpos = self.__display_cg_values(frame)
+                self.__draw_ballast(frame)
                 if CGpos is not None:
+                    self.__draw_trail(CGpos)
                     self.__draw_cg(CGpos)
+                    self.__last_frame = frame
 
         except BaseException as e:
-                self.__logger.error("Error displaying results: " + str(e))
+                self.__logger.error("Error displaying results: %s", e)
                 
         finally:
+            if start is not None and TIMING_OVERLAY:
+                self.__display_timing()
             self.mainwindow.update()
+            timer.end(STAGE_DISPLAY, start)
 
     ''' Private methods'''
     def __update_UI(self):
+        from utils.planemanager import PlaneManager
         plane = PlaneManager().get_current_plane()
 
         if plane is None:
             raise Exception("No plane defined.")
 
         self.lb_model_name.set(plane.name)
+        self.menu_model_txt.set(plane.name)
+        self.load_sketch(plane)
 
+        point1, point2 = self.__overlay(plane)
 
-        point1 = (plane.cgx_range[0], plane.cgy_range[1])
-        point2 = (plane.cgx_range[1], plane.cgy_range[0])
-
-        point1 = plane.mm_to_screen(point1)
-        point2 = plane.mm_to_screen(point2)
-        
-        if self.ref_cg_dwg is not None:
-            self.ref_cg_dwg.delete()
-
-        self.ref_cg_dwg = RoundedRectangle(self.canvas, point1, point2, color = '#007fd4')
-        self.ref_cg_dwg.draw()
-
-        if self.cg_dwg is not None:
-            self.cg_dwg.delete()
-
-        self.cg_dwg = Circle(self.canvas, plane.mm_to_screen((0,0)))
-        self.cg_dwg.draw()
-        self.cg_dwg.hide()
+        # the canvas items are created once and reused for the other planes
+        if self.ref_cg_dwg is None:
+            self.ref_cg_dwg = RoundedRectangle(self.canvas, point1, point2, color = '#007fd4')
+            self.ref_cg_dwg.draw()
+        else:
+            self.ref_cg_dwg.set_corners(point1, point2)
+
+        if self.cg_dwg is None:
+            self.cg_dwg = Circle(self.canvas, plane.mm_to_screen((0,0)))
+            self.cg_dwg.draw()
+            self.cg_dwg.hide()
+
+        if self.trail_dwg is None:
+            self.trail_dwg = Polyline(self.canvas, color='#808080', dash=(2, 2))
+            self.trail_dwg.draw()
+
+        if self.ballast_dwg is None:
+            self.ballast_dwg = Marker(self.canvas, plane.mm_to_screen((0,0)))
+            self.ballast_dwg.draw()
+            self.ballast_dwg.hide()
+
+        # the trail of the previous plane is meaningless for this one
+        self.__clear_trail()
+
+    def __overlay(self, plane) -> tuple[tuple[float,float], tuple[float,float]]:
+        # the screen corners of the CG range of a plane, computed once by plane
+        if plane.name not in self.__overlays:
+            point1 = plane.mm_to_screen((plane.cgx_range[0], plane.cgy_range[1]))
+            point2 = plane.mm_to_screen((plane.cgx_range[1], plane.cgy_range[0]))
+            self.__overlays[plane.name] = (point1, point2)
+        return self.__overlays[plane.name]
+
+    def __precompute_planes(self):
+        from utils.planemanager import PlaneManager
+        # the overlays and top views of all the planes, a switch then costs a single frame
+        manager = PlaneManager()
+        planes = [manager.get_plane_by_name(name) for name in manager.get_planes_names_list()]
+        for plane in planes:
+            self.__overlay(plane)
+        ImageCache().preload(planes, SKETCH_SIZE)
 
     def __display_weights_values(self, weights):
         try:
@@ -235,28 +389,39 @@ class CGMainApp(CGWindowBase):
                 total_weight = 0
                 mwheels_weight = 0
                 for mod_name, weight in weights.items():
-                    if mod_name == "LeftWheel":
-                        self.lb_weights[mod_name].text = f'{int(round(weight))} g'
+                    # any number of gauges is summed, only the 3 wheels have a label
+                    total_weight += weight
+                    if mod_name in ("LeftWheel", "RightWheel"):
                         mwheels_weight += weight
-                        total_weight += weight
-                    elif mod_name == "RightWheel":
+                    if mod_name in ("LeftWheel", "RightWheel", "TailWheel"):
                         self.lb_weights[mod_name].text = f'{int(round(weight))} g'
-                        mwheels_weight += weight
-                        total_weight += weight
-                    elif mod_name == "TailWheel":
-                        self.lb_weights[mod_name].text = f'{int(round(weight))} g'
-                        total_weight += weight
                 
                 self.lb_weights['mwheels'].text = f'{int(round(mwheels_weight))} g'
                 self.lb_weights['total'].text = f'{int(round(total_weight))} g'
                 
         except BaseException as e:
-                self.__logger.error("Error displaying weights: " + str(e))
+                self.__logger.error("Error displaying weights: %s", e)
                 
-    def __display_cg_values(self, weights) -> tuple[int,int]:
+    def __display_faults(self, faults : dict):
+        for mod_name, label in self.lb_weights.items():
+            if mod_name in faults:
+                label['foreground'] = 'red'
+            else:
+                label['foreground'] = self.__weights_color
+
+        if faults:
+            self.message = "Gauge fault: " + ", ".join(f'{name} {state}' for name, state in faults.items())
+        elif self.message.startswith("Gauge fault"):
+            self.message = "Reading..."
+
+    def __display_cg_values(self, frame : 'CGFrame') -> tuple[int,int]:
+        from utils.planemanager import PlaneManager
         try:
+            if frame is None or frame.cg is None:
+                raise ValueError("no CG")
+
             the_plane = PlaneManager().get_current_plane()
-            CG = the_plane.plane_cg_by_weigth(weights)
+            CG = frame.cg
             
             # we start with the x axis
             CGx = CG[0]
@@ -282,7 +447,7 @@ class CGMainApp(CGWindowBase):
             return CG
 
         except BaseException as e:
-            self.__logger.debug("Error displaying CG positions: " + str(e))
+            self.__logger.debug("Error displaying CG positions: %s", e)
             self.lb_cg_position[0].text = f'NaN'
             self.lb_cg_position[0]['foreground'] = 'white'
             self.lb_cg_position[1].text = f'NaN'
@@ -290,15 +455,135 @@ class CGMainApp(CGWindowBase):
             return None
 
     def __draw_cg(self, cg_position : tuple[int,int]):
+        from utils.planemanager import PlaneManager
         try:
             plane = PlaneManager().get_current_plane()
             self.cg_dwg.move_to(plane.mm_to_screen(cg_position))
             self.cg_dwg.change_color(plane.color_in_range(cg_position[0],'x'))
            
         except BaseException as e:
-            self.__logger.debug("Error drawing CG: " + str(e))     
+            self.__logger.debug("Error drawing CG: %s", e)     
+
+    def __clear_trail(self):
+        self.__trail.clear()
+        if self.trail_dwg is not None:
+            self.trail_dwg.hide()
+
+    def __draw_trail(self, cg_position : tuple[int,int]):
+        from utils.planemanager import PlaneManager
+        from utils.trail import lttb
+        # every CG is kept, the line is redrawn 5 times per second through at most TRAIL_POINTS points
+        try:
+            self.__trail.append(cg_position)
+            now = time.monotonic()
+            if now - self.__trail_time < TRAIL_PERIOD:
+                return
+            self.__trail_time = now
+            plane = PlaneManager().get_current_plane()
+            self.trail_dwg.set_points(plane.mm_to_screen(lttb(self.__trail.values())))
+            if len(self.__trail) > 1:
+                self.trail_dwg.show()
+
+        except BaseException as e:
+            self.__logger.debug("Error drawing CG trail: %s", e)
+
+    def __draw_ballast(self, frame : 'CGFrame'):
+        from utils.planemanager import PlaneManager
+        # the lightest ballast bringing the CG in range, hidden while the CG is in range
+        try:
+            plane = PlaneManager().get_current_plane()
+            timer = PipelineTimer()
+            start = timer.begin()
+            ballast = plane.ballast_needed(frame.weights, cg=frame.cg) if frame is not None and frame.cg is not None else None
+            timer.end(STAGE_CG, start)
+            if ballast is None:
+                self.ballast_dwg.hide()
+                return
+
+            name, mass = ballast
+            x, y = plane.mm_to_screen(plane.ballast_locations[name])
+            # the wing tips may be out of the sketch, the marker stays on its edge
+            margin = 40
+            x = min(max(x, margin), SKETCH_SIZE[0] - margin)
+            y = min(max(y, margin), SKETCH_SIZE[1] - margin)
+            self.ballast_dwg.move_to((x, y))
+            self.ballast_dwg.set_text(f'+{int(round(mass))} g')
+            self.ballast_dwg.show()
+
+        except BaseException as e:
+            self.__logger.debug("Error drawing ballast: %s", e)
+            self.ballast_dwg.hide()
+
+    def __poll_snapshot(self):
+        from utils.planemanager import PlaneManager
+        from modules.cg_snapshot import PHASE_STABILIZING, COVERAGE
+        snapshot = self.__snapshot
+        if snapshot.running:
+            if snapshot.phase == PHASE_STABILIZING:
+                self.message = f'Waiting for stable weights... {snapshot.progress:.0%}'
+            else:
+                self.message = f'Measuring... {snapshot.progress:.0%}'
+            self.mainwindow.after(200, self.__poll_snapshot)
+            return
+
+        self.__snapshot = None
+        result = snapshot.result
+        if result is None:
+            self.message = "Snapshot failed: " + snapshot.error if snapshot.error else "Snapshot cancelled."
+        else:
+            for key in self.lb_weights:
+                self.lb_weights[key].place_show()
+            for label in self.lb_cg_position:
+                label.place_show()
+            self.cg_dwg.show()
+
+            self.__display_weights_values(result.weights)
+            self.__display_faults(result.faults)
+            frame = result.to_frame()
+            CGpos = self.__display_cg_values(frame)
+            self.__draw_ballast(frame)
+            if CGpos is not None:
+                self.__draw_cg(CGpos)
+            if result.cg is not None:
+                ux, uy = result.cg_uncertainty
+                self.message = (f'Snapshot: {result.total:.1f} ± {COVERAGE * result.total_uncertainty:.1f} g, '
+                                f'CG ± {COVERAGE * ux:.1f} / {COVERAGE * uy:.1f} mm')
+                if self.history is not None:
+                    self.history.record(result.to_frame(), result.cg_uncertainty, self.cgmeter.calibration_ratios())
+                PlaneManager().add_signature(result.plane, result.weights)
+            elif not result.faults:
+                self.message = f'Snapshot: {result.total:.1f} ± {COVERAGE * result.total_uncertainty:.1f} g, no CG'
+
+        self.disable_buttons()
+        self.enable_buttons('btn_calibrate','btn_tare','btn_start', 'btn_snapshot', 'btn_exit')
+
+    def __check_plane(self, weights : dict):
+        from utils.planemanager import PlaneManager
+        # once per second, a wrong plane gives a wrong CG without any other sign
+        now = time.monotonic()
+        if now - self.__plane_check_time < 1.0:
+            return
+        self.__plane_check_time = now
+        plane = PlaneManager().propose_plane(weights)
+        current = PlaneManager().get_current_plane()
+        if plane is not None and current is not None and plane.name != current.name:
+            self.message = f'The plane on the gauges looks like {plane.name}'
+        elif self.message.startswith("The plane on the gauges"):
+            self.message = "Reading..."
+
+    def __display_timing(self):
+        # refreshed once per second, the overlay must not slow down the display it measures
+        now = time.monotonic()
+        if now - self.__overlay_time >= 1.0:
+            self.__overlay_time = now
+            self.show_overlay(PipelineTimer().text())
 
     def __goodbye(self):
+        # no module must be initialized again once the GPIO is released
+        if self.cgmeter is not None:
+            self.cgmeter.shutdown()
+        if self.history is not None:
+            self.history.stop()
         self.mainwindow.destroy()
 
     ''' Getter/setter Property methods'''
@@ -308,9 +593,12 @@ class CGMainApp(CGWindowBase):
 
     @message.setter
     def message(self, value):
-        self.__logger.info(value)
+        if value == self.lb_message_txt.get():
+            return
+        self.__logger.debug("Message: %s", value)
         self.lb_message_txt.set(value)
-        self.mainwindow.update()
+        # redraw only, processing the pending events here would re-enter the handlers
+        self.mainwindow.update_idletasks()
 
     @property
     def version(self):
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## A strip chart of the gauges weights over the last seconds
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import time
+import logging
+import threading
+import numpy as np
+import tkinter as tk
+import wgkinter as wk
+from wgkinter.modal import NoTitleBarModalDialog
+from constants import APP_NAME
+from modules.cg_meter import CGMeter
+from utils.trail import RingBuffer
+
+CHART_WINDOW = 10.0     # seconds shown
+CHART_RATE = 100        # readings per second kept at most, the HX711 gives 80
+CHART_PERIOD = 50       # ms between two redraws, 20 frames per second
+MIN_SPAN = 2.0          # grams, the smallest vertical scale of a gauge
+COLORS = ('#4fc1ff', '#f48771', '#89d185', '#cca700', '#c586c0', '#d7ba7d')
+
+class StripChart:
+    """The weights of the gauges over the last seconds, drawn on a canvas as one line per gauge,
+    each gauge in its own lane with its own vertical scale. The readings are stored in a
+    preallocated ring buffer, the lines are changed in place at each redraw"""
+    def __init__(self, canvas : tk.Canvas, names : list[str], window : float = CHART_WINDOW, width : int = 760, height : int = 330):
+        """Constructor
+
+        Args:
+            canvas (tk.Canvas): canvas to draw on
+            names (list[str]): the gauges names
+            window (float, optional): the seconds shown. Defaults to CHART_WINDOW.
+            width (int, optional): the chart width in pixels. Defaults to 760.
+            height (int, optional): the chart height in pixels. Defaults to 330.
+        """
+        self.canvas = canvas
+        self.names = list(names)
+        self.window = window
+        self.width = width
+        self.height = height
+        # time then the weight of each gauge by row
+        self.__buffer = RingBuffer(int(window * CHART_RATE), 1 + len(self.names))
+        self.__lock = threading.Lock()
+        self.__lines = []
+        self.__labels = []
+        lane = height / max(1, len(self.names))
+        for i, name in enumerate(self.names):
+            color = COLORS[i % len(COLORS)]
+            self.canvas.create_line(0, (i + 1) * lane, width, (i + 1) * lane, fill='#3c3c3c')
+            self.__lines.append(self.canvas.create_line(0, 0, 0, 0, fill=color, width=1, state=tk.HIDDEN))
+            self.__labels.append(self.canvas.create_text(5, i * lane + 3, anchor="nw", fill=color, font="{Courier} 8 {}", text=name))
+
+    def add(self, weights : dict):
+        """Add a reading, can be called from any thread
+
+        Args:
+            weights (dict): the weights in grams by gauge name
+        """
+        if weights is None:
+            return
+        row = [time.monotonic()] + [weights.get(name, np.nan) for name in self.names]
+        with self.__lock:
+            self.__buffer.append(row)
+
+    def clear(self):
+        with self.__lock:
+            self.__buffer.clear()
+
+    def draw(self):
+        """Redraw the lines with the readings of the window"""
+        with self.__lock:
+            data = self.__buffer.values()
+        if len(data) < 2:
+            return
+
+        now = time.monotonic()
+        data = data[data[:, 0] >= now - self.window]
+        # at most one point per pixel column
+        step = max(1, len(data) // self.width)
+        data = data[::step]
+        if len(data) < 2:
+            return
+
+        xs = self.width + (data[:, 0] - now) * self.width / self.window
+        lane = self.height / len(self.names)
+        for i, name in enumerate(self.names):
+            values = data[:, i + 1]
+            valid = ~np.isnan(values)
+            if np.count_nonzero(valid) < 2:
+                self.canvas.itemconfig(self.__lines[i], state=tk.HIDDEN)
+                continue
+            low, high = np.min(values[valid]), np.max(values[valid])
+            middle = (low + high) / 2
+            span = max(high - low, MIN_SPAN)
+            # 10% of margin above and below the signal in the lane
+            ys = (i + 0.5) * lane - (values[valid] - middle) * lane * 0.8 / span
+            points = np.column_stack((xs[valid], ys)).ravel()
+            self.canvas.coords(self.__lines[i], *points.tolist())
+            self.canvas.itemconfig(self.__lines[i], state=tk.NORMAL)
+            self.canvas.itemconfig(self.__labels[i], text=f'{name} {values[valid][-1]:.1f} g  (span {high - low:.1f} g)')
+
+class CGStripChartWindow(NoTitleBarModalDialog):
+    """The strip chart dialog box, it reads the gauges at full rate while it is open unless they are already read"""
+    def __init__(self, master=None):
+        """constructor
+
+        Args:
+            master (tk.Tk, optional): The parent window. Defaults to None.
+        """
+        self.__logger = logging.getLogger(APP_NAME)
+        self.__chart = None
+        self.__reading = False
+        self.__after_id = None
+        super().__init__(master, title = "Signals", geometry="800x400")
+
+        """DO NOT ADD CODE BELOW THIS LINE AS IT WILL BE CALLED ONLY WHEN DIALOG IS DESTROYED"""
+
+    def buttonbox(self, parent):
+        """Add the buttons to the dialog box. This method is overriden from the parent class
+
+        Args:
+            parent (tk.Frame): The parent frame
+        """
+        btn_ok = wk.Button(parent)
+        btn_ok.configure(text='Close', width=10)
+        btn_ok.pack(padx=5, pady=5, side="right")
+        btn_ok.configure(command=self.on_ok)
+        self.bind("<Return>", self.on_ok)
+        self.bind("<Escape>", self.on_cancel)
+        parent.pack(fill="x", side="bottom")
+
+    def position(self):
+        self.geometry("+0+30")
+
+    def body(self, master):
+        """Add the body of the dialog box. This method is overriden from the parent class
+
+        Args:
+            master (tk.Frame): The parent frame
+
+        Returns:
+            The initial focus widget
+        """
+        canvas = tk.Canvas(master, width=760, height=330)
+        canvas.configure(background="#1e1e1e", borderwidth=0, highlightthickness=0)
+        canvas.pack(padx=20, pady=10, side="top")
+
+        meter = CGMeter()
+        names = [module.name for module in meter.modules if module.initialized]
+        self.__chart = StripChart(canvas, names)
+        meter.add_listener(self.__chart.add)
+        if not meter.reading:
+            # every sample, the chart shows the raw signals
+            try:
+                meter.start_reading(lambda weights: None, readings=1, period=0.0)
+                self.__reading = True
+            except Exception as e:
+                self.__logger.error("Error reading the gauges for the strip chart: %s", e)
+
+        self.__after_id = self.after(CHART_PERIOD, self.__redraw)
+        return canvas
+
+    def __redraw(self):
+        try:
+            self.__chart.draw()
+        except Exception as e:
+            self.__logger.debug("Error drawing the strip chart: %s", e)
+        self.__after_id = self.after(CHART_PERIOD, self.__redraw)
+
+    def __stop(self):
+        if self.__after_id is not None:
+            self.after_cancel(self.__after_id)
+            self.__after_id = None
+        meter = CGMeter()
+        if self.__chart is not None:
+            meter.remove_listener(self.__chart.add)
+        if self.__reading:
+            meter.stop_reading()
+            self.__reading = False
+
+    def on_ok(self, event=None):
+        self.__stop()
+        super().on_ok(event)
+
+    def on_cancel(self, event=None):
+        self.__stop()
+        super().on_cancel(event)
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
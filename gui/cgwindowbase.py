@@ -1,10 +1,11 @@
 #!/usr/bin/python3
-import os
 import tkinter as tk
 import wgkinter as wk
 import logging
-from PIL import Image, ImageTk
 import constants as const
+from utils.imagecache import ImageCache
+
+SKETCH_SIZE = (800, 400)    # size of the sketch, known in advance to layout the canvas before decoding it
 
 class CGWindowBase:
     def __init__(self, master=None):
@@ -58,12 +59,12 @@ class CGWindowBase:
         self.content_frame = tk.Frame(self.mainwindow)
         self.content_frame.configure(background="#252526")
         
-        # the canvas frame
-        self.img = Image.open(os.path.join(const.APP_ROOT_FOLDER,"gui","top_view_800.png"))
-        self.sketch = ImageTk.PhotoImage(self.img)
-        self.canvas = tk.Canvas(self.content_frame, width=self.img.size[0], height=self.img.size[1])
-        self.canvas.create_image(0, 0, image=self.sketch, anchor="nw")
+        # the canvas frame, the sketch is decoded later by load_sketch() to show the window sooner
+        self.sketch = None
+        self.canvas = tk.Canvas(self.content_frame, width=SKETCH_SIZE[0], height=SKETCH_SIZE[1])
+        self.sketch_id = self.canvas.create_image(0, 0, anchor="nw")
         self.canvas.configure(background="#252526", borderwidth=0, highlightthickness=0)
+        self.overlay_id = None
         self.canvas.pack(side="top",fill="both", expand="yes")
 
         # the model name and menu
@@ -77,7 +78,6 @@ class CGWindowBase:
             foreground="white",
             textvariable=self.lb_model_name)
         self.lb_model.pack(side="left")
-        """ Activate in next version
         self.menu_btn_model = tk.Menubutton(self.model_frame)
         self.menu_btn_model.configure(
             activebackground="#252526",
@@ -98,11 +98,9 @@ class CGWindowBase:
             font="{Arial} 10 {}",
             foreground="white",
             selectcolor="#2a2d2e")
-        self.menu_model.add("command", label='    Model 1 ')
-        self.menu_model.add("command", label='    Model 2 ')
+        self.menu_model_txt = tk.StringVar()
         self.menu_btn_model.configure(menu=self.menu_model)
         self.menu_btn_model.pack(side="right")
-        """
         self.model_frame.place(anchor="ne", relx=1.0)
 
         # the weights and CG labels
@@ -161,6 +159,10 @@ class CGWindowBase:
         self.btn_stop.configure(text='Stop', width=5)
         self.btn_stop.pack(side="left")
         self.btn_stop.configure(command=self.on_stop)
+        self.btn_snapshot = wk.Button(self.bottom_frame)
+        self.btn_snapshot.configure(text='Snapshot', width=8)
+        self.btn_snapshot.pack(padx="30 0", side="left")
+        self.btn_snapshot.configure(command=self.on_snapshot)
         self.btn_exit = wk.Button(self.bottom_frame)
         self.btn_exit.configure(text='Exit', width=10)
         self.btn_exit.pack(padx=3, pady=3, side="right")
@@ -172,6 +174,42 @@ class CGWindowBase:
         self.mainwindow = self.mainwindow
         
 
+    def load_sketch(self, plane = None):
+        """Show the top view of a plane in the canvas, the images are decoded once by the image cache
+
+        Args:
+            plane (Plane, optional): the plane, None for the generic silhouette. Defaults to None.
+        """
+        image = ImageCache().get(plane, SKETCH_SIZE)
+        if image is self.sketch:
+            return
+
+        self.sketch = image
+        self.canvas.itemconfig(self.sketch_id, image=self.sketch)
+        self.canvas.tag_lower(self.sketch_id)
+
+    def set_models(self, names : list[str]):
+        """Fill the model menu, selecting a model calls on_model_selected()
+
+        Args:
+            names (list[str]): the models names
+        """
+        self.menu_model.delete(0, "end")
+        for name in names:
+            self.menu_model.add_radiobutton(label=f'    {name} ', value=name, variable=self.menu_model_txt,
+                                            command=lambda name=name: self.on_model_selected(name))
+
+    def show_overlay(self, text : str):
+        """Show a text over the bottom left corner of the sketch, created on first use
+
+        Args:
+            text (str): the text to show
+        """
+        if self.overlay_id is None:
+            self.overlay_id = self.canvas.create_text(5, SKETCH_SIZE[1] - 5, anchor="sw", fill="#808080", font="{Courier} 7 {}")
+        self.canvas.itemconfig(self.overlay_id, text=text)
+        self.canvas.tag_raise(self.overlay_id)
+
     def run(self):
         self.mainwindow.mainloop()
 
@@ -187,9 +225,15 @@ class CGWindowBase:
     def on_stop(self):
         pass
 
+    def on_snapshot(self):
+        pass
+
     def on_exit(self):
         pass
 
+    def on_model_selected(self, name : str):
+        pass
+
 
 if __name__ == "__main__":
     raise Exception("This is a module, not a program. It should not be run directly.")
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Calibration of the modules in the background, with the convergence of their ratio
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import time
+import logging
+import threading
+import numpy as np
+
+import constants
+from .cg_snapshot import robust_mean, PHASE_WAITING, PHASE_MEASURING, PHASE_DONE, PHASE_CANCELLED, PHASE_FAILED
+
+SETTLE_TIME = 1.0           # s of samples dropped once the weight is on the module
+MIN_SAMPLES = 20            # samples averaged at least
+CONVERGENCE = 2e-4          # relative standard uncertainty of the mean, 0.1 g on 500 g
+MAX_DURATION = 30.0         # s, the mean is taken even if it has not converged by then
+DROPOUT_TIMEOUT = 2.0       # s without a valid sample, the module has dropped out
+SAMPLE_RETRY = 0.05         # s of wait after an invalid sample
+NO_LOAD_SIGMA = 5.0         # a mean within this number of standard deviations of 0 is no weight at all
+
+class CalibrationStatus:
+    """The state of the calibration of a module, updated at each sample"""
+    def __init__(self, module : str, index : int, count : int, known_weight : float):
+        """Constructor
+
+        Args:
+            module (str): the module name
+            index (int): the index of the module in the calibration sequence
+            count (int): the number of modules of the sequence
+            known_weight (float): the calibration weight in grams
+        """
+        self.module = module
+        self.index = index
+        self.count = count
+        self.known_weight = known_weight
+        self.phase = PHASE_WAITING
+        self.samples = 0
+        self.mean = None
+        self.std = None
+        self.uncertainty = None
+        self.converged = False
+        self.elapsed = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """The estimated ratio of the module, None before the first samples"""
+        return self.mean / self.known_weight if self.mean is not None else None
+
+    @property
+    def relative_uncertainty(self) -> float:
+        """The standard uncertainty of the mean relative to the mean, the convergence of the ratio"""
+        if self.mean is None or self.uncertainty is None or self.mean == 0 or np.isnan(self.uncertainty):
+            return None
+        return abs(self.uncertainty / self.mean)
+
+    @property
+    def progress(self) -> float:
+        """The progress of the module calibration from 0 to 1, as the convergence or the duration"""
+        if self.phase != PHASE_MEASURING:
+            return 1.0 if self.phase == PHASE_DONE else 0.0
+        timed = self.elapsed / MAX_DURATION
+        relative = self.relative_uncertainty
+        if relative is None or self.samples < MIN_SAMPLES:
+            return min(timed, 0.1)
+        # the uncertainty decreases as the square root of the samples
+        converging = min(1.0, (CONVERGENCE / relative) ** 2) if relative > 0 else 1.0
+        return max(timed, converging)
+
+    def __str__(self):
+        if self.mean is None:
+            return f'{self.module} ({self.index + 1}/{self.count}): {self.phase}'
+        relative = self.relative_uncertainty
+        convergence = f' ± {relative * 100:.3f}%' if relative is not None else ''
+        return (f'{self.module} ({self.index + 1}/{self.count}): {self.samples} samples, mean {self.mean:.1f}, '
+                f'std {self.std:.1f}, ratio {self.ratio:.3f}{convergence}')
+
+class Calibration:
+    """The calibration of modules one after the other, running in its own thread: for each module it waits for
+    resume(), once the weight is on the module, then reads its samples until their mean has converged and saves
+    the ratio. The status can be polled, e.g. by the UI, or followed with a progress callback"""
+    def __init__(self, meter, module_names : list[str], known_weight_grams : float, progress : callable = None,
+                 callback : callable = None):
+        """Constructor
+
+        Args:
+            meter (CGMeter): the initialized meter, which must not be reading
+            module_names (list[str]): the modules names, in the calibration order
+            known_weight_grams (float): the calibration weight in grams
+            progress (callable, optional): called with the CalibrationStatus of each sample. Defaults to None.
+            callback (callable, optional): called with the ratios by module name at the end, None if it failed. Defaults to None.
+
+        Raises:
+            ValueError: if the weight is not positive or a module is unknown
+        """
+        if known_weight_grams <= 0:
+            raise ValueError("The calibration weight must be greater than 0")
+        modules = {module.name: module for module in meter.modules}
+        for name in module_names:
+            if name not in modules:
+                raise ValueError(f'Unknown module {name}')
+
+        self.__logger = logging.getLogger(constants.APP_NAME)
+        self.__meter = meter
+        self.__modules = [modules[name] for name in module_names]
+        self.__known_weight = float(known_weight_grams)
+        self.__progress_callback = progress
+        self.__callback = callback
+        self.__resumed = threading.Event()
+        self.__cancelled = threading.Event()
+        self.__done = threading.Event()
+        self.__thread = None
+        self.__status = CalibrationStatus(module_names[0] if module_names else None, 0, len(module_names), self.__known_weight)
+        self.result = None
+        self.error = None
+
+    @property
+    def status(self) -> CalibrationStatus:
+        """The status of the module being calibrated"""
+        return self.__status
+
+    @property
+    def phase(self) -> str:
+        return self.__status.phase
+
+    @property
+    def running(self) -> bool:
+        return self.__thread is not None and not self.__done.is_set()
+
+    def start(self):
+        if self.__thread is not None:
+            raise Exception("Calibration already started")
+        self.__thread = threading.Thread(target=self.__run, name="CGCalibration", daemon=True)
+        self.__thread.start()
+
+    def resume(self):
+        """Tell the calibration weight is on the next module, can be called before the calibration waits for it"""
+        self.__resumed.set()
+
+    def cancel(self):
+        self.__cancelled.set()
+        self.__resumed.set()
+
+    def wait(self, timeout : float = None) -> dict[str, float]:
+        """Wait for the end of the calibration, must not be called from the callbacks
+
+        Returns:
+            dict[str, float]: the ratios by module name, None if the calibration failed or is cancelled
+        """
+        self.__done.wait(timeout)
+        return self.result
+
+    def __notify(self):
+        if self.__progress_callback is not None:
+            try:
+                self.__progress_callback(self.__status)
+            except Exception as e:
+                self.__logger.error("Error in calibration progress callback: %s", e)
+
+    def __measure(self, module, status : CalibrationStatus) -> float:
+        samples = []
+        start = time.monotonic()
+        status.phase = PHASE_MEASURING
+        self.__notify()
+        last_valid = start
+        while not self.__cancelled.is_set():
+            if not module.initialized:
+                raise Exception(f'{module.name} is not initialized')
+            sample = module.readRawSample()
+            now = time.monotonic()
+            status.elapsed = now - start
+            if sample is None:
+                if now - last_valid >= DROPOUT_TIMEOUT:
+                    raise Exception(f'No valid sample from {module.name} for {now - last_valid:.0f} s')
+                if status.elapsed >= MAX_DURATION:
+                    raise Exception(f'Only {len(samples)} valid samples from {module.name} in {MAX_DURATION:.0f} s')
+                # the HX711 gives no data, no busy loop meanwhile
+                self.__cancelled.wait(SAMPLE_RETRY)
+                continue
+            last_valid = now
+            if status.elapsed >= MAX_DURATION and len(samples) < MIN_SAMPLES:
+                raise Exception(f'Only {len(samples)} valid samples from {module.name} in {MAX_DURATION:.0f} s')
+            if status.elapsed < SETTLE_TIME:
+                continue
+
+            samples.append(sample)
+            status.mean, status.uncertainty, _, _ = robust_mean(samples)
+            status.std = float(np.std(samples, ddof=1)) if len(samples) > 1 else 0.0
+            status.samples = len(samples)
+            relative = status.relative_uncertainty
+            status.converged = len(samples) >= MIN_SAMPLES and relative is not None and relative <= CONVERGENCE
+            self.__notify()
+            if len(samples) >= MIN_SAMPLES and abs(status.mean) <= NO_LOAD_SIGMA * status.std:
+                raise Exception(f'No weight on {module.name}, the readings are around 0')
+            if status.converged or (status.elapsed >= MAX_DURATION and len(samples) >= MIN_SAMPLES):
+                break
+
+        if self.__cancelled.is_set():
+            return None
+        if not status.converged:
+            self.__logger.warning("Calibration of %s has not converged after %.0f s: %s", module.name, status.elapsed, status)
+        return status.mean
+
+    def __run(self):
+        ratios = {}
+        try:
+            for index, module in enumerate(self.__modules):
+                self.__status = CalibrationStatus(module.name, index, len(self.__modules), self.__known_weight)
+                self.__notify()
+                self.__resumed.wait()
+                self.__resumed.clear()
+                if self.__cancelled.is_set():
+                    break
+
+                reading = self.__measure(module, self.__status)
+                if reading is None:
+                    break
+                self.__meter.calibrate_module(module.name, self.__known_weight, reading)
+                ratios[module.name] = module.ratio
+                self.__logger.info("Calibration %s", self.__status)
+
+            if self.__cancelled.is_set():
+                self.__status.phase = PHASE_CANCELLED
+            else:
+                self.result = ratios
+                self.__status.phase = PHASE_DONE
+            self.__notify()
+
+        except Exception as e:
+            self.error = str(e)
+            self.__logger.error("Calibration failed: %s", e)
+            self.__status.phase = PHASE_FAILED
+            self.__notify()
+        finally:
+            self.__done.set()
+            if self.__callback is not None:
+                try:
+                    self.__callback(self.result)
+                except Exception as e:
+                    self.__logger.error("Error in calibration callback: %s", e)
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
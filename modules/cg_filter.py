@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Streaming decimation and FIR low-pass filters of the gauges samples
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import numpy as np
+
+DEFAULT_RATE = 10.0     # Hz, the HX711 output data rate with its RATE pin low
+DEFAULT_TAPS = 31       # length of the FIR low-pass
+
+def cic_kernel(decimation : int, order : int = 1) -> np.ndarray:
+    """The impulse response of a CIC decimator: `order` cascaded moving averages of `decimation` samples
+
+    Args:
+        decimation (int): the decimation factor, the length of each moving average
+        order (int, optional): the number of cascaded moving averages. Defaults to 1.
+
+    Returns:
+        np.ndarray: the normalized kernel, unity gain at DC
+    """
+    kernel = np.ones(1)
+    boxcar = np.ones(decimation) / decimation
+    for _ in range(order):
+        kernel = np.convolve(kernel, boxcar)
+    return kernel
+
+def lowpass_kernel(cutoff : float, rate : float, taps : int = DEFAULT_TAPS) -> np.ndarray:
+    """A windowed-sinc (Hamming) FIR low-pass
+
+    Args:
+        cutoff (float): the cutoff frequency in Hz
+        rate (float): the sample rate in Hz
+        taps (int, optional): the number of taps, made odd for a linear phase. Defaults to DEFAULT_TAPS.
+
+    Raises:
+        ValueError: if the cutoff is not below the Nyquist frequency
+
+    Returns:
+        np.ndarray: the normalized kernel, unity gain at DC
+    """
+    if not 0 < cutoff < rate / 2:
+        raise ValueError(f'The cutoff {cutoff} Hz must be between 0 and half the sample rate {rate} Hz')
+    taps = taps | 1
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff / rate * n) * np.hamming(taps)
+    return kernel / kernel.sum()
+
+class StreamingFir:
+    """A FIR filter followed by a decimation, processing blocks of any size as one continuous stream"""
+    def __init__(self, kernel : np.ndarray, decimation : int = 1):
+        """Constructor
+
+        Args:
+            kernel (np.ndarray): the impulse response
+            decimation (int, optional): one output every `decimation` inputs. Defaults to 1.
+        """
+        self.__kernel = np.asarray(kernel, dtype=float)
+        self.__decimation = max(1, int(decimation))
+        self.reset()
+
+    @property
+    def decimation(self) -> int:
+        return self.__decimation
+
+    @property
+    def delay(self) -> float:
+        """The group delay in input samples"""
+        return (len(self.__kernel) - 1) / 2
+
+    def reset(self):
+        """Forget the past samples, the next block starts as if the input had always been its first sample"""
+        self.__history = None
+        self.__phase = 0
+
+    def process(self, block : np.ndarray) -> np.ndarray:
+        """Filter a block of samples
+
+        Args:
+            block (np.ndarray): the samples following the previous block
+
+        Returns:
+            np.ndarray: the outputs produced by this block, possibly none
+        """
+        block = np.asarray(block, dtype=float)
+        if len(block) == 0:
+            return block
+        if self.__history is None:
+            # primed with the first sample, no ramp from 0 at start
+            self.__history = np.full(len(self.__kernel) - 1, block[0])
+
+        signal = np.concatenate((self.__history, block))
+        self.__history = signal[len(signal) - (len(self.__kernel) - 1):] if len(self.__kernel) > 1 else signal[:0]
+        # only the decimated outputs are computed
+        first = (-self.__phase) % self.__decimation
+        self.__phase = (self.__phase + len(block)) % self.__decimation
+        if first >= len(block):
+            return block[:0]
+        windows = np.lib.stride_tricks.sliding_window_view(signal, len(self.__kernel))[first::self.__decimation]
+        return windows @ self.__kernel[::-1]
+
+class FilterChain:
+    """The filters of a gauge: a CIC decimation then a FIR low-pass at the decimated rate"""
+    def __init__(self, rate : float = DEFAULT_RATE, decimation : int = 1, order : int = 1, cutoff : float = None,
+                 taps : int = DEFAULT_TAPS):
+        """Constructor
+
+        Args:
+            rate (float, optional): the HX711 sample rate in Hz. Defaults to DEFAULT_RATE.
+            decimation (int, optional): the decimation factor, 1 for none. Defaults to 1.
+            order (int, optional): the order of the CIC decimator. Defaults to 1, a moving average.
+            cutoff (float, optional): the cutoff in Hz of the FIR low-pass, None for no low-pass. Defaults to None.
+            taps (int, optional): the length of the FIR low-pass. Defaults to DEFAULT_TAPS.
+        """
+        self.__rate = rate
+        self.__stages = []
+        if decimation > 1:
+            self.__stages.append(StreamingFir(cic_kernel(decimation, order), decimation))
+        if cutoff is not None:
+            self.__stages.append(StreamingFir(lowpass_kernel(cutoff, rate / max(1, decimation), taps)))
+        self.__decimation = max(1, decimation)
+
+    @classmethod
+    def from_config(cls, config : dict, rate : float = None):
+        """Build a filter chain from the "filter" entry of a module in the config file
+
+        Args:
+            config (dict): {"rate": Hz, "decimation": n, "order": n, "cutoff": Hz, "taps": n}, all optional
+            rate (float, optional): the sample rate if the config has none. Defaults to None for DEFAULT_RATE.
+
+        Returns:
+            FilterChain: the filter chain
+        """
+        return cls(config.get("rate", rate or DEFAULT_RATE), config.get("decimation", 1), config.get("order", 1),
+                   config.get("cutoff"), config.get("taps", DEFAULT_TAPS))
+
+    @property
+    def decimation(self) -> int:
+        """Number of input samples for each output"""
+        return self.__decimation
+
+    @property
+    def output_rate(self) -> float:
+        return self.__rate / self.__decimation
+
+    @property
+    def latency(self) -> float:
+        """The group delay of the chain in seconds"""
+        delay = 0.0
+        rate = self.__rate
+        for stage in self.__stages:
+            delay += stage.delay / rate
+            rate /= stage.decimation
+        return delay
+
+    def reset(self):
+        for stage in self.__stages:
+            stage.reset()
+
+    def process(self, block : np.ndarray) -> np.ndarray:
+        """Filter a block of samples, see StreamingFir.process()"""
+        block = np.asarray(block, dtype=float)
+        for stage in self.__stages:
+            block = stage.process(block)
+        return block
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
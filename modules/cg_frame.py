@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## A CG meter reading: the weights of the gauges and the resulting CG
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import time
+
+class CGFrame:
+    """A reading of the CG meter"""
+    def __init__(self, weights : dict, plane = None, timestamp : float = None, station : str = None, positions : dict = None,
+                 faults : dict = None):
+        """Constructor, the CG is computed with the plane if any
+
+        Args:
+            weights (dict): the weights in grams by module name
+            plane (Plane, optional): the plane on the gauges. Defaults to None.
+            timestamp (float, optional): the reading time in seconds since epoch. Defaults to now.
+            station (str, optional): the name of the CG meter station. Defaults to None.
+            positions (dict, optional): the gauges positions in mm, None for the plane ones. Defaults to None.
+            faults (dict, optional): the health state of the faulty gauges by name, no CG is computed if any. Defaults to None.
+        """
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.station = station
+        self.weights = dict(weights)
+        self.total = sum(self.weights.values())
+        self.plane = plane.name if plane is not None else None
+        self.faults = dict(faults) if faults else {}
+        self.cg = None
+        if plane is not None and not self.faults:
+            try:
+                self.cg = plane.plane_cg_by_weigth(self.weights, positions)
+            except BaseException:
+                # no CG if the plane is not on the gauges
+                self.cg = None
+
+    def to_dict(self) -> dict:
+        return {
+            'time': self.timestamp,
+            'station': self.station,
+            'plane': self.plane,
+            'weights': self.weights,
+            'total': self.total,
+            'cg': list(self.cg) if self.cg is not None else None,
+            'faults': self.faults
+        }
+
+    def csv_header(self) -> list[str]:
+        return ['time', 'station', 'plane'] + list(self.weights.keys()) + ['total', 'cg_x', 'cg_y', 'faults']
+
+    def to_csv_row(self) -> list:
+        cg = self.cg if self.cg is not None else ('', '')
+        faults = ';'.join(f'{name}:{state}' for name, state in self.faults.items())
+        return [f'{self.timestamp:.3f}', self.station, self.plane] + [f'{w:.2f}' for w in self.weights.values()] + [f'{self.total:.2f}', cg[0], cg[1], faults]
+
+    def __str__(self):
+        faults = f', faults {self.faults}' if self.faults else ''
+        return f'CGFrame at {self.timestamp:.3f} for plane {self.plane}: weights {self.weights}, total {self.total:.1f} g, CG {self.cg}{faults}'
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
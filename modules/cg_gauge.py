@@ -35,8 +35,13 @@ SOFTWARE.
  # @ License: MIT
  # @ Description: A load cell module
  '''
+import time
 import logging
+import threading
 import constants
+from modules.cg_sampling import SampleMonitor
+from modules.cg_health import GaugeHealth, MAX_STEP
+from modules.cg_filter import FilterChain
 if not constants.EMULATE_HX711:
     from hx711 import HX711
 else:
@@ -56,6 +61,12 @@ class CGModule ():
         self.__last_value = 0.0
         self.__logger = logging.getLogger(constants.APP_NAME)
         self.__initialized = False
+        self.__sampling = SampleMonitor()
+        self.__health = GaugeHealth()
+        self.__offset = None
+        self.__filter = None
+        # held while the HX711 is read or replaced, a re-initialization must not mix with a read
+        self.__hx_lock = threading.Lock()
        
     def __set_values__(self, data : dict):
         try:
@@ -63,6 +74,15 @@ class CGModule ():
             self.__dout_pin = data["gpio"]["dt"]
             self.__pd_sck_pin = data["gpio"]["sck"]
             self.__position = data["position"]
+            # optional, the HX711 output data rate in Hz (10 or 80), estimated if not set
+            self.__sampling = SampleMonitor(data.get("rate"))
+            # optional, grams, a heavier step between two samples is implausible
+            self.__health = GaugeHealth(data.get("max_step", MAX_STEP))
+            # optional, the decimation and low-pass filters replacing the mean of the samples
+            self.__filter = FilterChain.from_config(data["filter"], data.get("rate")) if "filter" in data else None
+            if self.__filter is not None:
+                self.__logger.info("CGModule %s filtered to %.1f Hz, latency %.2f s", self.__name,
+                                   self.__filter.output_rate, self.__filter.latency)
 
         except Exception as e:
             self.__logger.error("Error setting CGModule(%s) values: " + str(e), self.__name)
@@ -101,6 +121,15 @@ class CGModule ():
     def initialized(self):
         return self.__initialized
 
+    @property
+    def offset(self) -> float:
+        """The tare offset of the HX711, None if not initialized"""
+        if not self.__initialized:
+            return None
+        # the emulator exposes get_offset(), the gpio driver get_current_offset()
+        getter = getattr(self.__hx, "get_current_offset", None) or getattr(self.__hx, "get_offset")
+        return getter()
+
     def loadConfig(self, config : str, module_cfg : dict):
         try:
             self.__name = config
@@ -117,23 +146,38 @@ class CGModule ():
         except Exception as e:
             self.__logger.error("Error saving CGModule(%s) config: %s", self.__name,  str(e))
 
-    def initialize(self) -> bool:
+    def initialize(self, offset : float = None) -> bool:
         """Initialize the module
 
+        Args:
+            offset (float, optional): the tare offset of an already zeroed module, None to zero it. Defaults to None.
+
         Returns:
             bool: true if initalization succeeded
         """
         result = False
         try:
             self.__logger.debug("Initializing CGModule :%s", self.__name)
-            self.__hx = HX711(dout_pin=self.__dout_pin, pd_sck_pin=self.__pd_sck_pin)
-            err = self.__hx.zero()
-            # check if successful
-            if err:
-                raise Exception('Tare is unsuccessful during initialization, please check GPIO pins.')
-
-            self.__hx.set_scale_ratio(self.__ratio)
-            self.__initialized = True
+            # the module is left out of the readings until the new HX711 is ready
+            with self.__hx_lock:
+                self.__initialized = False
+            hx = HX711(dout_pin=self.__dout_pin, pd_sck_pin=self.__pd_sck_pin)
+            if offset is not None:
+                hx.set_offset(offset)
+            else:
+                err = hx.zero()
+                # check if successful
+                if err:
+                    raise Exception('Tare is unsuccessful during initialization, please check GPIO pins.')
+
+            hx.set_scale_ratio(self.__ratio)
+            with self.__hx_lock:
+                self.__hx = hx
+                self.__health.reset()
+                if self.__filter is not None:
+                    self.__filter.reset()
+                self.__initialized = True
+            self.__offset = self.offset
             self.__logger.debug("CGModule :%s is OK", self.__name)
             result = True
         
@@ -142,6 +186,14 @@ class CGModule ():
         
         return result
 
+    def reinitialize(self) -> bool:
+        """Initialize the module again after a failure, keeping its tare if it had one: a plane may be on the gauges
+
+        Returns:
+            bool: true if initalization succeeded
+        """
+        return self.initialize(self.__offset)
+
     def tare(self) -> bool:
         """Tare the module
 
@@ -156,6 +208,9 @@ class CGModule ():
 
             self.__logger.debug("Taring CGModule :%s", self.__name)
             self.__hx.zero()
+            self.__offset = self.offset
+            # the filtered samples before the tare would bias the next weights
+            self.resetFilter()
             self.__logger.debug("Taring Done")
             result = True
         
@@ -164,24 +219,27 @@ class CGModule ():
 
         return result
 
-    def calibrate(self, known_weight_grams : float) :
+    def calibrate(self, known_weight_grams : float, reading : float = None) :
         """Calibrate the module
         
         Args:
             known_weight_grams (float): the known weight in grams of the calibration weight
+            reading (float, optional): the mean of the samples minus the tare offset with the calibration weight,
+                e.g. averaged from readRawSample(), None to read it now. Defaults to None.
         """
         try:
             if not self.__initialized:
                 raise Exception("not initialized")
 
             self.__logger.debug("Calibrating CGModule :%s", self.__name)
-            reading = self.__hx.get_raw_data_mean()
-            if reading:  # always check if you get correct value or only False
-                self.__logger.debug('Data subtracted by offset but still not converted to units:%d',reading)
-            else:
-                raise ValueError('Cannot get raw mean, invalid data')
-
-            reading = self.__hx.get_data_mean()
+            if reading is None:
+                reading = self.__hx.get_raw_data_mean()
+                if reading:  # always check if you get correct value or only False
+                    self.__logger.debug('Data subtracted by offset but still not converted to units:%d',reading)
+                else:
+                    raise ValueError('Cannot get raw mean, invalid data')
+
+                reading = self.__hx.get_data_mean()
             if reading:
                 self.__logger.debug('Mean value from HX711 subtracted by offset:%d', reading)
                 try:
@@ -197,7 +255,8 @@ class CGModule ():
                 # the ratio for current channel and gain.
                 self.__ratio = reading / value  # calculate the ratio for channel A and gain 128
                 self.__logger.debug('Calibration ratio for %s:%f', self.__name, self.__ratio)
-                self.__hx.set_scale_ratio(self.__ratio)  # set ratio for current channel
+                with self.__hx_lock:
+                    self.__hx.set_scale_ratio(self.__ratio)  # set ratio for current channel
             
             else:
                 raise ValueError('Cannot calculate mean value. Try debug mode. Variable reading:%s', str(reading))
@@ -208,6 +267,159 @@ class CGModule ():
             self.__logger.error("Error calibrating CGModule(%s): %s ", self.__name, str(e))
             raise e
 
+    def isReady(self) -> bool:
+        """Check if the HX711 has a new sample, so that reading it will not wait
+
+        Returns:
+            bool: true if a sample is ready, also true if the HX711 driver cannot tell
+        """
+        if not self.__initialized:
+            return False
+
+        # the emulator exposes is_ready(), the gpio driver _ready()
+        ready = getattr(self.__hx, "is_ready", None) or getattr(self.__hx, "_ready", None)
+        return ready() if ready is not None else True
+
+    def readSample(self) -> float:
+        """Read a single sample of the module
+
+        Returns:
+            float: the weight in grams, None if the sample is invalid
+        """
+        try:
+            if not self.__initialized:
+                raise Exception("not initialized")
+
+            with self.__hx_lock:
+                if not self.__initialized:
+                    return None
+                result = self.__hx.get_weight_mean(1)
+            timestamp = time.monotonic()
+            self.__sampling.record(timestamp)
+            if result is False:
+                # an invalid sample is a missing one for the health
+                self.__logger.debug('Sample from HX711 (module %s) return false', self.__name)
+                return None
+
+            self.__health.record(result, self.__lastRaw(), timestamp)
+            return result
+
+        except BaseException as e:
+            self.__logger.error("Error reading CGModule(%s) sample: %s", self.__name,  str(e))
+            return None
+
+    def readRawSample(self) -> float:
+        """Read a single sample of the module minus its tare offset, not converted to grams, to calibrate it
+
+        Returns:
+            float: the sample minus the tare offset, None if the sample is invalid
+        """
+        try:
+            if not self.__initialized:
+                raise Exception("not initialized")
+
+            with self.__hx_lock:
+                if not self.__initialized:
+                    return None
+                result = self.__hx.get_data_mean(1)
+            self.__sampling.record(time.monotonic())
+            if result is False:
+                self.__logger.debug('Raw sample from HX711 (module %s) return false', self.__name)
+                return None
+            return float(result)
+
+        except BaseException as e:
+            self.__logger.error("Error reading CGModule(%s) raw sample: %s", self.__name,  str(e))
+            return None
+
+    @property
+    def lastSampleTime(self) -> float:
+        """The time.monotonic() timestamp of the last sample read, None if none"""
+        return self.__sampling.last
+
+    def sampleTimestamps(self) -> list[float]:
+        """The time.monotonic() timestamps of the recent samples"""
+        return self.__sampling.timestamps()
+
+    def samplingStats(self) -> dict:
+        """The sampling rate, jitter and missed conversions of the module, see SampleMonitor.stats()"""
+        return self.__sampling.stats()
+
+    def pauseSampling(self):
+        """Tell that the samples are not read for a while on purpose, the next interval is not a missed conversion"""
+        self.__sampling.pause()
+        self.__health.waiting()
+
+    @property
+    def health(self) -> str:
+        """The health state of the module, see cg_health, cg_health.OK if the samples look right"""
+        return self.__health.state
+
+    def healthCounts(self) -> dict[str, int]:
+        """Number of times each health issue was detected"""
+        return self.__health.counts()
+
+    def checkHealth(self):
+        """Check that the samples keep coming, called while waiting for a sample"""
+        self.__health.check()
+
+    def __lastRaw(self) -> int:
+        # the raw value of the last sample, if the HX711 driver keeps it: get_last_raw_data() for the
+        # gpio driver, lastVal for the emulator
+        getter = getattr(self.__hx, "get_last_raw_data", None)
+        if getter is not None:
+            return getter()
+        return getattr(self.__hx, "lastVal", None)
+
+    @property
+    def filtered(self) -> bool:
+        """True if the samples go through a filter chain, they must then be read without gap"""
+        return self.__filter is not None
+
+    def resetFilter(self):
+        """Forget the samples kept by the filter chain, e.g. after a tare or a gap in the readings"""
+        with self.__hx_lock:
+            if self.__filter is not None:
+                self.__filter.reset()
+
+    def samplesPerReading(self, readings : int) -> int:
+        """Number of samples needed for a reading
+
+        Args:
+            readings (int): the samples averaged without filter chain
+
+        Returns:
+            int: readings, or the decimation of the filter chain
+        """
+        return self.__filter.decimation if self.__filter is not None else readings
+
+    def meanWeight(self, samples : list[float]) -> float:
+        """Average samples read with readSample(), trimming 20% of outliers on each side if there are enough samples.
+        With a filter chain, the samples are filtered as a block and the last output is the weight
+
+        Args:
+            samples (list[float]): the samples
+
+        Returns:
+            float: the mean weight in grams, the last mean if there is no sample
+        """
+        if len(samples) == 0:
+            return self.__last_value
+
+        if self.__filter is not None:
+            with self.__hx_lock:
+                output = self.__filter.process(samples)
+            if len(output) > 0:
+                self.__last_value = float(output[-1])
+            return self.__last_value
+
+        values = sorted(samples)
+        trim = int(len(values) * 0.2) if len(values) >= 5 else 0
+        if trim > 0:
+            values = values[trim:-trim]
+        self.__last_value = sum(values) / len(values)
+        return self.__last_value
+
     def getWeight(self, readings : int = 30) -> float:
         """Get the weight of the module
         
@@ -223,10 +435,13 @@ class CGModule ():
             
             result = self.__hx.get_weight_mean(readings)
             if result is False:
-                self.__logger.debug(f'Mean value from HX711 (module {self.__name}) return false')
-                
+                self.__logger.debug('Mean value from HX711 (module %s) return false', self.__name)
+                # the last value is returned, the health tells it is stale
+                self.__health.check()
+
             else:
                 self.__last_value = result
+                self.__health.record(result, self.__lastRaw())
 
         except BaseException as e:
             self.__logger.error("Error getting CGModule(%s) weight: %s", self.__name,  str(e))
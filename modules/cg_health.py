@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Health of the gauges: saturation, stuck value, missing samples and implausible steps
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import time
+import collections
+
+# health states, OK is the only good one
+OK = "ok"
+SATURATED = "saturated"     # the HX711 output is on a rail, the load is out of range or the wiring is wrong
+STUCK = "stuck"             # no variation at all over a window, a real load cell is never that quiet
+NO_DATA = "no data"         # the HX711 does not tell data ready anymore, disconnected or powered down
+JUMP = "jump"               # a step between two samples heavier than the plane could be
+OFFLINE = "offline"         # the module is not initialized
+
+RAIL_HIGH = 0x7FFFFF        # the HX711 24 bit output clamps to these values
+RAIL_LOW = -0x800000
+WINDOW = 20                 # samples checked for the rails and the stuck value
+NO_DATA_TIMEOUT = 0.5       # seconds without sample before the gauge is declared without data
+MAX_STEP = 5000.0           # grams, a heavier step between two samples is implausible
+JUMP_HOLD = 10              # samples the gauge stays in JUMP state after a step
+
+class GaugeHealth:
+    """Check the samples of a gauge as they are read
+
+    record() is called with every sample and check() while waiting for one, state is then
+    the worst current issue, OK if none.
+    """
+    def __init__(self, max_step : float = MAX_STEP):
+        """Constructor
+
+        Args:
+            max_step (float, optional): grams, a heavier step between two samples is implausible. Defaults to MAX_STEP.
+        """
+        self.__max_step = max_step
+        self.reset()
+
+    def reset(self):
+        """Forget the samples, after a re-initialization"""
+        self.__raws = collections.deque(maxlen=WINDOW)
+        self.__weights = collections.deque(maxlen=WINDOW)
+        # no sample yet, the gauge is waited for since the reset
+        self.__last_time = time.monotonic()
+        self.__jump_hold = 0
+        self.__no_data = False
+        self.__counts = {SATURATED: 0, STUCK: 0, NO_DATA: 0, JUMP: 0}
+
+    @property
+    def state(self) -> str:
+        """The worst current issue, OK if none"""
+        if self.__no_data:
+            return NO_DATA
+        if len(self.__raws) > 0 and (self.__raws[-1] >= RAIL_HIGH or self.__raws[-1] <= RAIL_LOW):
+            return SATURATED
+        if len(self.__weights) == WINDOW and min(self.__weights) == max(self.__weights):
+            return STUCK
+        if self.__jump_hold > 0:
+            return JUMP
+        return OK
+
+    @property
+    def healthy(self) -> bool:
+        return self.state == OK
+
+    def counts(self) -> dict[str, int]:
+        """Number of times each issue was detected"""
+        return dict(self.__counts)
+
+    def record(self, weight : float, raw : int = None, timestamp : float = None):
+        """Check a sample
+
+        Args:
+            weight (float): the weight in grams, None if the HX711 returned no valid sample
+            raw (int, optional): the raw HX711 value if the driver tells it. Defaults to None.
+            timestamp (float, optional): time.monotonic() time of the sample. Defaults to now.
+        """
+        self.__last_time = time.monotonic() if timestamp is None else timestamp
+        self.__no_data = False
+        if raw is not None:
+            self.__raws.append(raw)
+            if raw >= RAIL_HIGH or raw <= RAIL_LOW:
+                self.__counts[SATURATED] += 1
+
+        if weight is None:
+            return
+
+        if len(self.__weights) > 0 and abs(weight - self.__weights[-1]) > self.__max_step:
+            self.__counts[JUMP] += 1
+            self.__jump_hold = JUMP_HOLD
+        elif self.__jump_hold > 0:
+            self.__jump_hold -= 1
+
+        self.__weights.append(weight)
+        if len(self.__weights) == WINDOW and min(self.__weights) == max(self.__weights):
+            self.__counts[STUCK] += 1
+
+    def check(self, now : float = None):
+        """Check that samples keep coming, called while waiting for one
+
+        Args:
+            now (float, optional): time.monotonic() time. Defaults to now.
+        """
+        if self.__no_data:
+            return
+        now = time.monotonic() if now is None else now
+        if now - self.__last_time > NO_DATA_TIMEOUT:
+            self.__no_data = True
+            self.__counts[NO_DATA] += 1
+
+    def waiting(self, now : float = None):
+        """Start waiting for samples, when the reading starts or after a pause
+
+        Args:
+            now (float, optional): time.monotonic() time. Defaults to now.
+        """
+        self.__last_time = time.monotonic() if now is None else now
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -29,32 +29,71 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
-import json
 import logging
 import constants
 import threading
-import time
 from . import cg_gauge
+from . import cg_health
+from .cg_scheduler import AcquisitionScheduler, AcquisitionJob
+from .cg_process import AcquisitionProcess
+from .cg_supervisor import ModuleSupervisor
+from .cg_snapshot import Snapshot, DEFAULT_DURATION, STABLE_TOLERANCE
+from .cg_calibration import Calibration
+from utils.configstore import ConfigStore
+from utils.planemanager import PlaneManager
 
-class Singleton:
-    _instance = None
+DEFAULT_READINGS = 6    # samples averaged by each module for a reading
+DEFAULT_PERIOD = 0.1    # minimum time in seconds between two readings
 
-    def  __new__(cls):
-        if not cls._instance:
-            cls._instance = super(Singleton, cls).__new__(cls)
-        return cls._instance
+class NamedSingleton:
+    """One instance by name, calling the class without name always returns the default instance"""
+    _instances = None
 
-class CGMeter(Singleton) :
+    def  __new__(cls, name : str = constants.DEFAULT_STATION):
+        if cls._instances is None:
+            cls._instances = {}
+        if name not in cls._instances:
+            instance = super(NamedSingleton, cls).__new__(cls)
+            instance._name = name
+            instance._setup()
+            cls._instances[name] = instance
+        return cls._instances[name]
+
+    @classmethod
+    def names(cls) -> list[str]:
+        """The names of the instances created so far"""
+        return list(cls._instances.keys()) if cls._instances is not None else []
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def _setup(self):
+        """Called once when the instance is created, to be overridden"""
+        pass
+
+class CGMeter(NamedSingleton) :
+    """A CG meter station: its gauges, its current plane and its readings.
+    CGMeter() is the default station, CGMeter('name') creates or gets another one
+    """
     _initialize = False
 
+    def _setup(self):
+        self.__listeners = []
+        self.__modules = []
+        self.__job = None
+        self.__process = None
+        self.__supervisor = None
+        self.__lock = threading.Lock()
+
     def __load_from_file(self):
         self.__logger.debug("Loading CGMeter config from file: %s", self.__configfile)
 
         try:
-            with open(self.__configfile, "r") as f:
-                data = json.load(f)
-                self.__load_from_dict(data["Modules"])
-                self.__calibration_weight = data["CalibrationWeight"]
+            self.__store = ConfigStore.open(self.__configfile, journal=True)
+            data = self.__store.get()
+            self.__load_from_dict(data["Modules"])
+            self.__calibration_weight = data["CalibrationWeight"]
         except Exception as e:
             self.__logger.error("Error loading CGMeter config: " + str(e))
             raise e
@@ -70,56 +109,66 @@ class CGMeter(Singleton) :
         except Exception as e:
             self.__logger.error("Error loading CGMeter config: " + str(e))
 
-    def __read_modules(self, callback : callable):
-        self.__logger.debug("CGMeter reading thread started")
-        while self.__running:
+    def __dispatch(self, callback : callable, values : dict):
+        callback(values)
+        if values is not None:
+            self.__notify_listeners(values)
 
-            values = {}
-            for module in self.__modules:
-                if module.initialized:
-                    values[module.name] = module.getWeight(6)
-                    if values[module.name] is False:
-                        print("Error reading module: " + module.name)
-            
-            callback(values)
-            time.sleep(0.1)
+    def __notify_listeners(self, values : dict):
+        for listener in list(self.__listeners):
+            try:
+                listener(values)
+            except Exception as e:
+                self.__logger.error("Error in CGMeter listener %s: %s", listener, str(e))
         
-        callback(None)
-        self.__logger.debug("CGMeter reading thread stopped")
-        
-    def initialize(self,configfile : str, whichone : str = 'all'):
+    def initialize(self,configfile : str, whichone : str = 'all', offsets : dict = None, supervise : bool = True):
+        """Load the config file and initialize the modules
+
+        Args:
+            configfile (str): the config file of the station
+            whichone (str, optional): the module to initialize, 'all' for every module. Defaults to 'all'.
+            offsets (dict, optional): the tare offset by module name of modules already zeroed, e.g. by another process. Defaults to None.
+            supervise (bool, optional): True to re-initialize the failed or unhealthy modules in the background. Defaults to True.
+        """
         if self._initialize:
             raise Exception("CGMeter already initialized")
 
         self.__logger = logging.getLogger(constants.APP_NAME)
-        self.__running = False
         self._initialize = True
 
         try:
             self.__configfile = configfile
             self.__load_from_file()
 
-            if whichone == 'all':
-                for module in self.__modules:
-                    module.initialize()
-            else:
-                for module in self.__modules:
-                    if module.name == whichone:
-                        module.initialize()
-                        break
+            offsets = offsets if offsets is not None else {}
+            selected = [module for module in self.__modules if whichone == 'all' or module.name == whichone]
+            for module in selected:
+                module.initialize(offsets.get(module.name))
+
+            if supervise:
+                # the modules read by a child process are supervised there, the others are left alone
+                self.__supervisor = ModuleSupervisor(self.name, selected, lambda: not self.__process_owns_modules())
+                self.__supervisor.start()
         except Exception as e:
             self.__logger.error("Error initializing CGMeter: " + str(e))
 
-    def calibrate_module(self, module_name : str, known_weight_grams : float):
+    def calibrate_module(self, module_name : str, known_weight_grams : float, reading : float = None):
+        """Calibrate a module and save its ratio in the config file
+
+        Args:
+            module_name (str): the module name
+            known_weight_grams (float): the calibration weight in grams on the module
+            reading (float, optional): the mean raw reading with the weight, see CGModule.calibrate(). Defaults to None.
+        """
         try:
+            self.__check_modules_free("calibrating")
             for module in self.__modules:
                 if module.name == module_name:
-                    module.calibrate(known_weight_grams)
-                    with open(self.__configfile, "r") as json_file:
-                        data = json.load(json_file)
-                    module.saveConfig(data["Modules"][module.name])
-                    with open(self.__configfile, "w") as json_file:
-                        json.dump(data, json_file, indent=4)
+                    module.calibrate(known_weight_grams, reading)
+                    # only the module entry is changed, the store coalesces the writes
+                    module_cfg = self.__store.get("Modules", module.name)
+                    module.saveConfig(module_cfg)
+                    self.__store.set(("Modules", module.name), module_cfg)
                     break
         except Exception as e:
             self.__logger.error("Error calibrating CGMeter module(%s):%s",module_name, str(e))
@@ -127,6 +176,7 @@ class CGMeter(Singleton) :
         
     def tare(self, whichone : str = 'all'):
         try:
+            self.__check_modules_free("taring")
             if whichone == 'all':
                 for module in self.__modules:
                     module.tare()
@@ -138,7 +188,60 @@ class CGMeter(Singleton) :
         except Exception as e:
             self.__logger.error("Error taring CGMeter: " + str(e))
 
-    def start_reading(self, callback : callable):
+    @property
+    def plane_manager(self) -> PlaneManager:
+        """The planes of this station, with its own current plane"""
+        return PlaneManager(self.name)
+
+    @property
+    def modules(self) -> list:
+        return list(self.__modules)
+
+    def gauge_positions(self) -> dict[str, tuple[float,float]]:
+        """The gauges positions configured in the config file, for rigs where the gauges are at fixed places
+
+        Returns:
+            dict[str, tuple[float,float]]: the (x,y) position in mm by module name, None if the positions are
+            not configured (all the same, as the default [0, 0]) so that the plane geometry is used
+        """
+        positions = {module.name: tuple(module.position) for module in self.__modules}
+        if len(set(positions.values())) <= 1:
+            return None
+        return positions
+
+    @property
+    def reading(self) -> bool:
+        return self.__job is not None
+
+    def __process_owns_modules(self) -> bool:
+        # the child process reads the HX711 until it is stopped, even after stop_reading() returned
+        process = self.__process
+        return process is not None and not process.stopped.is_set()
+
+    def __check_modules_free(self, action : str):
+        # two processes clocking the same HX711 would corrupt the samples of both
+        if self.__process_owns_modules():
+            raise Exception(f'CGMeter {self.name} modules are read by its acquisition process, stop it before {action}')
+
+    @property
+    def frame_ring(self):
+        """The shared memory ring buffer of the frames when reading in a child process, else None"""
+        job = self.__job
+        return job.ring if isinstance(job, AcquisitionProcess) else None
+
+    def start_reading(self, callback : callable, readings : int = DEFAULT_READINGS, period : float = DEFAULT_PERIOD,
+                      process : bool = False):
+        """Start reading, the callback is called with the weights of the initialized modules
+        at each reading and with None when the reading stops.
+        The modules are read by the acquisition scheduler thread shared by all the stations,
+        or by a dedicated child process
+
+        Args:
+            callback (callable): the function called with the weights dictionary
+            readings (int, optional): number of samples averaged by each module. Defaults to DEFAULT_READINGS.
+            period (float, optional): minimum time in seconds between two readings, 0 for full rate. Defaults to DEFAULT_PERIOD.
+            process (bool, optional): True to read in a child process, see cg_process.AcquisitionProcess. Defaults to False.
+        """
         #check at least if one module is initialized, otherwise raise exception
         initok = False
         for module in self.__modules:
@@ -149,19 +252,152 @@ class CGMeter(Singleton) :
         if not initok:
             raise Exception("No module initialized")
 
-        try:
-            self.__running = True
-            self.__thread = threading.Thread(name='CGMeterThread',target=self.__read_modules, args=(callback,))
-            self.__thread.start()
-        except Exception as e:
-            self.__logger.error("Error starting thread CGMeter: " + str(e))
+        # the filters must not mix the samples of the previous reading with the new ones
+        for module in self.__modules:
+            module.resetFilter()
 
-    def stop_reading(self):
-        if self.__running:
-            self.__running = False
-            #self.__thread.join()
+        with self.__lock:
+            if self.__job is not None:
+                raise Exception(f'CGMeter {self.name} is already reading')
+            self.__check_modules_free("reading")
+            if process:
+                self.__job = AcquisitionProcess(self.name, self.__configfile, self.__modules, readings, period,
+                                                lambda values: self.__dispatch(callback, values))
+                self.__process = self.__job
+            else:
+                self.__job = AcquisitionJob(self.name, self.__modules, readings, period,
+                                            lambda values: self.__dispatch(callback, values))
+        if process:
+            try:
+                self.__job.start()
+            except Exception:
+                with self.__lock:
+                    self.__job = None
+                    self.__process = None
+                raise
+        else:
+            AcquisitionScheduler().add_job(self.__job)
+
+    def stop_reading(self, wait : bool = False):
+        """Stop reading
+
+        Args:
+            wait (bool, optional): True to wait for the end of the reading, must not be used from the callback. Defaults to False.
+        """
+        with self.__lock:
+            job = self.__job
+            self.__job = None
+            process = self.__process
+        if isinstance(job, AcquisitionProcess):
+            job.stop(wait)
+        elif job is None and wait and process is not None:
+            # stopped before without waiting, the child process may still own the modules
+            process.stop(wait)
+        elif job is not None:
+            AcquisitionScheduler().remove_job(job, wait)
+            for name, stats in self.sampling_stats().items():
+                self.__logger.info("Sampling %s: %d samples at %.1f Hz, jitter %.2f ms, max interval %.1f ms, %d missed (%.1f%%)",
+                                   name, stats['samples'], stats['rate_hz'], stats['jitter_ms'], stats['interval_max_ms'],
+                                   stats['missed'], stats['missed_ratio'] * 100.0)
+
+    def shutdown(self, wait : bool = True):
+        """Stop the modules supervisor and the reading, before releasing the GPIO
+
+        Args:
+            wait (bool, optional): True to wait for the end of the reading, must not be used from the callback. Defaults to True.
+        """
+        supervisor = self.__supervisor
+        self.__supervisor = None
+        if supervisor is not None:
+            supervisor.stop()
+        self.stop_reading(wait)
+
+    @classmethod
+    def shutdown_all(cls):
+        """Shut down every station created so far, see shutdown()"""
+        for name in cls.names():
+            cls(name).shutdown()
+
+    def snapshot(self, callback : callable = None, duration : float = DEFAULT_DURATION, tolerance : float = STABLE_TOLERANCE,
+                 progress : callable = None) -> Snapshot:
+        """Start a high precision measurement in the background: wait for stable weights, average all the gauges
+        during a long window without their outliers and compute the CG with its uncertainty.
+        If the meter is not reading, it is read for the snapshot only
+
+        Args:
+            callback (callable, optional): called with the SnapshotResult at the end, None if it failed. Defaults to None.
+            duration (float, optional): the measurement window in seconds. Defaults to DEFAULT_DURATION.
+            tolerance (float, optional): the largest drift in grams of stable weights. Defaults to STABLE_TOLERANCE.
+            progress (callable, optional): called with the phase and its progress from 0 to 1. Defaults to None.
+
+        Returns:
+            Snapshot: the running snapshot, to poll its progress, cancel it or wait for its result
+        """
+        snapshot = Snapshot(self, duration, tolerance, progress=progress, callback=callback)
+        snapshot.start()
+        return snapshot
+
+    def calibrate_modules(self, module_names : list[str], known_weight_grams : float, callback : callable = None,
+                          progress : callable = None) -> Calibration:
+        """Start calibrating modules one after the other in the background, with the same calibration weight.
+        Before each module, the calibration waits for Calibration.resume(), once the weight is on the module
+
+        Args:
+            module_names (list[str]): the modules names, in the calibration order
+            known_weight_grams (float): the calibration weight in grams
+            callback (callable, optional): called with the ratios by module name at the end, None if it failed. Defaults to None.
+            progress (callable, optional): called with the CalibrationStatus of each sample. Defaults to None.
+
+        Returns:
+            Calibration: the running calibration, to poll its status, resume, cancel or wait for it
+        """
+        if self.reading:
+            raise Exception(f'CGMeter {self.name} is reading, stop it before calibrating')
+        self.__check_modules_free("calibrating")
+        calibration = Calibration(self, module_names, known_weight_grams, progress=progress, callback=callback)
+        calibration.start()
+        return calibration
+
+    def add_listener(self, listener : callable):
+        """Add a function called with the weights of each reading, after the reading callback.
+        Listeners are called from the reading thread and must not block it
+
+        Args:
+            listener (callable): the function called with the weights dictionary
+        """
+        if listener not in self.__listeners:
+            self.__listeners.append(listener)
+
+    def remove_listener(self, listener : callable):
+        if listener in self.__listeners:
+            self.__listeners.remove(listener)
+
+    def gauge_health(self) -> dict[str, str]:
+        """The health state of each module by name, see cg_health, OFFLINE while a module is not initialized.
+        When reading in a child process, the states are the ones checked there"""
+        job = self.__job
+        if isinstance(job, AcquisitionProcess):
+            health = job.health
+            return {module.name: health.get(module.name, cg_health.OFFLINE) for module in self.__modules}
+        return {module.name: module.health if module.initialized else cg_health.OFFLINE for module in self.__modules}
+
+    def supervisor_status(self) -> dict[str, dict]:
+        """The re-initialization attempts of each module by name, see cg_supervisor.ModuleSupervisor.status()"""
+        return self.__supervisor.status() if self.__supervisor is not None else {}
+
+    def faults(self) -> dict[str, str]:
+        """The health state of the modules which are not OK, empty if all the gauges look right"""
+        return {name: state for name, state in self.gauge_health().items() if state != cg_health.OK}
+
+    def sampling_stats(self) -> dict[str, dict]:
+        """The sampling rate, jitter and missed conversions of each initialized module by name,
+        see cg_sampling.SampleMonitor.stats(). Empty for the modules read in a child process"""
+        return {module.name: module.samplingStats() for module in self.__modules if module.initialized}
+
+    def calibration_ratios(self) -> dict[str, float]:
+        """The calibration ratio of each module by name"""
+        return {module.name: module.ratio for module in self.__modules}
 
-    
     def calibration_weight(self):
         return self.__calibration_weight
 
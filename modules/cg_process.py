@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Acquisition in a child process, the frames are shared through a shared memory ring buffer
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import math
+import time
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import constants
+from . import cg_health
+
+RING_CAPACITY = 1024    # frames kept in the ring buffer
+POLL_PERIOD = 0.005     # seconds between two checks of the ring buffer by the reader thread
+HEADER_SIZE = 4         # int64: frames count, gauges count, capacity, reserved
+# the health states of the gauges by their code in the frames
+HEALTH_STATES = (cg_health.OK, cg_health.SATURATED, cg_health.STUCK, cg_health.NO_DATA, cg_health.JUMP, cg_health.OFFLINE)
+HEALTH_CODES = {state: code for code, state in enumerate(HEALTH_STATES)}
+
+class FrameRing:
+    """Frames of weights in a shared memory ring buffer, written by one process and read by any number
+
+    Each slot is float64: [sequence, timestamp, weight of each gauge, health code of each gauge], see
+    HEALTH_STATES for the codes. The writer marks a slot as being
+    written (sequence -1) before filling it and sets its sequence last, so that a reader can tell a
+    frame overwritten while copying it. Consumers can map the ring by its name and read the slots
+    in place with view(), without any copy.
+    """
+    def __init__(self, gauges : int = None, capacity : int = RING_CAPACITY, name : str = None):
+        """Constructor, creates a new ring buffer or attaches to an existing one
+
+        Args:
+            gauges (int, optional): number of weights by frame, only to create the ring. Defaults to None.
+            capacity (int, optional): number of frames, only to create the ring. Defaults to RING_CAPACITY.
+            name (str, optional): the shared memory name of an existing ring. Defaults to None to create a new one.
+        """
+        if name is None:
+            if gauges is None or gauges < 1:
+                raise ValueError('The number of gauges is needed to create a frame ring')
+            size = (HEADER_SIZE + capacity * (2 + 2 * gauges)) * 8
+            self.__shm = shared_memory.SharedMemory(create=True, size=size)
+            self.__owner = True
+            self.__header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=self.__shm.buf)
+            self.__header[:] = (0, gauges, capacity, 0)
+        else:
+            self.__shm = shared_memory.SharedMemory(name=name)
+            self.__owner = False
+            self.__header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=self.__shm.buf)
+
+        gauges, capacity = int(self.__header[1]), int(self.__header[2])
+        self.__slots = np.ndarray((capacity, 2 + 2 * gauges), dtype=np.float64, buffer=self.__shm.buf, offset=HEADER_SIZE * 8)
+
+    @property
+    def name(self) -> str:
+        return self.__shm.name
+
+    @property
+    def gauges(self) -> int:
+        return (self.__slots.shape[1] - 2) // 2
+
+    @property
+    def capacity(self) -> int:
+        return self.__slots.shape[0]
+
+    @property
+    def count(self) -> int:
+        """Number of frames written since the ring was created"""
+        return int(self.__header[0])
+
+    def view(self) -> np.ndarray:
+        """The slots in place, (capacity, 2 + 2 * gauges): sequence, timestamp, weights and health codes"""
+        return self.__slots
+
+    def write(self, timestamp : float, weights, health = None):
+        """Write a frame, by the single writer
+
+        Args:
+            timestamp (float): the time of the frame, time.monotonic() is shared by the processes
+            weights: the weights in the order of the gauges
+            health (optional): the health codes in the order of the gauges, see HEALTH_STATES. Defaults to None for all OK.
+        """
+        number = self.count
+        gauges = self.gauges
+        slot = self.__slots[number % self.capacity]
+        slot[0] = -1
+        slot[1] = timestamp
+        slot[2:2 + gauges] = weights
+        slot[2 + gauges:] = health if health is not None else HEALTH_CODES[cg_health.OK]
+        slot[0] = number + 1
+        self.__header[0] = number + 1
+
+    def frame(self, number : int) -> tuple[float, np.ndarray, np.ndarray]:
+        """Get a copy of a frame
+
+        Args:
+            number (int): the frame number, from 0 to count - 1
+
+        Returns:
+            tuple[float, np.ndarray, np.ndarray]: the timestamp, the weights and the health codes, None if the frame is overwritten
+        """
+        slot = self.__slots[number % self.capacity]
+        if slot[0] != number + 1:
+            return None
+        gauges = self.gauges
+        timestamp, weights, health = float(slot[1]), slot[2:2 + gauges].copy(), slot[2 + gauges:].astype(int)
+        if slot[0] != number + 1:
+            return None
+        return timestamp, weights, health
+
+    def read_since(self, number : int) -> tuple[int, list[tuple[float, np.ndarray]]]:
+        """Get the frames written since a frame number, at most the ring capacity
+
+        Args:
+            number (int): the number of the first frame to read, the count of a previous call
+
+        Returns:
+            tuple[int, list]: the count to use for the next call and the (timestamp, weights, health) frames
+        """
+        count = self.count
+        frames = []
+        for index in range(max(number, count - self.capacity), count):
+            frame = self.frame(index)
+            if frame is not None:
+                frames.append(frame)
+        return count, frames
+
+    def close(self):
+        """Unmap the ring, the creator also frees it"""
+        self.__header = None
+        self.__slots = None
+        self.__shm.close()
+        if self.__owner:
+            self.__shm.unlink()
+
+def _acquisition_main(station : str, configfile : str, names : list[str], offsets : dict, ring_name : str,
+                      readings : int, period : float, stop_event):
+    """Entry point of the acquisition process: read the station gauges and write the frames to the ring"""
+    if not constants.EMULATE_HX711:
+        import RPi.GPIO as GPIO
+        GPIO.setmode(GPIO.BCM)
+    from modules.cg_meter import CGMeter
+
+    ring = FrameRing(name=ring_name)
+    meter = CGMeter(station)
+    # the gauges are already zeroed by the main process, only their offsets are set
+    meter.initialize(configfile, offsets=offsets)
+
+    def on_readings(weights):
+        if weights is not None:
+            # the health is read here, the main process has no sample to check
+            health = meter.gauge_health()
+            ring.write(time.monotonic(), [weights.get(name, math.nan) for name in names],
+                       [HEALTH_CODES[health.get(name, cg_health.OFFLINE) if name in weights else cg_health.OFFLINE]
+                        for name in names])
+
+    meter.start_reading(on_readings, readings, period)
+    stop_event.wait()
+    meter.shutdown()
+    ring.close()
+
+class AcquisitionProcess:
+    """The reading of the modules of one CG meter in a child process
+
+    The child process has its own interpreter, its sampling does not compete with the UI for the GIL.
+    A thread of the main process reads the ring buffer and dispatches the frames as AcquisitionJob does.
+    """
+    def __init__(self, name : str, configfile : str, modules : list, readings : int, period : float, dispatch : callable,
+                 capacity : int = RING_CAPACITY):
+        """Constructor
+
+        Args:
+            name (str): the CG meter station name
+            configfile (str): the config file of the station
+            modules (list[CGModule]): the modules to read, initialized by the main process
+            readings (int): number of samples averaged for a reading
+            period (float): minimum time in seconds between two readings
+            dispatch (callable): the function called with the weights of each reading and with None when the reading ends
+            capacity (int, optional): number of frames of the ring buffer. Defaults to RING_CAPACITY.
+        """
+        self.name = name
+        self.__logger = logging.getLogger(constants.APP_NAME)
+        self.__configfile = configfile
+        self.__modules = [module for module in modules if module.initialized]
+        self.__names = [module.name for module in self.__modules]
+        self.__readings = readings
+        self.__period = period
+        self.__capacity = capacity
+        self.__dispatch = dispatch
+        self.__ring = None
+        self.__process = None
+        self.__thread = None
+        self.__stop_event = None
+        self.__health = {name: cg_health.OK for name in self.__names}
+        self.stopped = threading.Event()
+
+    @property
+    def ring(self) -> FrameRing:
+        """The ring buffer of the frames, its name can be given to other processes"""
+        return self.__ring
+
+    @property
+    def health(self) -> dict[str, str]:
+        """The health state of each gauge by name in the last frame, checked by the child process"""
+        return dict(self.__health)
+
+    @property
+    def names(self) -> list[str]:
+        """The gauges names, in the order of the weights of the frames"""
+        return list(self.__names)
+
+    def start(self):
+        if len(self.__names) == 0:
+            raise Exception("No module initialized")
+
+        # spawn, a fork would copy the Tk and GPIO state of the main process
+        context = multiprocessing.get_context('spawn')
+        offsets = {module.name: module.offset for module in self.__modules}
+        self.__ring = FrameRing(len(self.__names), self.__capacity)
+        self.__stop_event = context.Event()
+        self.__process = context.Process(name=f'CGAcquisition-{self.name}', target=_acquisition_main, daemon=True,
+                                         args=(self.name, self.__configfile, self.__names, offsets, self.__ring.name,
+                                               self.__readings, self.__period, self.__stop_event))
+        self.__process.start()
+        self.__thread = threading.Thread(name=f'CGRingReader-{self.name}', target=self.__read, daemon=True)
+        self.__thread.start()
+        self.__logger.debug("Acquisition process of %s started, pid %d", self.name, self.__process.pid)
+
+    def stop(self, wait : bool = False):
+        """Stop the acquisition process, the dispatch function is then called with None
+
+        Args:
+            wait (bool, optional): True to wait for the end of the reading, must not be used from the dispatch function. Defaults to False.
+        """
+        if self.__stop_event is not None:
+            self.__stop_event.set()
+        if wait and self.__thread is not None and threading.current_thread() is not self.__thread:
+            self.stopped.wait()
+
+    ''' Private methods run in the reader thread'''
+    def __read(self):
+        count = 0
+        while not self.__stop_event.is_set():
+            count, received = self.__drain(count)
+            if received == 0:
+                if not self.__process.is_alive():
+                    self.__logger.error("Acquisition process of %s ended, exit code %s", self.name, self.__process.exitcode)
+                    break
+                time.sleep(POLL_PERIOD)
+
+        self.__process.join(timeout=5)
+        if self.__process.is_alive():
+            self.__process.terminate()
+        # the frames written by the child since the last poll
+        self.__drain(count)
+        self.__ring.close()
+        self.__dispatch_values(None)
+        self.stopped.set()
+        self.__logger.debug("Acquisition process of %s stopped", self.name)
+
+    def __drain(self, count : int) -> tuple[int, int]:
+        # dispatch the frames written since count, returns the next count and the number of frames
+        count, frames = self.__ring.read_since(count)
+        for _, weights, health in frames:
+            # set before the dispatch, the listeners ask for the faults of the frame
+            self.__health = {name: HEALTH_STATES[code] for name, code in zip(self.__names, health.tolist())}
+            # the gauges offline in the child are left out, as the scheduler does
+            self.__dispatch_values({name: weight for name, weight in zip(self.__names, weights.tolist())
+                                    if not math.isnan(weight)})
+        return count, len(frames)
+
+    def __dispatch_values(self, values):
+        try:
+            self.__dispatch(values)
+        except Exception as e:
+            self.__logger.error("Error dispatching acquisition process %s: %s", self.name, str(e))
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Timestamps of the HX711 samples, their jitter and the missed conversions
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import math
+import collections
+
+TIMESTAMPS_SIZE = 256   # recent sample timestamps kept by gauge
+MAX_GAP = 1.0           # seconds, a longer interval is a pause of the reading, not missed samples
+
+class SampleMonitor:
+    """Track the intervals between the samples of a gauge
+
+    The HX711 converts continuously at a fixed rate (10 or 80 Hz), a conversion not clocked
+    out before the next one is lost. An interval of n sample periods means n - 1 missed
+    conversions. Without configured rate, the period is the shortest interval seen.
+    """
+    def __init__(self, rate : float = None):
+        """Constructor
+
+        Args:
+            rate (float, optional): the HX711 output data rate in Hz, None to estimate it. Defaults to None.
+        """
+        self.__rate = rate
+        self.__timestamps = collections.deque(maxlen=TIMESTAMPS_SIZE)
+        self.reset()
+
+    def reset(self):
+        """Forget the statistics"""
+        self.__last = None
+        self.__paused = False
+        self.__samples = 0
+        self.__intervals = 0
+        self.__mean = 0.0
+        self.__m2 = 0.0
+        self.__min = math.inf
+        self.__max = 0.0
+        self.__missed = 0
+        self.__timestamps.clear()
+
+    def pause(self):
+        """The samples are not read for a while on purpose, the next interval is not counted"""
+        self.__paused = True
+
+    @property
+    def period(self) -> float:
+        """The sample period in seconds, None if unknown yet"""
+        if self.__rate:
+            return 1.0 / self.__rate
+        return self.__min if self.__min < math.inf else None
+
+    @property
+    def last(self) -> float:
+        """The time.monotonic() timestamp of the last sample, None if none"""
+        return self.__last
+
+    def timestamps(self) -> list[float]:
+        """The timestamps of the recent samples"""
+        return list(self.__timestamps)
+
+    def record(self, timestamp : float):
+        """Record a sample
+
+        Args:
+            timestamp (float): the time.monotonic() time of the sample
+        """
+        self.__samples += 1
+        self.__timestamps.append(timestamp)
+        last, self.__last = self.__last, timestamp
+        paused, self.__paused = self.__paused, False
+        if last is None or paused:
+            return
+        interval = timestamp - last
+        if interval <= 0 or interval > MAX_GAP:
+            return
+
+        # Welford, the mean and variance of the intervals in constant memory
+        self.__intervals += 1
+        delta = interval - self.__mean
+        self.__mean += delta / self.__intervals
+        self.__m2 += delta * (interval - self.__mean)
+        self.__min = min(self.__min, interval)
+        self.__max = max(self.__max, interval)
+
+        period = self.period
+        if period:
+            self.__missed += max(0, int(round(interval / period)) - 1)
+
+    def stats(self) -> dict:
+        """Get the sampling statistics
+
+        Returns:
+            dict: samples, rate_hz (measured), interval_ms (mean, min, max), jitter_ms (standard deviation
+            of the intervals), missed (conversions lost) and missed_ratio
+        """
+        jitter = math.sqrt(self.__m2 / (self.__intervals - 1)) if self.__intervals > 1 else 0.0
+        expected = self.__samples + self.__missed
+        return {
+            'samples': self.__samples,
+            'rate_hz': 1.0 / self.__mean if self.__mean > 0 else 0.0,
+            'interval_ms': self.__mean * 1000.0,
+            'interval_min_ms': self.__min * 1000.0 if self.__min < math.inf else 0.0,
+            'interval_max_ms': self.__max * 1000.0,
+            'jitter_ms': jitter * 1000.0,
+            'missed': self.__missed,
+            'missed_ratio': self.__missed / expected if expected > 0 else 0.0
+        }
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
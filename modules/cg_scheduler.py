@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## The acquisition scheduler shared by all the CG meters of the process
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import time
+import logging
+import threading
+from constants import APP_NAME
+from utils.timing import PipelineTimer, STAGE_READ, STAGE_FILTER, STAGE_FRAME
+from modules.cg_health import NO_DATA
+
+IDLE_SLEEP = 0.001  # seconds to wait when no HX711 has a sample ready
+
+class AcquisitionJob:
+    """The reading of the modules of one CG meter"""
+    def __init__(self, name : str, modules : list, readings : int, period : float, dispatch : callable):
+        """Constructor
+
+        Args:
+            name (str): the name of the job, for logging
+            modules (list[CGModule]): the modules to read
+            readings (int): number of samples averaged for a reading
+            period (float): minimum time in seconds between two readings
+            dispatch (callable): the function called with the weights of each reading and with None when the job ends
+        """
+        self.name = name
+        self.modules = modules
+        self.readings = max(1, readings)
+        self.period = period
+        self.dispatch = dispatch
+        self.due = time.monotonic()
+        self.samples = {module.name: [] for module in modules}
+        self.stopped = threading.Event()
+
+    def complete(self) -> bool:
+        """True if every initialized module has enough samples for a reading, the modules without data
+        are not waited for, their fault is in the health of the reading"""
+        initialized = [module for module in self.modules if module.initialized and module.health != NO_DATA]
+        return len(initialized) > 0 and all(len(self.samples[module.name]) >= module.samplesPerReading(self.readings)
+                                            for module in initialized)
+
+    def reading(self) -> dict:
+        """Average the samples into a reading and start a new one
+
+        Returns:
+            dict: the weights by module name
+        """
+        timer = PipelineTimer()
+        start = timer.begin()
+        values = {}
+        for module in self.modules:
+            if module.initialized:
+                values[module.name] = module.meanWeight(self.samples[module.name])
+                if self.period > 0 and not module.filtered:
+                    # the scheduler waits for the next reading, the conversions meanwhile are not missed
+                    module.pauseSampling()
+            self.samples[module.name] = []
+        self.due = max(self.due + self.period, time.monotonic()) if self.period > 0 else time.monotonic()
+        timer.end(STAGE_FILTER, start)
+        return values
+
+class AcquisitionScheduler:
+    """Multiplex the HX711 reads of all the CG meters in a single thread, it is a singleton
+
+    The HX711 convert continuously, so instead of waiting for each gauge in turn the
+    scheduler clocks out whichever gauge has a sample ready. The gauges of all the meters
+    are then sampled in parallel and adding a station does not slow the others down.
+    """
+    _instance = None
+    def  __new__(cls):
+        if not cls._instance:
+            cls._instance = super(AcquisitionScheduler, cls).__new__(cls)
+            cls._instance.__jobs = []
+            cls._instance.__lock = threading.Lock()
+            cls._instance.__thread = None
+            cls._instance.__logger = logging.getLogger(APP_NAME)
+        return cls._instance
+
+    def __init__(self):
+        """Nothing to do here, the singleton is already initialized and this method is instance called"""
+        pass
+
+    @property
+    def jobs_count(self) -> int:
+        return len(self.__jobs)
+
+    def add_job(self, job : AcquisitionJob):
+        """Start reading the modules of a job, the thread is started if needed
+
+        Args:
+            job (AcquisitionJob): the job to add
+        """
+        for module in job.modules:
+            # the samples are waited for from now on, a gauge that never has one is then without data
+            module.pauseSampling()
+        with self.__lock:
+            self.__jobs.append(job)
+            if self.__thread is None:
+                self.__thread = threading.Thread(name='CGSchedulerThread', target=self.__run, daemon=True)
+                self.__thread.start()
+        self.__logger.debug("Acquisition job %s added", job.name)
+
+    def remove_job(self, job : AcquisitionJob, wait : bool = False):
+        """Stop reading the modules of a job, its dispatch function is then called with None
+
+        Args:
+            job (AcquisitionJob): the job to remove
+            wait (bool, optional): True to wait for the end of the job, must not be used from the dispatch function. Defaults to False.
+        """
+        with self.__lock:
+            if job in self.__jobs:
+                self.__jobs.remove(job)
+                self.__logger.debug("Acquisition job %s removed", job.name)
+            else:
+                return
+
+        if wait and threading.current_thread() is not self.__thread:
+            job.stopped.wait()
+        elif threading.current_thread() is self.__thread:
+            self.__end_job(job)
+
+    ''' Private methods run in the scheduler thread'''
+    def __run(self):
+        self.__logger.debug("Acquisition scheduler thread started")
+        timer = PipelineTimer()
+        active = []
+        while True:
+            with self.__lock:
+                jobs = list(self.__jobs)
+                if len(jobs) == 0:
+                    self.__thread = None
+                    break
+
+            # jobs removed since the last loop are ended here, in this thread
+            for job in active:
+                if job not in jobs:
+                    self.__end_job(job)
+            active = jobs
+
+            sampled = False
+            for job in jobs:
+                for module in job.modules:
+                    samples = job.samples[module.name]
+                    # a filter chain needs every sample, it keeps reading while waiting for the next reading
+                    if len(samples) >= module.samplesPerReading(job.readings) and not module.filtered:
+                        continue
+                    if module.isReady():
+                        start = timer.begin()
+                        value = module.readSample()
+                        timer.end(STAGE_READ, start)
+                        if value is not None:
+                            samples.append(value)
+                        sampled = True
+                    else:
+                        module.checkHealth()
+
+                if job.complete() and time.monotonic() >= job.due:
+                    self.__dispatch(job, job.reading())
+
+            if not sampled:
+                time.sleep(IDLE_SLEEP)
+
+        for job in active:
+            self.__end_job(job)
+        self.__logger.debug("Acquisition scheduler thread stopped")
+
+    def __dispatch(self, job : AcquisitionJob, values):
+        timer = PipelineTimer()
+        start = timer.begin()
+        try:
+            job.dispatch(values)
+        except Exception as e:
+            self.__logger.error("Error dispatching acquisition job %s: %s", job.name, str(e))
+        timer.end(STAGE_FRAME, start)
+
+    def __end_job(self, job : AcquisitionJob):
+        if not job.stopped.is_set():
+            self.__dispatch(job, None)
+            job.stopped.set()
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## A high precision measurement: wait for stable weights, average a long window and give its uncertainty
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import time
+import queue
+import logging
+import threading
+import numpy as np
+
+import constants
+from .cg_frame import CGFrame
+
+DEFAULT_DURATION = 10.0     # s of samples averaged
+STABLE_WINDOW = 2.0         # s, the weights must not drift over this window before measuring
+STABLE_TOLERANCE = 1.0      # g, the largest drift of a gauge over the window
+STABLE_TIMEOUT = 30.0       # s, the snapshot fails if the weights are not stable by then
+OUTLIER_THRESHOLD = 3.5     # robust z-score (median/MAD) of the rejected samples
+COVERAGE = 2.0              # coverage factor of the displayed uncertainty, about 95%
+
+PHASE_WAITING = 'waiting'
+PHASE_STABILIZING = 'stabilizing'
+PHASE_MEASURING = 'measuring'
+PHASE_DONE = 'done'
+PHASE_CANCELLED = 'cancelled'
+PHASE_FAILED = 'failed'
+
+def robust_mean(samples : np.ndarray, threshold : float = OUTLIER_THRESHOLD) -> tuple[float, float, int, int]:
+    """The mean of samples without their outliers, and its standard uncertainty.
+    The samples of a gauge are correlated (the HX711 and the filters average them), the
+    uncertainty uses the effective number of samples from their lag-1 autocorrelation
+
+    Args:
+        samples (np.ndarray): the samples
+        threshold (float, optional): robust z-score above which a sample is rejected. Defaults to OUTLIER_THRESHOLD.
+
+    Returns:
+        tuple[float, float, int, int]: the mean, its standard uncertainty, the kept and the rejected samples
+    """
+    samples = np.asarray(samples, dtype=float)
+    median = np.median(samples)
+    mad = 1.4826 * np.median(np.abs(samples - median))
+    kept = samples[np.abs(samples - median) <= threshold * mad] if mad > 0 else samples
+    n = len(kept)
+    if n < 2:
+        return float(median), float('nan'), n, len(samples) - n
+
+    centered = kept - kept.mean()
+    variance = np.dot(centered, centered) / (n - 1)
+    if variance == 0:
+        return float(kept.mean()), 0.0, n, len(samples) - n
+    rho = np.clip(np.dot(centered[:-1], centered[1:]) / np.dot(centered, centered), 0.0, 0.99)
+    effective = max(1.0, n * (1.0 - rho) / (1.0 + rho))
+    return float(kept.mean()), float(np.sqrt(variance / effective)), n, len(samples) - n
+
+class SnapshotResult:
+    """The result of a snapshot: the weights, the CG and their standard uncertainties"""
+    def __init__(self, weights : dict, uncertainties : dict, samples : dict, rejected : dict, plane = None,
+                 positions : dict = None, station : str = None, duration : float = 0.0, faults : dict = None):
+        """Constructor, the CG is computed with the plane if any
+
+        Args:
+            weights (dict): the mean weight in grams by module name
+            uncertainties (dict): the standard uncertainty of each weight in grams by module name
+            samples (dict): the samples kept by module name
+            rejected (dict): the outliers rejected by module name
+            plane (Plane, optional): the plane on the gauges. Defaults to None.
+            positions (dict, optional): the gauges positions in mm, None for the plane ones. Defaults to None.
+            station (str, optional): the name of the CG meter station. Defaults to None.
+            duration (float, optional): the measurement window in seconds. Defaults to 0.0.
+            faults (dict, optional): the health state of the gauges faulty during the snapshot, no CG if any. Defaults to None.
+        """
+        self.timestamp = time.time()
+        self.station = station
+        self.plane = plane.name if plane is not None else None
+        self.weights = dict(weights)
+        self.uncertainties = dict(uncertainties)
+        self.samples = dict(samples)
+        self.rejected = dict(rejected)
+        self.duration = duration
+        self.faults = dict(faults) if faults else {}
+        self.total = sum(self.weights.values())
+        self.total_uncertainty = float(np.sqrt(sum(u ** 2 for u in self.uncertainties.values())))
+        self.cg = None
+        self.cg_uncertainty = None
+        if plane is not None and not self.faults:
+            try:
+                solver = plane.solver(positions)
+                self.cg = solver.solve(self.weights)
+                self.cg_uncertainty = solver.uncertainty(self.weights, self.uncertainties)
+            except BaseException:
+                # no CG if the plane is not on the gauges
+                self.cg = None
+
+    def to_frame(self) -> CGFrame:
+        """The snapshot as a reading, e.g. to record it in the history"""
+        frame = CGFrame(self.weights, None, self.timestamp, self.station, faults=self.faults)
+        frame.plane = self.plane
+        frame.cg = (int(round(self.cg[0])), int(round(self.cg[1]))) if self.cg is not None else None
+        return frame
+
+    def to_dict(self) -> dict:
+        return {
+            'time': self.timestamp,
+            'station': self.station,
+            'plane': self.plane,
+            'weights': self.weights,
+            'uncertainties': self.uncertainties,
+            'total': self.total,
+            'total_uncertainty': self.total_uncertainty,
+            'cg': list(self.cg) if self.cg is not None else None,
+            'cg_uncertainty': list(self.cg_uncertainty) if self.cg_uncertainty is not None else None,
+            'samples': self.samples,
+            'rejected': self.rejected,
+            'duration': self.duration,
+            'faults': self.faults
+        }
+
+    def __str__(self):
+        k = COVERAGE
+        cg = (f'CG ({self.cg[0]:.1f} ± {k * self.cg_uncertainty[0]:.1f}, {self.cg[1]:.1f} ± {k * self.cg_uncertainty[1]:.1f}) mm'
+              if self.cg is not None else 'no CG')
+        faults = f', faults {self.faults}' if self.faults else ''
+        return (f'Snapshot of plane {self.plane}: total {self.total:.1f} ± {k * self.total_uncertainty:.1f} g, {cg} '
+                f'(k={k:g}, {sum(self.samples.values())} samples, {sum(self.rejected.values())} rejected){faults}')
+
+class Snapshot:
+    """A snapshot of a CG meter running in its own thread: it waits for the weights to be stable,
+    then collects all the gauges during a long window and averages them without their outliers.
+    The phase and progress can be polled, e.g. by the UI, or followed with a progress callback"""
+    def __init__(self, meter, duration : float = DEFAULT_DURATION, tolerance : float = STABLE_TOLERANCE,
+                 window : float = STABLE_WINDOW, timeout : float = STABLE_TIMEOUT, progress : callable = None,
+                 callback : callable = None):
+        """Constructor
+
+        Args:
+            meter (CGMeter): the initialized meter, read sample by sample if it is not already reading
+            duration (float, optional): the measurement window in seconds. Defaults to DEFAULT_DURATION.
+            tolerance (float, optional): the largest drift in grams of a stable gauge. Defaults to STABLE_TOLERANCE.
+            window (float, optional): the window in seconds of the stability check. Defaults to STABLE_WINDOW.
+            timeout (float, optional): the longest wait in seconds for stable weights. Defaults to STABLE_TIMEOUT.
+            progress (callable, optional): called with the phase and its progress from 0 to 1. Defaults to None.
+            callback (callable, optional): called with the SnapshotResult at the end, None if it failed. Defaults to None.
+        """
+        self.__logger = logging.getLogger(constants.APP_NAME)
+        self.__meter = meter
+        self.__duration = duration
+        self.__tolerance = tolerance
+        self.__window = window
+        self.__timeout = timeout
+        self.__progress_callback = progress
+        self.__callback = callback
+        self.__frames = queue.Queue()
+        self.__cancelled = threading.Event()
+        self.__done = threading.Event()
+        self.__thread = None
+        self.__phase = PHASE_WAITING
+        self.__progress = 0.0
+        self.result = None
+        self.error = None
+
+    @property
+    def phase(self) -> str:
+        return self.__phase
+
+    @property
+    def progress(self) -> float:
+        """The progress of the current phase from 0 to 1"""
+        return self.__progress
+
+    @property
+    def running(self) -> bool:
+        return self.__thread is not None and not self.__done.is_set()
+
+    def start(self):
+        if self.__thread is not None:
+            raise Exception("Snapshot already started")
+        self.__thread = threading.Thread(target=self.__run, name="CGSnapshot", daemon=True)
+        self.__thread.start()
+
+    def cancel(self):
+        self.__cancelled.set()
+
+    def wait(self, timeout : float = None) -> SnapshotResult:
+        """Wait for the end of the snapshot, must not be called from the callbacks
+
+        Returns:
+            SnapshotResult: the result, None if the snapshot failed or is cancelled
+        """
+        self.__done.wait(timeout)
+        return self.result
+
+    def __on_readings(self, weights : dict):
+        if weights is not None:
+            self.__frames.put((time.monotonic(), weights, self.__meter.faults()))
+
+    def __set_phase(self, phase : str, progress : float):
+        self.__phase = phase
+        self.__progress = min(max(progress, 0.0), 1.0)
+        if self.__progress_callback is not None:
+            try:
+                self.__progress_callback(phase, self.__progress)
+            except Exception as e:
+                self.__logger.error("Error in snapshot progress callback: %s", e)
+
+    def __next_frame(self):
+        try:
+            return self.__frames.get(timeout=0.1)
+        except queue.Empty:
+            return None
+
+    def __wait_stable(self):
+        start = time.monotonic()
+        frames = []
+        while not self.__cancelled.is_set():
+            now = time.monotonic()
+            if now - start > self.__timeout:
+                raise Exception(f'The weights are not stable after {self.__timeout:.0f} s')
+            self.__set_phase(PHASE_STABILIZING, (now - start) / self.__timeout)
+
+            frame = self.__next_frame()
+            if frame is None:
+                continue
+            frames.append(frame)
+            frames = [f for f in frames if f[0] >= frame[0] - self.__window]
+            if frame[0] - start < self.__window or len(frames) < 4:
+                continue
+
+            # stable if the mean of each gauge does not move between the two halves of the window
+            half = len(frames) // 2
+            # a gauge offline for a while is left out of the readings, only the gauges of every frame are compared
+            names = set(frame[1].keys()).intersection(*(f[1].keys() for f in frames))
+            if len(names) == 0:
+                continue
+            drift = max(abs(np.mean([f[1][name] for f in frames[:half]]) - np.mean([f[1][name] for f in frames[half:]]))
+                        for name in names)
+            if drift <= self.__tolerance:
+                return
+
+    def __measure(self) -> SnapshotResult:
+        start = time.monotonic()
+        samples = {}
+        faults = {}
+        while not self.__cancelled.is_set():
+            elapsed = time.monotonic() - start
+            self.__set_phase(PHASE_MEASURING, elapsed / self.__duration)
+            if elapsed >= self.__duration:
+                break
+            frame = self.__next_frame()
+            if frame is None:
+                continue
+            for name, weight in frame[1].items():
+                samples.setdefault(name, []).append(weight)
+            faults.update(frame[2])
+
+        if self.__cancelled.is_set():
+            return None
+        if len(samples) == 0:
+            raise Exception("No reading during the snapshot")
+
+        weights, uncertainties, kept, rejected = {}, {}, {}, {}
+        for name, serie in samples.items():
+            weights[name], uncertainties[name], kept[name], rejected[name] = robust_mean(serie)
+        return SnapshotResult(weights, uncertainties, kept, rejected, self.__meter.plane_manager.get_current_plane(),
+                              self.__meter.gauge_positions(), self.__meter.name, time.monotonic() - start, faults)
+
+    def __run(self):
+        # the readings of a running meter are shared, otherwise it is read sample by sample
+        listening = self.__meter.reading
+        try:
+            if listening:
+                self.__meter.add_listener(self.__on_readings)
+            else:
+                self.__meter.start_reading(self.__on_readings, readings=1, period=0.0)
+
+            self.__wait_stable()
+            # the samples of the stability check are not averaged
+            while not self.__frames.empty():
+                self.__frames.get_nowait()
+            self.result = self.__measure()
+            if self.result is not None:
+                self.__logger.info("%s", self.result)
+                self.__set_phase(PHASE_DONE, 1.0)
+            else:
+                self.__set_phase(PHASE_CANCELLED, 1.0)
+
+        except Exception as e:
+            self.error = str(e)
+            self.__logger.error("Snapshot failed: %s", e)
+            self.__set_phase(PHASE_FAILED, 1.0)
+        finally:
+            if listening:
+                self.__meter.remove_listener(self.__on_readings)
+            elif self.__meter.reading:
+                self.__meter.stop_reading(wait=True)
+            self.__done.set()
+            if self.__callback is not None:
+                try:
+                    self.__callback(self.result)
+                except Exception as e:
+                    self.__logger.error("Error in snapshot callback: %s", e)
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
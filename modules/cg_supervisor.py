@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Supervisor of the gauges: re-initialize the failed or unhealthy ones in the background
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import time
+import logging
+import threading
+from constants import APP_NAME
+from modules import cg_health
+
+CHECK_PERIOD = 1.0      # seconds between two checks of the modules
+UNHEALTHY_DELAY = 2.0   # seconds a module stays unhealthy before it is re-initialized
+MIN_BACKOFF = 1.0       # seconds before the first retry
+MAX_BACKOFF = 60.0      # maximum seconds between two retries
+# a jump is a transient issue, re-initializing does not help
+RETRY_STATES = (cg_health.NO_DATA, cg_health.SATURATED, cg_health.STUCK)
+
+class ModuleSupervisor:
+    """Retry the failed or unhealthy modules of a CG meter with an exponential backoff
+
+    The retries run in a worker thread, the other modules keep being read meanwhile. A module
+    being re-initialized is left out of the readings and folded back in once it is initialized.
+    """
+    def __init__(self, name : str, modules : list, active : callable = None):
+        """Constructor
+
+        Args:
+            name (str): the CG meter station name, for logging
+            modules (list[CGModule]): the modules to supervise
+            active (callable, optional): returns False while the modules must not be touched. Defaults to always active.
+        """
+        self.__logger = logging.getLogger(APP_NAME)
+        self.__name = name
+        self.__modules = modules
+        self.__active = active if active is not None else lambda: True
+        self.__status = {module.name: {'failures': 0, 'unhealthy_since': None, 'next_retry': 0.0, 'backoff': MIN_BACKOFF, 'retried_at': None}
+                         for module in modules}
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        if self.__thread is None:
+            self.__stop.clear()
+            self.__thread = threading.Thread(name=f'CGSupervisor-{self.__name}', target=self.__run, daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        if self.__thread is not None:
+            self.__stop.set()
+            if threading.current_thread() is not self.__thread:
+                self.__thread.join()
+            self.__thread = None
+
+    def status(self) -> dict[str, dict]:
+        """The supervision of each module by name: consecutive failures and seconds until the next retry"""
+        now = time.monotonic()
+        return {name: {'failures': status['failures'], 'retry_in': max(0.0, status['next_retry'] - now) if status['failures'] > 0 else None}
+                for name, status in self.__status.items()}
+
+    ''' Private methods run in the supervisor thread'''
+    def __run(self):
+        self.__logger.debug("Supervisor of %s started", self.__name)
+        while not self.__stop.wait(CHECK_PERIOD):
+            if not self.__active():
+                continue
+            for module in self.__modules:
+                if self.__stop.is_set():
+                    break
+                if self.__needs_retry(module, time.monotonic()):
+                    self.__retry(module)
+        self.__logger.debug("Supervisor of %s stopped", self.__name)
+
+    def __needs_retry(self, module, now : float) -> bool:
+        status = self.__status[module.name]
+        if not module.initialized:
+            return now >= status['next_retry']
+
+        if module.health not in RETRY_STATES:
+            # recovered once samples are read since the last retry, a re-initialized module is always healthy at first
+            sampled = status['retried_at'] is None or (module.lastSampleTime or 0.0) > status['retried_at']
+            if sampled and (status['failures'] > 0 or status['unhealthy_since'] is not None):
+                self.__logger.info("Module %s of %s is healthy again", module.name, self.__name)
+                status.update(failures=0, unhealthy_since=None, backoff=MIN_BACKOFF, retried_at=None)
+            return False
+
+        if status['unhealthy_since'] is None:
+            status['unhealthy_since'] = now
+            self.__logger.warning("Module %s of %s is unhealthy: %s", module.name, self.__name, module.health)
+        return now - status['unhealthy_since'] >= UNHEALTHY_DELAY and now >= status['next_retry']
+
+    def __retry(self, module):
+        status = self.__status[module.name]
+        self.__logger.info("Re-initializing module %s of %s, attempt %d", module.name, self.__name, status['failures'] + 1)
+        status['retried_at'] = time.monotonic()
+        if module.reinitialize():
+            # healthy again only when its samples say so, see __needs_retry
+            status['unhealthy_since'] = None
+            self.__logger.info("Module %s of %s is initialized again", module.name, self.__name)
+        status['failures'] += 1
+        status['next_retry'] = time.monotonic() + status['backoff']
+        status['backoff'] = min(status['backoff'] * 2, MAX_BACKOFF)
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -34,7 +34,33 @@ import random
 import math
 import threading
 
+class VirtualClock:
+    """A simulated time base: waiting for a sample jumps to the time it is ready instead of sleeping,
+    so that the emulated HX711 run as fast as the CPU allows while keeping a realistic sensor time"""
+    def __init__(self, start=0.0):
+        self.__now = start
+        self.__lock = threading.Lock()
+
+    def now(self):
+        return self.__now
+
+    def advance_to(self, timestamp):
+        with self.__lock:
+            if timestamp > self.__now:
+                self.__now = timestamp
+
+    def sleep(self, seconds):
+        self.advance_to(self.__now + seconds)
+
 class HX711:
+    # Set a VirtualClock to run in virtual time, None for the real time.
+    clock = None
+    # Load in grams on the gauge at a given time, by dout pin: {dout_pin: callable(t)}.
+    # Gauges without signal generate the original fake sine samples.
+    signals = {}
+    # Standard deviation of the noise in grams added to the signals.
+    noise_grams = 0.5
+
     def __init__(self,
                  dout_pin,
                  pd_sck_pin,
@@ -44,9 +70,9 @@ class HX711:
         self.DOUT = dout_pin
 
         # Last time we've been read.
-        self.lastReadTime = time.time()
+        self.lastReadTime = self.now()
         self.sampleRateHz = 80.0
-        self.resetTimeStamp = time.time()
+        self.resetTimeStamp = self.now()
         self.sampleCount = 0
         self.simulateTare = True
 
@@ -71,7 +97,16 @@ class HX711:
 
 
         # Think about whether this is necessary.
-        time.sleep(1)
+        self.sleep(1)
+
+    def now(self):
+        return self.clock.now() if self.clock is not None else time.time()
+
+    def sleep(self, seconds):
+        if self.clock is not None:
+            self.clock.sleep(seconds)
+        else:
+            time.sleep(seconds)
 
     def convertToTwosComplement24bit(self, inputValue):
        # HX711 has saturating logic.
@@ -100,8 +135,13 @@ class HX711:
         # Calculate how long we should be waiting between samples, given the
         # sample rate.
         sampleDelaySeconds = 1.0 / self.sampleRateHz
+        readyTime = self.lastReadTime + sampleDelaySeconds
+
+        # In virtual time, the time goes on until the sample is ready.
+        if self.clock is not None:
+            self.clock.advance_to(readyTime)
 
-        return time.time() >= self.lastReadTime + sampleDelaySeconds
+        return self.now() >= readyTime
 
     
     def set_gain(self, gain):
@@ -137,7 +177,7 @@ class HX711:
         while not self.is_ready():
            pass
 
-        self.lastReadTime = time.time()
+        self.lastReadTime = self.now()
 
         # Generate a 24bit 2s complement sample for the virtual HX711.
         rawSample = self.convertToTwosComplement24bit(self.generateFakeSample())
@@ -252,7 +292,7 @@ class HX711:
         # Restore the reference unit, now that we've got our offset.
         self.set_scale_ratio(reference_unit)
         # wait for the sensor to stabilize
-        time.sleep(1)
+        self.sleep(1)
         return False
 
     
@@ -329,11 +369,18 @@ class HX711:
         # self.power_up()
 
         # Mark time when we were reset.  We'll use this for sample generation.
-        self.resetTimeStamp = time.time()
+        self.resetTimeStamp = self.now()
 
 
     def generateFakeSample(self):
-       sampleTimeStamp = time.time() - self.resetTimeStamp
+       signal = self.signals.get(self.DOUT)
+       if signal is not None:
+          # the raw value giving this weight once divided by the scale, see get_weight_mean()
+          grams = signal(self.now()) + random.gauss(0.0, self.noise_grams)
+          self.sampleCount += 1
+          return int(grams * self.REFERENCE_UNIT * 100)
+
+       sampleTimeStamp = self.now() - self.resetTimeStamp
 
        noiseScale = 1.0
        noiseValue = random.randrange(-(noiseScale * 1000),(noiseScale * 1000)) / 1000.0
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Compute the ballast bringing the CG of a plane in its range
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import numpy as np
+
+BALLAST_MARGIN = 2.0    # mm, the CG is brought this far inside the range to stay in it despite the noise
+
+class BallastSolver:
+    """Compute the minimum ballast at candidate locations to bring the CG in a range
+
+    A mass m at the position P moves the CG c of a plane of weight W along the segment to P:
+    c' = c + t (P - c) with t = m / (W + m). The smallest t putting c' in the range box is found
+    for all the locations at once (slab intersection of the segments with the box), then m = W t / (1 - t).
+    """
+    def __init__(self, locations : dict[str, tuple[float,float]]):
+        """Constructor
+
+        Args:
+            locations (dict[str, tuple[float,float]]): the (x,y) position in mm of each candidate location by name
+        """
+        if len(locations) == 0:
+            raise ValueError('At least one ballast location is needed')
+
+        self.__names = list(locations.keys())
+        self.__locations = np.array([locations[name] for name in self.__names], dtype=float).reshape(-1, 2)
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.__names)
+
+    @property
+    def locations(self) -> np.ndarray:
+        return self.__locations.copy()
+
+    def solve(self, total : float, cg : tuple[float,float], xrange : tuple[float,float], yrange : tuple[float,float],
+              margin : float = BALLAST_MARGIN) -> np.ndarray:
+        """Compute the minimum ballast at each location
+
+        Args:
+            total (float): the weight of the plane in grams
+            cg (tuple[float,float]): the CG (x,y) of the plane in mm
+            xrange (tuple[float,float]): the wanted CG x range in mm
+            yrange (tuple[float,float]): the wanted CG y range in mm
+            margin (float, optional): the distance in mm to keep inside the range. Defaults to BALLAST_MARGIN.
+
+        Returns:
+            np.ndarray: the mass in grams at each location, ordered as the names, 0 if the CG is already in
+            the range and inf if the CG cannot be brought in the range from this location
+        """
+        c = np.asarray(cg, dtype=float)
+        box = np.array([xrange, yrange], dtype=float)
+        box.sort(axis=1)
+        # a range narrower than the margins is aimed at its middle
+        middle = box.mean(axis=1)
+        low = np.minimum(box[:, 0] + margin, middle)
+        high = np.maximum(box[:, 1] - margin, middle)
+
+        direction = self.__locations - c
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t1 = (low - c) / direction
+            t2 = (high - c) / direction
+        # along a null direction, the axis is either always or never in the range
+        inside = (low <= c) & (c <= high)
+        parallel = direction == 0
+        t_enter = np.where(parallel, np.where(inside, 0.0, np.inf), np.minimum(t1, t2))
+        t_exit = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+        t_enter = np.maximum(t_enter.max(axis=1), 0.0)
+        t_exit = t_exit.min(axis=1)
+
+        feasible = (t_enter <= t_exit) & (t_enter < 1.0)
+        with np.errstate(divide='ignore'):
+            return np.where(feasible, total * t_enter / (1.0 - t_enter), np.inf)
+
+    def best(self, total : float, cg : tuple[float,float], xrange : tuple[float,float], yrange : tuple[float,float],
+             margin : float = BALLAST_MARGIN) -> tuple[str, float]:
+        """The lightest ballast bringing the CG in the range, see solve()
+
+        Returns:
+            tuple[str, float]: the location name and the mass in grams, None if the CG is already in the
+            range or cannot be brought in it
+        """
+        masses = self.solve(total, cg, xrange, yrange, margin)
+        index = int(np.argmin(masses))
+        if masses[index] == 0 or not np.isfinite(masses[index]):
+            return None
+        return (self.__names[index], float(masses[index]))
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
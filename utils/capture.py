@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Load the captures written by the headless mode (csv or json lines)
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import csv
+import json
+import numpy as np
+
+# columns of the headless csv output which are not gauges
+CSV_FRAME_COLUMNS = ('time', 'station', 'plane', 'total', 'cg_x', 'cg_y', 'faults')
+
+def iter_capture(filename : str, chunk_size : int = 4096):
+    """Read a capture by chunks, to process long captures in bounded memory
+
+    A capture is the output of the headless mode, in csv or json lines, ideally written with
+    --readings 1 --rate 0 to get every raw sample of the gauges.
+
+    Args:
+        filename (str): the capture file, csv if its name ends with .csv, json lines otherwise
+        chunk_size (int, optional): the number of samples by chunk. Defaults to 4096.
+
+    Yields:
+        tuple[np.ndarray, dict[str, np.ndarray]]: the times in seconds and the weights in grams by gauge name
+    """
+    rows = __iter_csv(filename) if filename.lower().endswith('.csv') else __iter_json_lines(filename)
+    times = []
+    weights = {}
+    for timestamp, values in rows:
+        if len(times) > 0 and values.keys() != weights.keys():
+            raise ValueError(f'The gauges change in the capture {filename}, only one station can be read')
+        if len(times) == 0:
+            weights = {name: [] for name in values}
+        times.append(timestamp)
+        for name, value in values.items():
+            weights[name].append(value)
+
+        if len(times) >= chunk_size:
+            yield np.array(times), {name: np.array(serie) for name, serie in weights.items()}
+            times = []
+
+    if len(times) > 0:
+        yield np.array(times), {name: np.array(serie) for name, serie in weights.items()}
+
+def load_capture(filename : str) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """Load a whole capture
+
+    Args:
+        filename (str): the capture file, csv if its name ends with .csv, json lines otherwise
+
+    Returns:
+        tuple[np.ndarray, dict[str, np.ndarray]]: the times in seconds and the weights in grams by gauge name
+    """
+    chunks = list(iter_capture(filename))
+    if len(chunks) == 0:
+        raise ValueError(f'The capture {filename} is empty')
+    times = np.concatenate([chunk[0] for chunk in chunks])
+    weights = {name: np.concatenate([chunk[1][name] for chunk in chunks]) for name in chunks[0][1]}
+    return times, weights
+
+def __iter_csv(filename : str):
+    with open(filename, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = None
+        for row in reader:
+            if len(row) == 0:
+                continue
+            if row[0] == 'time':
+                header = row
+                continue
+            if header is None:
+                raise ValueError(f'No header in the capture {filename}')
+            values = {name: float(value) for name, value in zip(header, row) if name not in CSV_FRAME_COLUMNS}
+            yield float(row[0]), values
+
+def __iter_json_lines(filename : str):
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.strip():
+                frame = json.loads(line)
+                yield float(frame['time']), {name: float(value) for name, value in frame['weights'].items()}
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## A local WebSocket/HTTP server broadcasting the CG meter readings
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import json
+import base64
+import struct
+import asyncio
+import hashlib
+import logging
+import threading
+from constants import APP_NAME
+from modules.cg_frame import CGFrame
+from utils.planemanager import PlaneManager
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_SIZE = 16     # frames kept for a slow client, the oldest are dropped
+MAX_CLIENT_PAYLOAD = 1024   # bytes, the clients only send control frames of a few bytes
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+CLOSE_TOO_BIG = 1009        # close code of a message too big to process
+
+class CGServer:
+    """Broadcast every reading of a CG meter to WebSocket clients and serve the latest one over HTTP
+
+    The server runs its own asyncio loop in a background thread. publish() only hands the
+    frame over to that loop, and each client has a bounded queue where the oldest frames are
+    dropped, so a slow client never stalls the acquisition nor the other clients.
+
+    HTTP endpoints:
+        GET /latest : the latest frame as json
+        GET /latest/<station> : the latest frame of a station as json
+        GET /planes : the planes names and the current plane of each station as json
+    Any other path with a WebSocket upgrade request subscribes to the frames.
+    """
+    def __init__(self, host : str = DEFAULT_HOST, port : int = DEFAULT_PORT, queue_size : int = DEFAULT_QUEUE_SIZE, plane_manager : PlaneManager = None):
+        """Constructor
+
+        Args:
+            host (str, optional): the address to bind, "0.0.0.0" for the LAN. Defaults to DEFAULT_HOST.
+            port (int, optional): the port to bind, 0 for any free port. Defaults to DEFAULT_PORT.
+            queue_size (int, optional): the number of frames kept for each client. Defaults to DEFAULT_QUEUE_SIZE.
+            plane_manager (PlaneManager, optional): the planes listed by /planes. Defaults to PlaneManager().
+        """
+        self.__logger = logging.getLogger(APP_NAME)
+        self.__host = host
+        self.__port = port
+        self.__queue_size = queue_size
+        self.__planes = plane_manager if plane_manager is not None else PlaneManager()
+        self.__loop = None
+        self.__server = None
+        self.__thread = None
+        self.__started = threading.Event()
+        self.__clients = set()
+        self.__latest = None
+        self.__latest_by_station = {}
+        self.__listeners = {}
+
+    @property
+    def port(self) -> int:
+        """The bound port, useful if the server was created with port 0"""
+        return self.__port
+
+    @property
+    def clients_count(self) -> int:
+        return len(self.__clients)
+
+    def start(self):
+        """Start the server thread and wait until the socket is bound"""
+        if self.__thread is not None:
+            raise Exception("CGServer already started")
+
+        self.__started.clear()
+        self.__thread = threading.Thread(name='CGServerThread', target=self.__run, daemon=True)
+        self.__thread.start()
+        self.__started.wait()
+        if self.__server is None:
+            self.__thread = None
+            raise Exception(f'Cannot start CGServer on {self.__host}:{self.__port}')
+
+    def stop(self):
+        """Stop the server and close the clients connections"""
+        if self.__thread is None:
+            return
+
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__thread = None
+
+    def attach(self, meter):
+        """Publish every reading of a CG meter, the CG is computed with the current plane of the meter
+
+        Args:
+            meter (CGMeter): the meter to listen to
+        """
+        if meter.name not in self.__listeners:
+            listener = lambda weights: self.publish(CGFrame(weights, meter.plane_manager.get_current_plane(), station=meter.name,
+                                                            positions=meter.gauge_positions(), faults=meter.faults()))
+            self.__listeners[meter.name] = listener
+            meter.add_listener(listener)
+
+    def detach(self, meter):
+        listener = self.__listeners.pop(meter.name, None)
+        if listener is not None:
+            meter.remove_listener(listener)
+
+    def publish(self, frame : CGFrame):
+        """Publish a frame to all the clients, can be called from any thread and never blocks
+
+        Args:
+            frame (CGFrame): the frame to publish
+        """
+        self.__latest = frame
+        self.__latest_by_station[frame.station] = frame
+        loop = self.__loop
+        if loop is not None and self.__server is not None:
+            try:
+                loop.call_soon_threadsafe(self.__broadcast, frame)
+            except RuntimeError:
+                # the server is stopping
+                pass
+
+    ''' Private methods run in the server thread'''
+    def __run(self):
+        self.__loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.__loop)
+        try:
+            self.__server = self.__loop.run_until_complete(asyncio.start_server(self.__on_connection, self.__host, self.__port))
+            self.__port = self.__server.sockets[0].getsockname()[1]
+            self.__logger.info("CGServer listening on %s:%d", self.__host, self.__port)
+        except OSError as e:
+            self.__logger.error("Error starting CGServer: %s", str(e))
+            self.__server = None
+        finally:
+            self.__started.set()
+
+        if self.__server is None:
+            self.__loop.close()
+            self.__loop = None
+            return
+
+        try:
+            self.__loop.run_forever()
+        finally:
+            self.__server.close()
+            tasks = asyncio.all_tasks(self.__loop)
+            for task in tasks:
+                task.cancel()
+            self.__loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.__loop.close()
+            self.__server = None
+            self.__loop = None
+            self.__clients.clear()
+            self.__logger.info("CGServer stopped")
+
+    def __broadcast(self, frame : CGFrame):
+        if len(self.__clients) == 0:
+            return
+
+        message = self.__encode(OPCODE_TEXT, json.dumps(frame.to_dict()).encode())
+        for queue in self.__clients:
+            if queue.full():
+                # drop the oldest frame, the client is too slow
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def __on_connection(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            lines = request.decode("latin-1").split("\r\n")
+            method, path, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+
+            if headers.get("upgrade", "").lower() == "websocket":
+                await self.__serve_websocket(reader, writer, headers)
+            else:
+                await self.__serve_http(writer, method, path)
+
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError) as e:
+            self.__logger.debug("CGServer connection closed: %s", str(e))
+        except asyncio.CancelledError:
+            # the server is stopping
+            pass
+        finally:
+            writer.close()
+
+    async def __serve_http(self, writer : asyncio.StreamWriter, method : str, path : str):
+        status = "200 OK"
+        if method != "GET":
+            status, body = "405 Method Not Allowed", {"error": "only GET is allowed"}
+        elif path == "/latest":
+            body = self.__latest.to_dict() if self.__latest is not None else None
+        elif path.startswith("/latest/"):
+            frame = self.__latest_by_station.get(path[len("/latest/"):])
+            body = frame.to_dict() if frame is not None else None
+        elif path == "/planes":
+            plane = self.__planes.get_current_plane()
+            stations = {}
+            for name in PlaneManager.stations():
+                current = PlaneManager(name).get_current_plane()
+                stations[name] = current.name if current is not None else None
+            body = {"planes": self.__planes.get_planes_names_list(), "current": plane.name if plane is not None else None, "stations": stations}
+        else:
+            status, body = "404 Not Found", {"error": f'unknown path {path}'}
+
+        content = json.dumps(body).encode()
+        writer.write((f'HTTP/1.1 {status}\r\n'
+                      'Content-Type: application/json\r\n'
+                      f'Content-Length: {len(content)}\r\n'
+                      'Access-Control-Allow-Origin: *\r\n'
+                      'Connection: close\r\n\r\n').encode() + content)
+        await writer.drain()
+
+    async def __serve_websocket(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter, headers : dict):
+        key = headers.get("sec-websocket-key")
+        if key is None:
+            raise ValueError("missing Sec-WebSocket-Key")
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\n'
+                      'Upgrade: websocket\r\n'
+                      'Connection: Upgrade\r\n'
+                      f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+        await writer.drain()
+
+        queue = asyncio.Queue(self.__queue_size)
+        if self.__latest is not None:
+            queue.put_nowait(self.__encode(OPCODE_TEXT, json.dumps(self.__latest.to_dict()).encode()))
+        self.__clients.add(queue)
+        self.__logger.debug("CGServer client connected, %d client(s)", len(self.__clients))
+
+        sender = asyncio.ensure_future(self.__send_frames(writer, queue))
+        try:
+            await self.__receive_frames(reader, writer)
+        finally:
+            self.__clients.discard(queue)
+            sender.cancel()
+            self.__logger.debug("CGServer client disconnected, %d client(s)", len(self.__clients))
+
+    async def __send_frames(self, writer : asyncio.StreamWriter, queue : asyncio.Queue):
+        try:
+            while True:
+                message = await queue.get()
+                writer.write(message)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    async def __receive_frames(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        # clients only send control frames, answer ping and close
+        while True:
+            head = await reader.readexactly(2)
+            opcode = head[0] & 0x0F
+            masked = head[1] & 0x80
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack(">H", await reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack(">Q", await reader.readexactly(8))[0]
+            if length > MAX_CLIENT_PAYLOAD:
+                self.__logger.warning("CGServer client frame of %d bytes rejected, closing the connection", length)
+                writer.write(self.__encode(OPCODE_CLOSE, struct.pack(">H", CLOSE_TOO_BIG)))
+                await writer.drain()
+                return
+            mask = await reader.readexactly(4) if masked else None
+            payload = await reader.readexactly(length)
+            if mask is not None:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+            if opcode == OPCODE_CLOSE:
+                writer.write(self.__encode(OPCODE_CLOSE, payload[:2]))
+                await writer.drain()
+                return
+            elif opcode == OPCODE_PING:
+                writer.write(self.__encode(OPCODE_PONG, payload))
+                await writer.drain()
+
+    @staticmethod
+    def __encode(opcode : int, payload : bytes) -> bytes:
+        length = len(payload)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+        return header + payload
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
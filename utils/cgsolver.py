@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Moment based CG solver for any number of load cells
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import numpy as np
+
+WEIGHT_THRESHOLD = 5    # grams, below this total the plane is not on the gauges, and a gauge this much negative is faulty
+
+class CGSolver:
+    """Compute the CG from the weights measured by gauges at known positions
+
+    The CG is the weighted mean of the gauges positions: CG = (w . P) / sum(w), where w
+    is the vector of the weights and P the (N,2) matrix of the gauges positions in mm,
+    x from the wing leading edge and y from the roll axis (positive on the right wheel side).
+    It works for any layout: tail-dragger, tricycle, 4-point cradle, 6-cell rig...
+    """
+    def __init__(self, positions : dict[str, tuple[float,float]]):
+        """Constructor
+
+        Args:
+            positions (dict[str, tuple[float,float]]): the (x,y) position in mm of each gauge by name
+        """
+        if len(positions) == 0:
+            raise ValueError('At least one gauge position is needed')
+
+        self.__names = list(positions.keys())
+        self.__positions = np.array([positions[name] for name in self.__names], dtype=float).reshape(-1, 2)
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.__names)
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self.__positions.copy()
+
+    def weights_vector(self, weights : dict) -> np.ndarray:
+        """Order the weights as the gauges positions
+
+        Args:
+            weights (dict): the weights in grams by gauge name
+
+        Raises:
+            KeyError: if a gauge weight is missing
+
+        Returns:
+            np.ndarray: the weights vector
+        """
+        return np.fromiter((weights[name] for name in self.__names), dtype=float, count=len(self.__names))
+
+    def solve(self, weights : dict, threshold : float = WEIGHT_THRESHOLD) -> tuple[float,float]:
+        """Compute the CG of a reading
+
+        Args:
+            weights (dict): the weights in grams by gauge name
+            threshold (float, optional): minimum total weight in grams, a gauge may be unloaded
+                but not lighter than -threshold. Defaults to WEIGHT_THRESHOLD.
+
+        Raises:
+            ValueError: if the total weight is too close to 0, the plane is not on the gauges, or if a
+                weight is clearly negative
+
+        Returns:
+            tuple[float,float]: the CG (x,y) in mm
+        """
+        w = self.weights_vector(weights)
+        if abs(w.sum()) < threshold:
+            raise ValueError('Weights are too close to 0')
+        if np.any(w < -threshold):
+            raise ValueError('Weights are negative')
+
+        cg = (w @ self.__positions) / w.sum()
+        return (float(cg[0]), float(cg[1]))
+
+    def uncertainty(self, weights : dict, uncertainties : dict) -> tuple[float,float]:
+        """Propagate the uncertainties of the weights to the CG, the gauges being independent:
+        dCG/dw[i] = (P[i] - CG) / sum(w)
+
+        Args:
+            weights (dict): the weights in grams by gauge name
+            uncertainties (dict): the standard uncertainty of each weight in grams by gauge name
+
+        Returns:
+            tuple[float,float]: the standard uncertainty of the CG (x,y) in mm
+        """
+        w = self.weights_vector(weights)
+        u = self.weights_vector(uncertainties)
+        cg = (w @ self.__positions) / w.sum()
+        sensitivity = (self.__positions - cg) / w.sum()
+        ux, uy = np.sqrt((u ** 2) @ (sensitivity ** 2))
+        return (float(ux), float(uy))
+
+    def solve_many(self, weights : np.ndarray) -> np.ndarray:
+        """Compute the CG of many readings at once
+
+        Args:
+            weights (np.ndarray): (M,N) weights in grams, the columns ordered as the gauges names
+
+        Returns:
+            np.ndarray: (M,2) CG in mm, NaN for readings without weight
+        """
+        weights = np.asarray(weights, dtype=float)
+        total = weights.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(total != 0, (weights @ self.__positions) / total, np.nan)
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## A cached JSON config store with debounced, atomic persistence
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import os
+import json
+import copy
+import atexit
+import stat
+import logging
+import tempfile
+import threading
+from constants import APP_NAME
+
+DEFAULT_DELAY = 0.5     # seconds to wait before writing coalesced changes to disk
+JOURNAL_SUFFIX = ".journal"
+
+class ConfigStore:
+    """A JSON document cached in memory and written back to disk atomically.
+
+    Changes are coalesced: the first change schedules a write after `delay` seconds and
+    every other change done in the meantime is saved by the same write. The file is
+    replaced with a write-temp-and-rename so a power cut leaves either the old or the
+    new document, never a truncated one.
+    If `journal` is True, each change is also appended to `<filename>.journal` before
+    being acknowledged. The journal is replayed on load and truncated after each write.
+    """
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, filename : str, delay : float = DEFAULT_DELAY, journal : bool = False) -> 'ConfigStore':
+        """Get the store of a file, the same store is shared by all the callers
+
+        Args:
+            filename (str): the json file
+            delay (float, optional): the write delay in seconds. Defaults to DEFAULT_DELAY.
+            journal (bool, optional): True to keep an append-only change journal. Defaults to False.
+
+        Raises:
+            ValueError: if the journal is asked for a file whose store is already open without it
+
+        Returns:
+            ConfigStore: the store of the file
+        """
+        key = os.path.realpath(filename)
+        with cls._stores_lock:
+            if key not in cls._stores:
+                cls._stores[key] = ConfigStore(filename, delay, journal)
+            elif journal and not cls._stores[key].journaled:
+                # the changes already made are not in the journal, it cannot be started now
+                raise ValueError(f'Config store {filename} is already open without journal')
+            return cls._stores[key]
+
+    @classmethod
+    def flush_all(cls):
+        """Write all the pending changes of all the stores"""
+        with cls._stores_lock:
+            stores = list(cls._stores.values())
+        for store in stores:
+            store.flush()
+
+    def __init__(self, filename : str, delay : float = DEFAULT_DELAY, journal : bool = False):
+        """Constructor, prefer ConfigStore.open() to share the store between callers
+
+        Args:
+            filename (str): the json file
+            delay (float, optional): the write delay in seconds. Defaults to DEFAULT_DELAY.
+            journal (bool, optional): True to keep an append-only change journal. Defaults to False.
+        """
+        self.__filename = filename
+        self.__journal_file = filename + JOURNAL_SUFFIX if journal else None
+        self.__delay = delay
+        self.__document = None
+        self.__dirty = False
+        self.__timer = None
+        self.__lock = threading.RLock()
+        self.__logger = logging.getLogger(APP_NAME)
+
+    @property
+    def filename(self) -> str:
+        return self.__filename
+
+    @property
+    def journaled(self) -> bool:
+        return self.__journal_file is not None
+
+    @property
+    def loaded(self) -> bool:
+        return self.__document is not None
+
+    @property
+    def dirty(self) -> bool:
+        return self.__dirty
+
+    def load(self, reload : bool = False):
+        """Load the document from the file, once. The journal, if any, is replayed on top of it
+
+        Args:
+            reload (bool, optional): True to read the file again even if already cached. Defaults to False.
+
+        Raises:
+            FileNotFoundError: if the file does not exist
+
+        Returns:
+            the cached document
+        """
+        with self.__lock:
+            if self.__document is not None and not reload:
+                return self.__document
+
+            self.__logger.debug("Loading config store from file: %s", self.__filename)
+            with open(self.__filename, "r") as f:
+                self.__document = json.load(f)
+
+            if self.__replay_journal():
+                self.__write()
+
+            return self.__document
+
+    def get(self, *keys, default = None):
+        """Get a deep copy of a value of the document
+
+        Args:
+            keys: the path of the value in the document, no key returns the whole document
+            default (optional): the value returned if the path does not exist. Defaults to None.
+
+        Returns:
+            a copy of the value, so that it can be modified without altering the cache
+        """
+        with self.__lock:
+            node = self.load()
+            try:
+                for key in keys:
+                    node = node[key]
+            except (KeyError, IndexError, TypeError):
+                return default
+            return copy.deepcopy(node)
+
+    def set(self, keys : tuple, value):
+        """Set a value of the document and schedule the write
+
+        Args:
+            keys (tuple): the path of the value in the document, the last key is created if needed
+            value: the new json serializable value
+        """
+        if len(keys) == 0:
+            raise ValueError("A key path is needed, use replace() to change the whole document")
+
+        with self.__lock:
+            self.load()
+            self.__apply(list(keys), copy.deepcopy(value))
+            self.__append_journal(list(keys), value)
+            self.__schedule()
+
+    def replace(self, document):
+        """Replace the whole document and schedule the write
+
+        Args:
+            document: the new json serializable document
+        """
+        with self.__lock:
+            self.__document = copy.deepcopy(document)
+            self.__append_journal([], document)
+            self.__schedule()
+
+    def flush(self):
+        """Write the pending changes now"""
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            if self.__dirty:
+                self.__write()
+
+    ''' Private methods'''
+    def __apply(self, keys : list, value):
+        if len(keys) == 0:
+            self.__document = value
+            return
+
+        node = self.__document
+        for key in keys[:-1]:
+            node = node[key]
+        node[keys[-1]] = value
+
+    def __schedule(self):
+        self.__dirty = True
+        if self.__delay <= 0:
+            self.__write()
+        elif self.__timer is None:
+            self.__timer = threading.Timer(self.__delay, self.flush)
+            self.__timer.name = "ConfigStoreTimer"
+            self.__timer.daemon = True
+            self.__timer.start()
+
+    def __write(self):
+        directory = os.path.dirname(os.path.abspath(self.__filename))
+        fd, tmp_name = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+        try:
+            # keep the permissions of the file being replaced
+            mode = stat.S_IMODE(os.stat(self.__filename).st_mode) if os.path.exists(self.__filename) else 0o644
+            os.chmod(tmp_name, mode)
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.__document, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_name, self.__filename)
+            self.__fsync_directory(directory)
+        except BaseException as e:
+            self.__logger.error("Error writing config store %s: %s", self.__filename, str(e))
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise e
+
+        self.__dirty = False
+        self.__logger.debug("Config store saved: %s", self.__filename)
+        if self.__journal_file is not None and os.path.exists(self.__journal_file):
+            # everything in the journal is now in the file
+            open(self.__journal_file, "w").close()
+
+    def __fsync_directory(self, directory : str):
+        # make the rename durable, not available on every platform
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+
+    def __append_journal(self, keys : list, value):
+        if self.__journal_file is None:
+            return
+
+        with open(self.__journal_file, "a") as f:
+            f.write(json.dumps({"keys": keys, "value": value}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __replay_journal(self) -> bool:
+        if self.__journal_file is None or not os.path.exists(self.__journal_file):
+            return False
+
+        count = 0
+        with open(self.__journal_file, "r") as f:
+            for line in f:
+                try:
+                    change = json.loads(line)
+                    self.__apply(change["keys"], change["value"])
+                    count += 1
+                except (ValueError, KeyError, IndexError, TypeError):
+                    # the last line may be incomplete if the power went off while appending
+                    self.__logger.debug("Skipping invalid journal entry in %s", self.__journal_file)
+
+        if count > 0:
+            self.__logger.info("%d pending change(s) replayed from %s", count, self.__journal_file)
+        return count > 0
+
+atexit.register(ConfigStore.flush_all)
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -30,8 +30,16 @@ SOFTWARE.
 '''
 #SCREEN_COORDINATES = {'ORIGIN': ORIGIN, 'RWHEEL': RWHEEL, 'LWHEEL': LWHEEL, 'TWHEEL': TWHEEL, 'NOSE': NOSE}
 
+import numpy as np
+
 class CoordinateConverter:
-    """ Coordinate converter from mm to screen"""
+    """ Coordinate converter from mm to screen and back
+
+    The conversion is an affine transform: screen = A . mm + b. From the reference points, A scales
+    each axis and inverts the y axis (the screen y axis goes down), b is the screen origin. The inverse
+    is computed once when needed. Both directions accept a point (x, y) of scalars, a pair of arrays
+    (xs, ys), or an (N,2) array of points, converted in one vectorized call.
+    """
 
     def __init__(self, screen_coords : dict[int,int], mm_coords : dict[float,float]):
 
@@ -45,18 +53,70 @@ class CoordinateConverter:
         py = pixel_delta_y / mm_delta_y if mm_delta_y != 0 else 0
         self.pixel_spacing = (px, py)
         self.screen_origin = screen_coords['ORIGIN']
-        
-    def mm_to_screen(self, mm_point : tuple[float,float]):
+        # Y (mm) axis is inverted compared to screen y axis
+        self.set_affine(((px, 0.0), (0.0, -py)), self.screen_origin)
+
+    def set_affine(self, matrix : tuple[tuple[float,float],tuple[float,float]], offset : tuple[float,float]):
+        """Set the transform from mm to screen: screen = matrix . mm + offset
+
+        Args:
+            matrix (tuple[tuple[float,float],tuple[float,float]]): the 2x2 matrix, by rows
+            offset (tuple[float,float]): the screen position of the mm origin
+        """
+        (a, b), (c, d) = matrix
+        self.__forward = (float(a), float(b), float(c), float(d), float(offset[0]), float(offset[1]))
+        self.__inverse = None
+
+    @property
+    def affine(self) -> tuple[np.ndarray, np.ndarray]:
+        """The 2x2 matrix and the offset of the transform from mm to screen"""
+        a, b, c, d, e, f = self.__forward
+        return np.array([[a, b], [c, d]]), np.array([e, f])
+
+    def mm_to_screen(self, mm_point):
+        """Convert from mm to screen
+
+        Args:
+            mm_point: a point (x, y), a tuple of arrays (xs, ys) or an (N,2) array, in mm
+
+        Returns:
+            the screen coordinates in the same form, None if mm_point is None
+        """
         if mm_point is None:
             return None
-
-        mm_x, mm_y = mm_point
-        screen_x = (mm_x * self.pixel_spacing[0]) + self.screen_origin[0]
-        screen_y = (mm_y * self.pixel_spacing[1]) * (-1.0) + self.screen_origin[1] # Y (mm) axis is inverted compared to screen y axis
-        return (screen_x, screen_y)
+        return self.__apply(self.__forward, mm_point)
 
     def screen_to_mm(self, screen_point):
-        raise NotImplementedError
+        """Convert from screen to mm
+
+        Args:
+            screen_point: a point (x, y), a tuple of arrays (xs, ys) or an (N,2) array, in pixels
+
+        Raises:
+            ValueError: if the transform cannot be inverted, e.g. a plane without wheelbase
+
+        Returns:
+            the mm coordinates in the same form, None if screen_point is None
+        """
+        if screen_point is None:
+            return None
+        if self.__inverse is None:
+            a, b, c, d, e, f = self.__forward
+            det = a * d - b * c
+            if det == 0:
+                raise ValueError('The screen to mm conversion cannot be inverted')
+            ia, ib, ic, id = d / det, -b / det, -c / det, a / det
+            self.__inverse = (ia, ib, ic, id, -(ia * e + ib * f), -(ic * e + id * f))
+        return self.__apply(self.__inverse, screen_point)
+
+    @staticmethod
+    def __apply(transform : tuple, point):
+        a, b, c, d, e, f = transform
+        if isinstance(point, np.ndarray) and point.ndim >= 1 and point.shape[-1] == 2:
+            # (N,2) points, or a single point as an array
+            return point @ np.array([[a, c], [b, d]]) + np.array([e, f])
+        x, y = point
+        return (a * x + b * y + e, c * x + d * y + f)
 
 
 if __name__ == '__main__':
@@ -156,6 +156,19 @@ class RoundedRectangle(Drawing):
     def move_to(self, nw_point : tuple[int,int]):
         raise NotImplementedError("move_to method must be implemented")
 
+    def set_corners(self, nw_point : tuple[int,int], se_point : tuple[int,int]):
+        """Move the corners of the rectangle, the canvas item is kept
+
+        Args:
+            nw_point (tuple[int,int]): the new north west point
+            se_point (tuple[int,int]): the new south east point
+        """
+        self.nw_point = nw_point
+        self.se_point = se_point
+        if self.id is not None:
+            self.__update_rectangle_coords(nw_point[0] + X_CORRECTION, nw_point[1] + Y_CORRECTION,
+                                           se_point[0] + X_CORRECTION, se_point[1] + Y_CORRECTION)
+
     '''Private methods below'''    
     def __round_rectangle(self, x1, y1, x2, y2, radius, **kwargs):
 
@@ -187,5 +200,108 @@ class RoundedRectangle(Drawing):
         points = (x1+r, y1, x1+r, y1, x2-r, y1, x2-r, y1, x2, y1, x2, y1+r, x2, y1+r, x2, y2-r, x2, y2-r, x2, y2, x2-r, y2, x2-r, y2, x1+r, y2, x1+r, y2, x1, y2, x1, y2-r, x1, y2-r, x1, y1+r, x1, y1+r, x1, y1)
         self.canvas.coords(self.id, *points)
 
+class Polyline(Drawing):
+    """A single canvas line through many points, e.g. the CG trail, its points are changed in place"""
+    def __init__(self, canvas : tk.Canvas, color="white", width=1, dash=None):
+        """Constructor
+
+        Args:
+            canvas (tk.Canvas): canvas to draw on
+            color (str, optional): color of the line. Defaults to "white".
+            width (int, optional): width of the line. Defaults to 1.
+            dash (tuple, optional): the dash pattern, None for a solid line. Defaults to None.
+        """
+        super().__init__(canvas, color, width)
+        self.dash = dash
+
+    def draw(self):
+        """Create the line on the canvas, hidden until it has points"""
+        if self.canvas is not None:
+            self.id = self.canvas.create_line(0, 0, 0, 0, fill=self.color, width=self.width, dash=self.dash, state=tk.HIDDEN)
+        else :
+            self.id = None
+            raise Exception(f'Cannot draw polyline on canvas {self.canvas}')
+
+    def set_points(self, points):
+        """Change the points of the line, a line needs at least 2 points
+
+        Args:
+            points: the (N,2) screen points, an array or a list of (x,y)
+        """
+        if self.id is None:
+            return
+        if len(points) < 2:
+            self.hide()
+            return
+        self.canvas.coords(self.id, *[float(v) for point in points for v in (point[0] + X_CORRECTION, point[1] + Y_CORRECTION)])
+
+    def move_to(self, center : tuple[int,int]):
+        raise NotImplementedError("A polyline is moved with set_points")
+
+    def change_color(self, color):
+        if self.id is not None:
+            self.canvas.itemconfig(self.id, fill=color)
+
+class Marker(Drawing):
+    """A cross with a text above it, e.g. to show where to add ballast"""
+    def __init__(self, canvas : tk.Canvas, center : tuple[int,int], text : str = "", size = DEFAULT_RADIUS, color="orange", width=2):
+        """Constructor
+
+        Args:
+            canvas (tk.Canvas): canvas to draw on
+            center (tuple[int,int]): center of the cross
+            text (str, optional): the text above the cross. Defaults to "".
+            size (int, optional): half size of the cross. Defaults to constant DEFAULT_RADIUS.
+            color (str, optional): color of the cross and text. Defaults to "orange".
+            width (int, optional): width of the cross lines. Defaults to 2.
+        """
+        super().__init__(canvas, color, width)
+        self.center = center
+        self.text = text
+        self.size = size
+        self.__items = ()
+
+    def draw(self):
+        """Draw the marker on the canvas, its items share a tag used as the drawing id"""
+        if self.center is not None and self.canvas is not None:
+            self.id = f'marker{id(self)}'
+            line1 = self.canvas.create_line(0, 0, 0, 0, fill=self.color, width=self.width, tags=self.id)
+            line2 = self.canvas.create_line(0, 0, 0, 0, fill=self.color, width=self.width, tags=self.id)
+            label = self.canvas.create_text(0, 0, anchor="s", fill=self.color, font="{Arial} 9 {bold}", text=self.text, tags=self.id)
+            self.__items = (line1, line2, label)
+            self.move_to(self.center)
+        else :
+            self.id = None
+            raise Exception(f'Cannot draw marker with center {self.center} on canvas {self.canvas}')
+
+    def move_to(self, center : tuple[int,int]):
+        """Move the marker to a new center
+
+        Args:
+            center (tuple[int,int]): The new center
+        """
+        if center is not None and self.id is not None:
+            self.center = center
+            x = center[0] + X_CORRECTION
+            y = center[1] + Y_CORRECTION
+            s = self.size
+            self.canvas.coords(self.__items[0], x - s, y - s, x + s, y + s)
+            self.canvas.coords(self.__items[1], x - s, y + s, x + s, y - s)
+            self.canvas.coords(self.__items[2], x, y - s - 2)
+
+    def set_text(self, text : str):
+        """Change the text of the marker
+
+        Args:
+            text (str): The new text
+        """
+        if self.id is not None and text != self.text:
+            self.text = text
+            self.canvas.itemconfig(self.__items[2], text=text)
+
+    def change_color(self, color):
+        if self.id is not None:
+            self.canvas.itemconfig(self.id, fill=color)
+
 if __name__ == "__main__":
     raise Exception("This is a module, not a program. It should not be run directly.")
\ No newline at end of file
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Headless measurement mode: stream the CG meter readings without any display
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import abc
+import csv
+import json
+import logging
+import threading
+from constants import APP_NAME, APP_CG_FILENAME, DEFAULT_STATION
+from modules.cg_meter import CGMeter
+from modules.cg_frame import CGFrame
+from modules.cg_snapshot import SnapshotResult
+from utils.history import MeasurementHistory
+from utils.timing import PipelineTimer, STAGE_CG
+
+FORMATS = ('json', 'csv')
+
+class FrameWriter(abc.ABC):
+    """Base class to write the frames to a text stream"""
+    def __init__(self, stream):
+        self.stream = stream
+
+    @abc.abstractmethod
+    def write(self, frame : CGFrame):
+        """Write a frame of readings"""
+
+    @abc.abstractmethod
+    def write_snapshot(self, result : SnapshotResult):
+        """Write the result of a snapshot"""
+
+class JsonLinesWriter(FrameWriter):
+    """Write one json object per frame and per line"""
+    def write(self, frame : CGFrame):
+        self.stream.write(json.dumps(frame.to_dict()) + '\n')
+        self.stream.flush()
+
+    def write_snapshot(self, result : SnapshotResult):
+        self.stream.write(json.dumps(result.to_dict()) + '\n')
+        self.stream.flush()
+
+class CsvWriter(FrameWriter):
+    """Write one csv row per frame, the header is written with the first frame and again if the columns change"""
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.__writer = csv.writer(stream)
+        self.__header = None
+
+    def write(self, frame : CGFrame):
+        self.__write_row(frame.csv_header(), frame.to_csv_row())
+
+    def write_snapshot(self, result : SnapshotResult):
+        """Write the snapshot as a frame followed by the standard uncertainties of its total and CG"""
+        u = result.cg_uncertainty if result.cg_uncertainty is not None else ('', '')
+        self.__write_row(result.to_frame().csv_header() + ['total_u', 'cg_x_u', 'cg_y_u'],
+                         result.to_frame().to_csv_row() + [f'{result.total_uncertainty:.2f}'] +
+                         [f'{value:.2f}' if value != '' else '' for value in u])
+
+    def __write_row(self, header : list, row : list):
+        if header != self.__header:
+            self.__header = header
+            self.__writer.writerow(self.__header)
+        self.__writer.writerow(row)
+        self.stream.flush()
+
+class HeadlessRunner:
+    """Initialize the CG meter stations and stream their readings until stopped or enough frames are written"""
+    def __init__(self, stream, fmt : str = 'json', plane_name : str = None, tare : bool = False,
+                 rate : float = 0.0, readings : int = 6, count : int = 0, stations : list[tuple[str,str,str]] = None,
+                 history : MeasurementHistory = None, process : bool = False, snapshot : bool = False):
+        """Constructor
+
+        Args:
+            stream: the text stream to write to
+            fmt (str, optional): 'json' for json lines or 'csv'. Defaults to 'json'.
+            plane_name (str, optional): the plane on the gauges of the stations without plane, None for the first plane of the config file. Defaults to None.
+            tare (bool, optional): True to tare the gauges before reading. Defaults to False.
+            rate (float, optional): maximum frames per second, 0 for the full sensor rate. Defaults to 0.0.
+            readings (int, optional): number of samples averaged for each frame. Defaults to 6.
+            count (int, optional): number of frames to write, 0 to write until interrupted. Defaults to 0.
+            stations (list[tuple[str,str,str]], optional): (name, config file, plane name or None) of each station. Defaults to the default station.
+            history (MeasurementHistory, optional): the history where the accepted measurement of each station is recorded:
+                its last frame with a CG or its snapshot. Defaults to None.
+            process (bool, optional): True to read each station in a child process. Defaults to False.
+            snapshot (bool, optional): True to write a single snapshot of each station instead of streaming, see CGMeter.snapshot(). Defaults to False.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f'Unknown output format {fmt}, expected one of {FORMATS}')
+
+        self.__logger = logging.getLogger(APP_NAME)
+        self.__writer = JsonLinesWriter(stream) if fmt == 'json' else CsvWriter(stream)
+        self.__stations = stations if stations else [(DEFAULT_STATION, APP_CG_FILENAME, None)]
+        self.__plane_name = plane_name
+        self.__tare = tare
+        self.__period = 1.0 / rate if rate > 0 else 0.0
+        self.__readings = readings
+        self.__count = count
+        self.__history = history
+        self.__process = process
+        self.__snapshot = snapshot
+        self.__accepted = {}
+        self.__written = 0
+        self.__done = threading.Event()
+        self.__lock = threading.Lock()
+
+    def run(self) -> int:
+        """Run the measurement, blocking until done
+
+        Returns:
+            int: the number of frames written
+        """
+        meters = []
+        for name, configfile, plane_name in self.__stations:
+            meter = CGMeter(name)
+            planes = meter.plane_manager
+            planes.load()
+            plane_name = plane_name if plane_name is not None else self.__plane_name
+            if plane_name is not None:
+                planes.set_current_plane_by_name(plane_name)
+            self.__logger.info("Headless measurement on station %s for plane %s", name, planes.get_current_plane().name)
+
+            meter.initialize(configfile)
+            if self.__tare:
+                meter.tare()
+            meters.append(meter)
+
+        if self.__snapshot:
+            return self.__run_snapshots(meters)
+
+        self.__running = len(meters)
+        for meter in meters:
+            meter.start_reading(lambda weights, meter=meter: self.on_readings(meter, weights), self.__readings, self.__period,
+                                self.__process)
+        try:
+            self.__done.wait()
+        except KeyboardInterrupt:
+            self.__logger.info("Headless measurement interrupted")
+        finally:
+            for meter in meters:
+                meter.shutdown()
+            # only the accepted measurements are kept, as when the reading is stopped in the GUI
+            if self.__history is not None:
+                for meter in meters:
+                    frame = self.__accepted.get(meter.name)
+                    if frame is not None:
+                        self.__history.record(frame, ratios=meter.calibration_ratios())
+
+        return self.__written
+
+    def __run_snapshots(self, meters : list[CGMeter]) -> int:
+        # the stations are measured at the same time
+        snapshots = [(meter, meter.snapshot()) for meter in meters]
+        try:
+            for meter, snapshot in snapshots:
+                result = snapshot.wait()
+                if result is None:
+                    self.__logger.error("Snapshot of station %s failed: %s", meter.name, snapshot.error)
+                    continue
+                self.__writer.write_snapshot(result)
+                self.__written += 1
+                if self.__history is not None:
+                    self.__history.record(result.to_frame(), result.cg_uncertainty, meter.calibration_ratios())
+        except KeyboardInterrupt:
+            self.__logger.info("Headless snapshot interrupted")
+            for _, snapshot in snapshots:
+                snapshot.cancel()
+        finally:
+            for meter in meters:
+                meter.shutdown()
+
+        return self.__written
+
+    def on_readings(self, meter : CGMeter, weights : dict):
+        with self.__lock:
+            if weights is None:
+                self.__running -= 1
+                if self.__running <= 0:
+                    self.__done.set()
+                return
+
+            if self.__done.is_set():
+                return
+
+            timer = PipelineTimer()
+            start = timer.begin()
+            frame = CGFrame(weights, meter.plane_manager.get_current_plane(), station=meter.name,
+                            positions=meter.gauge_positions(), faults=meter.faults())
+            timer.end(STAGE_CG, start)
+            self.__writer.write(frame)
+            if frame.cg is not None:
+                self.__accepted[meter.name] = frame
+            self.__written += 1
+            if self.__count > 0 and self.__written >= self.__count:
+                self.__done.set()
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
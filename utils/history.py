@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## The measurements history, stored in a SQLite database
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import json
+import queue
+import sqlite3
+import logging
+import threading
+from constants import APP_NAME, APP_HISTORY_FILENAME
+from modules.cg_frame import CGFrame
+
+BATCH_SIZE = 100        # maximum measurements inserted in one transaction
+BATCH_INTERVAL = 1.0    # seconds to wait for more measurements before inserting
+QUEUE_SIZE = 10000      # measurements waiting to be written, the new ones are dropped above
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    station TEXT,
+    plane TEXT,
+    total REAL,
+    cg_x REAL,
+    cg_y REAL,
+    cg_x_std REAL,
+    cg_y_std REAL,
+    weights TEXT,
+    ratios TEXT
+);
+CREATE INDEX IF NOT EXISTS measurements_plane_time ON measurements (plane, time);
+CREATE INDEX IF NOT EXISTS measurements_time ON measurements (time);
+"""
+
+class MeasurementHistory:
+    """Store the accepted measurements and query them by plane and time
+
+    record() only queues the measurement: a background thread inserts them by batches,
+    so recording never blocks the reading loop.
+    """
+    def __init__(self, filename : str = APP_HISTORY_FILENAME):
+        """Constructor
+
+        Args:
+            filename (str, optional): the SQLite database file. Defaults to APP_HISTORY_FILENAME.
+        """
+        self.__logger = logging.getLogger(APP_NAME)
+        self.__filename = filename
+        self.__queue = queue.Queue(QUEUE_SIZE)
+        self.__thread = None
+        self.__query_lock = threading.Lock()
+        self.__query_connection = None
+        connection = self.__connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+    def start(self):
+        """Start the writer thread"""
+        if self.__thread is None:
+            self.__thread = threading.Thread(name='HistoryWriterThread', target=self.__write, daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        """Write the queued measurements and stop the writer thread"""
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+
+    def record(self, frame : CGFrame, uncertainty : tuple[float,float] = None, ratios : dict = None) -> bool:
+        """Queue a measurement to be stored, never blocks
+
+        Args:
+            frame (CGFrame): the measurement
+            uncertainty (tuple[float,float], optional): the standard deviation of the CG (x,y) in mm. Defaults to None.
+            ratios (dict, optional): the calibration ratio of each gauge. Defaults to None.
+
+        Returns:
+            bool: False if the measurement is dropped because the queue is full
+        """
+        cg = frame.cg if frame.cg is not None else (None, None)
+        std = uncertainty if uncertainty is not None else (None, None)
+        row = (frame.timestamp, frame.station, frame.plane, frame.total, cg[0], cg[1], std[0], std[1],
+               json.dumps(frame.weights), json.dumps(ratios) if ratios is not None else None)
+        try:
+            self.__queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.__logger.warning("History queue is full, measurement dropped")
+            return False
+
+    def cg_trend(self, plane : str, since : float = None, until : float = None) -> list[tuple]:
+        """Get the CG of a plane over time
+
+        Args:
+            plane (str): the plane name
+            since (float, optional): start time in seconds since epoch. Defaults to None.
+            until (float, optional): end time in seconds since epoch. Defaults to None.
+
+        Returns:
+            list[tuple]: (time, total, cg_x, cg_y, cg_x_std, cg_y_std) ordered by time
+        """
+        return self.__query("SELECT time, total, cg_x, cg_y, cg_x_std, cg_y_std FROM measurements", plane, since, until)
+
+    def measurements(self, plane : str, since : float = None, until : float = None, limit : int = None) -> list[dict]:
+        """Get the measurements of a plane
+
+        Args:
+            plane (str): the plane name
+            since (float, optional): start time in seconds since epoch. Defaults to None.
+            until (float, optional): end time in seconds since epoch. Defaults to None.
+            limit (int, optional): maximum number of measurements, the most recent ones. Defaults to None.
+
+        Returns:
+            list[dict]: the measurements ordered by time
+        """
+        rows = self.__query("SELECT time, station, plane, total, cg_x, cg_y, cg_x_std, cg_y_std, weights, ratios FROM measurements",
+                            plane, since, until, limit)
+        result = []
+        for row in rows:
+            result.append({
+                'time': row[0], 'station': row[1], 'plane': row[2], 'total': row[3],
+                'cg': [row[4], row[5]] if row[4] is not None else None,
+                'uncertainty': [row[6], row[7]] if row[6] is not None else None,
+                'weights': json.loads(row[8]) if row[8] is not None else None,
+                'ratios': json.loads(row[9]) if row[9] is not None else None
+            })
+        return result
+
+    def planes(self) -> list[str]:
+        """Get the names of the planes having measurements"""
+        with self.__query_lock:
+            connection = self.__get_query_connection()
+            return [row[0] for row in connection.execute("SELECT DISTINCT plane FROM measurements WHERE plane IS NOT NULL ORDER BY plane")]
+
+    ''' Private methods'''
+    def __connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.__filename, check_same_thread=False)
+        # readers do not wait for the writer
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def __get_query_connection(self) -> sqlite3.Connection:
+        if self.__query_connection is None:
+            self.__query_connection = self.__connect()
+        return self.__query_connection
+
+    def __query(self, select : str, plane : str, since : float, until : float, limit : int = None) -> list[tuple]:
+        sql = select + " WHERE plane = ?"
+        args = [plane]
+        if since is not None:
+            sql += " AND time >= ?"
+            args.append(since)
+        if until is not None:
+            sql += " AND time <= ?"
+            args.append(until)
+        if limit is not None:
+            # the most recent ones, then back in time order
+            sql = f'SELECT * FROM ({sql} ORDER BY time DESC LIMIT ?) ORDER BY time'
+            args.append(limit)
+        else:
+            sql += " ORDER BY time"
+
+        with self.__query_lock:
+            return self.__get_query_connection().execute(sql, args).fetchall()
+
+    def __write(self):
+        self.__logger.debug("History writer thread started")
+        connection = self.__connect()
+        running = True
+        while running:
+            rows = []
+            try:
+                row = self.__queue.get(timeout=BATCH_INTERVAL)
+                while row is not None:
+                    rows.append(row)
+                    if len(rows) >= BATCH_SIZE:
+                        break
+                    row = self.__queue.get(timeout=BATCH_INTERVAL)
+                running = row is not None
+            except queue.Empty:
+                pass
+
+            if len(rows) > 0:
+                try:
+                    with connection:
+                        connection.executemany("INSERT INTO measurements (time, station, plane, total, cg_x, cg_y, cg_x_std, cg_y_std, weights, ratios) "
+                                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                except sqlite3.Error as e:
+                    self.__logger.error("Error writing %d measurement(s) to history: %s", len(rows), str(e))
+
+        connection.close()
+        self.__logger.debug("History writer thread stopped")
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## A cache of the planes top view images, decoded once and scaled for each window
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import os
+import logging
+import threading
+import tkinter as tk
+from fractions import Fraction
+from collections import OrderedDict
+from constants import APP_NAME, APP_ROOT_FOLDER, APP_CONFIG_DIR
+
+# the generic silhouettes drawn for each window size, used for the planes without image
+DEFAULT_IMAGES = {
+    (800, 400): os.path.join(APP_ROOT_FOLDER, "gui", "top_view_800.png"),
+    (500, 211): os.path.join(APP_ROOT_FOLDER, "gui", "top_view_450.png")
+}
+MAX_PIXELS = 4_000_000      # pixels kept in the cache, about 16 MB of RGBA images
+MAX_SCALE_TERMS = 8         # largest zoom/subsample factors used to scale without PIL
+
+class ImageCache:
+    """The top view images by file and target size, the least recently used ones are dropped
+    above MAX_PIXELS. The images are Tk PhotoImage, the cache must be used from the Tk thread only
+    """
+    _instance = None
+    def  __new__(cls):
+        if not cls._instance:
+            cls._instance = super(ImageCache, cls).__new__(cls)
+            cls._instance.__images = OrderedDict()
+            cls._instance.__pixels = 0
+            cls._instance.__lock = threading.Lock()
+            cls._instance.__logger = logging.getLogger(APP_NAME)
+        return cls._instance
+
+    def __init__(self):
+        """Nothing to do here, the singleton is already initialized and this method is instance called"""
+        pass
+
+    def __len__(self) -> int:
+        return len(self.__images)
+
+    @property
+    def pixels(self) -> int:
+        """The pixels of all the cached images"""
+        return self.__pixels
+
+    def image_file(self, plane = None, size : tuple[int,int] = (800, 400)) -> str:
+        """The image file of a plane: its own image, else the silhouette of the size, else the largest one
+
+        Args:
+            plane (Plane, optional): the plane, None for the generic silhouette. Defaults to None.
+            size (tuple[int,int], optional): the target size. Defaults to (800, 400).
+
+        Returns:
+            str: the image file name
+        """
+        image = getattr(plane, 'image', None)
+        if image:
+            # relative to the config folder, as planes.json
+            return image if os.path.isabs(image) else os.path.join(APP_ROOT_FOLDER, APP_CONFIG_DIR, image)
+        return DEFAULT_IMAGES.get(tuple(size), DEFAULT_IMAGES[max(DEFAULT_IMAGES)])
+
+    def get(self, plane = None, size : tuple[int,int] = (800, 400)) -> tk.PhotoImage:
+        """Get the image of a plane scaled to fit in a size, keeping its aspect ratio
+
+        Args:
+            plane (Plane, optional): the plane, None for the generic silhouette. Defaults to None.
+            size (tuple[int,int], optional): the target size. Defaults to (800, 400).
+
+        Returns:
+            tk.PhotoImage: the image, shared by all the callers
+        """
+        filename = self.image_file(plane, size)
+        try:
+            return self.__get(filename, tuple(size))
+        except (tk.TclError, OSError) as e:
+            if filename in DEFAULT_IMAGES.values():
+                raise e
+            self.__logger.error("Error loading image %s: %s", filename, e)
+            return self.__get(self.image_file(None, size), tuple(size))
+
+    def preload(self, planes : list, size : tuple[int,int] = (800, 400)):
+        """Decode and scale the images of planes in advance, e.g. to switch planes instantly"""
+        for plane in planes:
+            self.get(plane, size)
+
+    def clear(self):
+        with self.__lock:
+            self.__images.clear()
+            self.__pixels = 0
+
+    ''' Private methods'''
+    def __get(self, filename : str, size : tuple[int,int]) -> tk.PhotoImage:
+        key = (filename, size)
+        with self.__lock:
+            if key in self.__images:
+                self.__images.move_to_end(key)
+                return self.__images[key]
+
+        source = self.__source(filename)
+        image = self.__scale(filename, source, size)
+        self.__store(key, image)
+        return image
+
+    def __source(self, filename : str) -> tk.PhotoImage:
+        # the decoded file, cached too as all the sizes are scaled from it
+        key = (filename, None)
+        with self.__lock:
+            if key in self.__images:
+                self.__images.move_to_end(key)
+                return self.__images[key]
+
+        self.__logger.debug("Decoding image %s", filename)
+        try:
+            # Tk 8.6 decodes png natively, much faster to import than PIL
+            image = tk.PhotoImage(file=filename)
+        except tk.TclError:
+            from PIL import ImageTk
+            image = ImageTk.PhotoImage(file=filename)
+        self.__store(key, image)
+        return image
+
+    def __scale(self, filename : str, source : tk.PhotoImage, size : tuple[int,int]) -> tk.PhotoImage:
+        width, height = source.width(), source.height()
+        ratio = min(size[0] / width, size[1] / height)
+        if (width, height) == size or abs(ratio - 1.0) < 0.01:
+            return source
+
+        target = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+        try:
+            from PIL import Image, ImageTk
+            with Image.open(filename) as picture:
+                return ImageTk.PhotoImage(picture.resize(target, Image.LANCZOS))
+        except ImportError:
+            # without PIL, Tk scales by integer factors: zoom then subsample by the closest fraction
+            fraction = Fraction(ratio).limit_denominator(MAX_SCALE_TERMS)
+            image = source.zoom(fraction.numerator) if fraction.numerator > 1 else source
+            return image.subsample(fraction.denominator) if fraction.denominator > 1 else image
+
+    def __store(self, key : tuple, image : tk.PhotoImage):
+        with self.__lock:
+            if key in self.__images:
+                return
+            # an image already at the target size is the decoded one, it is counted once
+            if not any(cached is image for cached in self.__images.values()):
+                self.__pixels += image.width() * image.height()
+            self.__images[key] = image
+            # the least recently used images are dropped, the new one is always kept
+            while self.__pixels > MAX_PIXELS and len(self.__images) > 1:
+                _, dropped = self.__images.popitem(last=False)
+                if not any(cached is dropped for cached in self.__images.values()):
+                    self.__pixels -= dropped.width() * dropped.height()
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
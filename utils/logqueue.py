@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Non-blocking logging: records are queued and written by a dedicated thread
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import copy
+import time
+import queue
+import logging
+import logging.handlers
+import threading
+
+QUEUE_SIZE = 10000      # records waiting to be written, the new ones are dropped above
+RATE_BURST = 10         # records allowed from one logging call in a rate period
+RATE_PERIOD = 10.0      # seconds of a rate period
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `burst` records by logging call (file and line) in each period
+
+    A hot path failing at each sample would otherwise flood the log. The count of
+    the suppressed records is appended to the next record let through.
+    """
+    def __init__(self, burst : int = RATE_BURST, period : float = RATE_PERIOD):
+        super().__init__()
+        self.__burst = burst
+        self.__period = period
+        self.__calls = {}
+        self.__lock = threading.Lock()
+
+    def filter(self, record : logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.__lock:
+            start, count, suppressed = self.__calls.get(key, (now, 0, 0))
+            if now - start >= self.__period:
+                start, count = now, 0
+            count += 1
+            if count > self.__burst:
+                self.__calls[key] = (start, count, suppressed + 1)
+                return False
+            self.__calls[key] = (start, count, 0)
+
+        if suppressed > 0:
+            record.msg = f'{record.msg} [{suppressed} similar message(s) suppressed]'
+        return True
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue the records with their message merged, they are formatted by the writer thread
+
+    The records are dropped when the queue is full instead of blocking the caller.
+    """
+    def __init__(self, log_queue : queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record : logging.LogRecord) -> logging.LogRecord:
+        # the message is merged in the calling thread as logging.handlers.QueueHandler does, the args
+        # may change before the writer thread gets the record and the traceback would keep its frames
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record : logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class QueueLogging:
+    """Move the writing of the log records of a logger to a dedicated thread"""
+    def __init__(self, logger : logging.Logger, handlers : list[logging.Handler], size : int = QUEUE_SIZE, rate_limit : bool = True):
+        """Constructor
+
+        Args:
+            logger (logging.Logger): the logger, its records are queued
+            handlers (list[logging.Handler]): the handlers writing the records, in the writer thread
+            size (int, optional): maximum number of records waiting to be written. Defaults to QUEUE_SIZE.
+            rate_limit (bool, optional): True to limit the records of each logging call, see RateLimitFilter. Defaults to True.
+        """
+        self.__logger = logger
+        self.__handler = NonBlockingQueueHandler(queue.Queue(size))
+        if rate_limit:
+            self.__handler.addFilter(RateLimitFilter())
+        self.__listener = logging.handlers.QueueListener(self.__handler.queue, *handlers, respect_handler_level=True)
+
+    @property
+    def dropped(self) -> int:
+        """Number of records dropped because the queue was full"""
+        return self.__handler.dropped
+
+    def start(self):
+        self.__logger.addHandler(self.__handler)
+        self.__listener.start()
+
+    def stop(self):
+        """Write the queued records and stop the writer thread"""
+        self.__logger.removeHandler(self.__handler)
+        self.__listener.stop()
+        if self.__handler.dropped > 0:
+            # the listener is stopped, the handlers are called directly
+            record = self.__logger.makeRecord(self.__logger.name, logging.WARNING, __file__, 0,
+                                              "%d log record(s) dropped, the log queue was full", (self.__handler.dropped,), None)
+            self.__listener.handle(record)
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -29,15 +29,19 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
-import json
 import logging
 import inspect
-from constants import APP_NAME, APP_PLANES_FILENAME, SCREEN_COORDINATES
+from constants import APP_NAME, APP_PLANES_FILENAME, SCREEN_COORDINATES, DEFAULT_STATION, NOSE
 from utils.converter import CoordinateConverter
+from utils.cgsolver import CGSolver
+from utils.ballast import BallastSolver, BALLAST_MARGIN
+from utils.configstore import ConfigStore
+from utils.planematcher import PlaneMatcher, MAX_SIGNATURES
 
 class Plane(CoordinateConverter):
     """A plane and it's configuration"""
-    def __init__(self, name:str, wheelbase:int, wheeltrack:int, edge2mainwheels:int, edge2cgxrange:tuple[int,int], origin2cgyrange:tuple[int,int]):
+    def __init__(self, name:str, wheelbase:int, wheeltrack:int, edge2mainwheels:int, edge2cgxrange:tuple[int,int], origin2cgyrange:tuple[int,int], gauges:dict[str,tuple[float,float]] = None,
+                 ballast:dict[str,tuple[float,float]] = None, image:str = None):
         """Constructor
 
         Args:
@@ -47,6 +51,9 @@ class Plane(CoordinateConverter):
             edge2cgxrange (tuple): The range of the X distance from the leading edge to the center of gravity in mm
             origin2cgyrange (tuple): The range of the Y distance from the origin to the center of gravity in mm
             edge2mainwheels (int): The distance from the leading edge to the main wheels in mm
+            gauges (dict, optional): The (x,y) position in mm of each gauge by name, for other layouts than the 3 wheels tail-dragger. Defaults to None.
+            ballast (dict, optional): The (x,y) position in mm of each place where ballast can be added, by name. Defaults to None for the nose, tail and wing tips.
+            image (str, optional): The top view image file of the plane, relative to the config folder. Defaults to None for the generic silhouette.
         """
         self.__name = name
         self.wheelbase = wheelbase
@@ -54,12 +61,26 @@ class Plane(CoordinateConverter):
         self.edge2mainwheels = edge2mainwheels
         self.edge2cgxrange = edge2cgxrange
         self.origin2cgyrange = origin2cgyrange
+        self.gauges = gauges
+        self.ballast = ballast
+        self.image = image
+        self.__solver = None
+        self.__solver_positions = None
+        self.__ballast_solver = None
         super().__init__(SCREEN_COORDINATES, self.plane_coordinates)
 
 
     def to_dict(self) -> dict:
-        data = vars(self).copy()
-        exclude_var = ['pixel_spacing', 'screen_origin']
+        data = {'name': self.__name}
+        data.update(vars(self))
+        exclude_var = ['_Plane__name', '_Plane__solver', '_Plane__solver_positions', '_Plane__ballast_solver', 'pixel_spacing', 'screen_origin',
+                       '_CoordinateConverter__forward', '_CoordinateConverter__inverse']
+        if self.gauges is None:
+            exclude_var.append('gauges')
+        if self.ballast is None:
+            exclude_var.append('ballast')
+        if self.image is None:
+            exclude_var.append('image')
         for var in exclude_var:
             if var in data:
                 del data[var]
@@ -89,6 +110,76 @@ class Plane(CoordinateConverter):
     def twheelpos(self) -> tuple[float,float]:
         return (self.edge2mainwheels + self.wheelbase, 0)
 
+    @property
+    def gauge_positions(self) -> dict[str, tuple[float,float]]:
+        """The position of each gauge: the configured gauges if any, else the 3 wheels of a tail-dragger"""
+        if self.gauges:
+            return {name: tuple(position) for name, position in self.gauges.items()}
+
+        return {
+            'RightWheel': self.rwheelpos,
+            'LeftWheel': self.lwheelpos,
+            'TailWheel': self.twheelpos
+        }
+
+    def solver(self, positions : dict[str, tuple[float,float]] = None) -> CGSolver:
+        """Get the CG solver of the plane, it is built once and kept while the gauges positions are the same
+
+        Args:
+            positions (dict[str, tuple[float,float]], optional): the gauges positions, None for gauge_positions. Defaults to None.
+
+        Returns:
+            CGSolver: the solver
+        """
+        positions = positions if positions else self.gauge_positions
+        if self.__solver is None or positions != self.__solver_positions:
+            self.__solver = CGSolver(positions)
+            self.__solver_positions = positions
+        return self.__solver
+
+    @property
+    def ballast_locations(self) -> dict[str, tuple[float,float]]:
+        """The places where ballast can be added: the configured ones if any, else the nose as on the sketch,
+        the tail wheel and the wing tips at 3 wheeltracks from the roll axis"""
+        if self.ballast:
+            return {name: tuple(position) for name, position in self.ballast.items()}
+
+        try:
+            nose = self.screen_to_mm(NOSE)[0]
+        except ValueError:
+            nose = -self.wheelbase / 3
+        middle = (self.edge2cgxrange[0] + self.edge2cgxrange[1]) / 2
+        return {
+            'Nose': (nose, 0),
+            'Tail': self.twheelpos,
+            'RightWingTip': (middle, 3 * self.wheeltrack),
+            'LeftWingTip': (middle, -3 * self.wheeltrack)
+        }
+
+    def ballast_solver(self) -> BallastSolver:
+        """Get the ballast solver of the plane, built once"""
+        if self.__ballast_solver is None:
+            self.__ballast_solver = BallastSolver(self.ballast_locations)
+        return self.__ballast_solver
+
+    def ballast_needed(self, weights : dict, positions : dict[str, tuple[float,float]] = None,
+                       margin : float = BALLAST_MARGIN, cg : tuple[float,float] = None) -> tuple[str, float]:
+        """The lightest ballast bringing the CG of a reading in the CG ranges
+
+        Args:
+            weights (dict): the weights of the gauges
+            positions (dict, optional): the (x,y) position in mm of each gauge, None for the plane gauge_positions. Defaults to None.
+            margin (float, optional): the distance in mm to keep inside the ranges. Defaults to BALLAST_MARGIN.
+            cg (tuple[float,float], optional): the CG of the reading if already computed, e.g. by CGFrame. Defaults to None.
+
+        Returns:
+            tuple[str, float]: the ballast location name and its mass in grams, None if the CG is in the ranges
+            or cannot be brought in them. Raise an exception if the CG cannot be computed
+        """
+        if cg is None:
+            cg = self.solver(positions).solve(weights)
+        return self.ballast_solver().best(sum(weights.values()), cg, self.cgx_range, self.cgy_range, margin)
+
     @property
     def plane_coordinates(self) -> dict[str, tuple[float,float]]:
         return {
@@ -122,42 +213,24 @@ class Plane(CoordinateConverter):
             return 'white'
 
 
-    def plane_cg_by_weigth(self, weights : dict) -> tuple[int,int]:
+    def plane_cg_by_weigth(self, weights : dict, positions : dict[str, tuple[float,float]] = None) -> tuple[int,int]:
         """Compute the plane center of gravity in relation to main wing leading edge and the roll axis
 
         Args:
-            weights (dict): list of the weights of the wheels
+            weights (dict): list of the weights of the gauges
+            positions (dict, optional): the (x,y) position in mm of each gauge, None for the plane gauge_positions. Defaults to None.
 
         Returns:
             (int,int): the center of gravity position (x,y) in mm from the leading edge and roll axis, raise an exception if error
         """
-        # compute the center of gravity
-        # CG(x) = d + (L*wT)/Wtot. Positive means that CG is in front of the leading edge
-        # d = distance from the leading edge to the main wheels, negative if the main wheels are in front the leading edge
-        # L = wheelbase
-        # wT = weight of the tail wheel
-        # Wtot = total weight of the plane
+        # the center of gravity is the mean of the gauges positions weighted by their weights
+        # CG = sum(w[i] * pos[i]) / Wtot
+        # For the 3 wheels tail-dragger, this is the same as:
+        # CG(x) = d + (L*wT)/Wtot. Positive means that CG is behind the leading edge
         # CG(y) = (E / 2*Wtot) * (wR - wL). Positive means that CG is near the right wheel
-        # E = wheeltrack
-        # wR = weight of the right wheel
-        # wL = weight of the left wheel
-        # Wtot = total weight of the plane
+        # d = distance from the leading edge to the main wheels, L = wheelbase, E = wheeltrack
         try:
-            wR = weights['RightWheel']
-            wL = weights['LeftWheel']
-            wT = weights['TailWheel']
-            Wtot = wR + wL + wT
-
-            # test if weights are close to 0, if yes the raise exception
-            threshold = 5
-            if abs(Wtot) < threshold or abs(wR) < threshold or abs(wL) < threshold or abs(wT) < threshold:
-                raise ValueError('Weights are too close to 0')
-
-            d = self.edge2mainwheels
-            L = self.wheelbase
-            E = self.wheeltrack
-            x = d + (L*wT)/Wtot
-            y = (E / (2*Wtot)) * (wR - wL)
+            x, y = self.solver(positions).solve(weights)
             return (int(round(x)),int(round(y)))
 
         except BaseException as e:
@@ -167,37 +240,45 @@ class Plane(CoordinateConverter):
         return f'Plane {self.__name} has wheelbase {self.wheelbase} mm, wheeltrack {self.wheeltrack} mm, edge2mainwheels {self.edge2mainwheels} mm, edge2cgX {self.edge2cgxrange} mm, origin2cgY {self.origin2cgyrange} mm'
 
 class PlaneManager:
-    """The plane manager class, it is a singleton
+    """The plane manager class, there is one instance by CG meter station.
+    PlaneManager() is the default station one, PlaneManager('name') creates or gets another one.
+    All the stations share the same planes file but each has its own current plane
     """
-    _instance = None
-    def  __new__(cls):
-        if not cls._instance:
-            cls._instance = super(PlaneManager, cls).__new__(cls)
-            cls._instance.__planes = []
-            cls._instance.__configfile = APP_PLANES_FILENAME
-            cls._instance.__current_plane = None
-            cls._instance.__logger = logging.getLogger(APP_NAME)
-        return cls._instance
-
-    def __init__(self):
-        """Nothing to do here, the singleton is already initialized and this method is instance called"""
+    _instances = {}
+    def  __new__(cls, station : str = DEFAULT_STATION):
+        if station not in cls._instances:
+            instance = super(PlaneManager, cls).__new__(cls)
+            instance.__planes = []
+            instance.__configfile = APP_PLANES_FILENAME
+            instance.__current_plane = None
+            instance.__matcher = PlaneMatcher()
+            instance.__logger = logging.getLogger(APP_NAME)
+            cls._instances[station] = instance
+        return cls._instances[station]
+
+    def __init__(self, station : str = DEFAULT_STATION):
+        """Nothing to do here, the instance is already initialized and this method is instance called"""
         pass
 
+    @classmethod
+    def stations(cls) -> list[str]:
+        """The names of the stations having a plane manager"""
+        return list(cls._instances.keys())
+
     def skip_key(self,key):
-        if key in ['pixel_spacing', 'screen_origin']:
+        if key in ['pixel_spacing', 'screen_origin', '_CoordinateConverter__forward', '_CoordinateConverter__inverse']:
             return True
         
         return False
         
     def __to_json(self, filename:str):
-        with open(filename, 'w') as f:
-            json.dump(self.__planes, f, default=lambda o: o.to_dict(), indent=4)
+        ConfigStore.open(filename).replace([p.to_dict() for p in self.__planes])
 
     def __from_json(self, filename:str):
         try:
-            with open(filename, 'r') as f:
-                self.__planes = json.load(f, object_hook=lambda d: Plane(**d))
-                return True
+            data = ConfigStore.open(filename).get()
+            self.__planes = [Plane(**d) for d in data]
+            return True
         except FileNotFoundError:
             self.__logger.error(f'File {filename} not found')
             return False
@@ -272,6 +353,60 @@ class PlaneManager:
         else:
             raise ValueError(f'Plane {name} not found')
 
+    def load_signatures(self, history) -> int:
+        """Build the load signatures of the planes from their past measurements, to recognize them
+
+        Args:
+            history (MeasurementHistory): the measurements history
+
+        Returns:
+            int: the number of planes with a signature
+        """
+        self.__matcher.clear()
+        names = set(self.get_planes_names_list())
+        for plane in history.planes():
+            if plane in names:
+                for measurement in history.measurements(plane, limit=MAX_SIGNATURES):
+                    if measurement['weights']:
+                        self.__matcher.add(plane, measurement['weights'], rebuild=False)
+        self.__matcher.rebuild()
+        self.__logger.debug("%d plane signature(s) loaded", len(self.__matcher))
+        return len(self.__matcher)
+
+    def add_signature(self, name : str, weights : dict):
+        """Add a measurement to the load signature of a plane
+
+        Args:
+            name (str): the plane name
+            weights (dict): the measured weights in grams by gauge name
+        """
+        self.__matcher.add(name, weights)
+
+    def recognize_planes(self, weights : dict, count : int = 3) -> list[tuple[Plane, float]]:
+        """The planes whose load signature is the closest to a reading, see PlaneMatcher.match()
+
+        Args:
+            weights (dict): the weights in grams by gauge name
+            count (int, optional): the maximum number of planes. Defaults to 3.
+
+        Returns:
+            list[tuple[Plane, float]]: the planes and their signature distance, closest first
+        """
+        planes = {p.name: p for p in self.__planes}
+        return [(planes[name], distance) for name, distance in self.__matcher.match(weights, count) if name in planes]
+
+    def propose_plane(self, weights : dict):
+        """The most likely plane on the gauges
+
+        Args:
+            weights (dict): the weights in grams by gauge name
+
+        Returns:
+            Plane: the plane, None if no signature is close enough
+        """
+        matches = self.recognize_planes(weights, 1)
+        return matches[0][0] if len(matches) > 0 else None
+
     def save(self):
         """Save the planes manager list to the config json file
         """
@@ -288,7 +423,7 @@ class PlaneManager:
         if result:
             self.__current_plane = self.__planes[0]
         else:
-            self.__current_plane = Plane('Default', 0, 0, 0, 0, (0,0), (0,0))
+            self.__current_plane = Plane('Default', 0, 0, 0, (0,0), (0,0))
             self.__planes.append(self.__current_plane)
             self.save()
 
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Recognize the plane on the gauges from its load signature
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import numpy as np
+
+TOTAL_SCALE = 0.03      # relative difference of the total weight counting as 1 in the signature distance
+RATIO_SCALE = 0.02      # difference of the load ratio of a gauge counting as 1 in the signature distance
+MATCH_DISTANCE = 3.0    # largest distance of a plausible match
+MIN_TOTAL = 50.0        # grams, below this there is no plane on the gauges
+MAX_SIGNATURES = 20     # most recent measurements of a plane averaged in its signature
+
+class PlaneMatcher:
+    """A nearest neighbour index of the planes load signatures
+
+    The signature of a reading is the log of its total weight and the share of the total on each gauge,
+    scaled so that a distance of 1 is a 3% heavier plane or 2% of the load moved from a gauge to another.
+    The signature of a plane is the median of its past measurements signatures. The planes are sorted
+    by their log total weight: only the ones in the total weight window of a match are compared, so a
+    query costs a binary search and a few vector distances even with thousands of planes.
+    """
+    def __init__(self, max_distance : float = MATCH_DISTANCE):
+        """Constructor
+
+        Args:
+            max_distance (float, optional): the largest distance of a plausible match. Defaults to MATCH_DISTANCE.
+        """
+        self.__max_distance = max_distance
+        # the measurements signatures by gauges layout, then by plane
+        self.__measurements = {}
+        # the index by gauges layout: (planes names, signatures sorted by their first column)
+        self.__index = {}
+
+    @staticmethod
+    def signature(weights : dict) -> tuple[tuple[str, ...], np.ndarray]:
+        """The signature of a reading
+
+        Args:
+            weights (dict): the weights in grams by gauge name
+
+        Raises:
+            ValueError: if the total weight is below MIN_TOTAL
+
+        Returns:
+            tuple[tuple[str, ...], np.ndarray]: the sorted gauges names and the scaled signature
+        """
+        names = tuple(sorted(weights))
+        w = np.fromiter((weights[name] for name in names), dtype=float, count=len(names))
+        total = w.sum()
+        if total < MIN_TOTAL:
+            raise ValueError('No plane on the gauges')
+        return names, np.concatenate(([np.log(total) / TOTAL_SCALE], w / total / RATIO_SCALE))
+
+    def __len__(self) -> int:
+        return sum(len(planes) for planes, _ in self.__index.values())
+
+    def clear(self):
+        self.__measurements = {}
+        self.__index = {}
+
+    def add(self, plane : str, weights : dict, rebuild : bool = True):
+        """Add a measurement to the signature of a plane, only the MAX_SIGNATURES most recent ones are kept
+
+        Args:
+            plane (str): the plane name
+            weights (dict): the measured weights in grams by gauge name
+            rebuild (bool, optional): False to add many measurements and rebuild() once. Defaults to True.
+        """
+        try:
+            names, signature = self.signature(weights)
+        except ValueError:
+            return
+        signatures = self.__measurements.setdefault(names, {}).setdefault(plane, [])
+        signatures.append(signature)
+        del signatures[:-MAX_SIGNATURES]
+        if rebuild:
+            self.rebuild(names)
+
+    def rebuild(self, layout : tuple[str, ...] = None):
+        """Build the index of the planes signatures
+
+        Args:
+            layout (tuple[str, ...], optional): the sorted gauges names to rebuild, None for all. Defaults to None.
+        """
+        for names in ([layout] if layout is not None else list(self.__measurements)):
+            planes = self.__measurements.get(names, {})
+            if len(planes) == 0:
+                self.__index.pop(names, None)
+                continue
+            plane_names = np.array(list(planes.keys()))
+            signatures = np.array([np.median(planes[plane], axis=0) for plane in plane_names])
+            order = np.argsort(signatures[:, 0])
+            self.__index[names] = (plane_names[order], signatures[order])
+
+    def match(self, weights : dict, count : int = 3) -> list[tuple[str, float]]:
+        """The planes whose signature is the closest to a reading
+
+        Args:
+            weights (dict): the weights in grams by gauge name
+            count (int, optional): the maximum number of planes. Defaults to 3.
+
+        Returns:
+            list[tuple[str, float]]: the plane names and their signature distance, closest first,
+            only the plausible ones (distance below the max distance)
+        """
+        try:
+            names, query = self.signature(weights)
+        except ValueError:
+            return []
+        if names not in self.__index:
+            return []
+
+        plane_names, signatures = self.__index[names]
+        # the total weight alone rules out the planes outside the window
+        low, high = np.searchsorted(signatures[:, 0], (query[0] - self.__max_distance, query[0] + self.__max_distance))
+        if low >= high:
+            return []
+        distances = np.sqrt(np.sum((signatures[low:high] - query) ** 2, axis=1))
+        count = min(count, high - low)
+        nearest = np.argpartition(distances, count - 1)[:count]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [(str(plane_names[low + i]), float(distances[i])) for i in nearest if distances[i] <= self.__max_distance]
+
+    def best(self, weights : dict) -> str:
+        """The most likely plane on the gauges
+
+        Args:
+            weights (dict): the weights in grams by gauge name
+
+        Returns:
+            str: the plane name, None if no signature is close enough
+        """
+        matches = self.match(weights, 1)
+        return matches[0][0] if len(matches) > 0 else None
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Spectral analysis of the gauges weights, to find the vibrations disturbing a bench
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import time
+import threading
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.capture import iter_capture
+
+DEFAULT_SEGMENT = 256       # samples by Welch segment, the frequency resolution is rate / segment
+DEFAULT_OVERLAP = 0.5       # overlap of the Welch segments
+PEAK_RATIO = 10.0           # a peak is at least 10 times (10 dB) above the noise floor
+MAX_PEAKS = 5               # dominant frequencies reported by gauge
+MIN_FREQUENCY = 0.2         # Hz, slower changes are the load itself or a drift, not a vibration
+MIN_CUTOFF = 0.2            # Hz, the lowest cutoff suggested
+
+class WelchPSD:
+    """The power spectral density of a stream of samples, averaged over Hann windowed segments (Welch method).
+    The samples are added by blocks of any size, only the end of the last incomplete segment is kept"""
+    def __init__(self, rate : float, segment : int = DEFAULT_SEGMENT, overlap : float = DEFAULT_OVERLAP):
+        """Constructor
+
+        Args:
+            rate (float): the sample rate in Hz
+            segment (int, optional): the samples by segment. Defaults to DEFAULT_SEGMENT.
+            overlap (float, optional): the overlap of the segments, from 0 to 0.9. Defaults to DEFAULT_OVERLAP.
+        """
+        if rate <= 0:
+            raise ValueError(f'Invalid sample rate {rate} Hz')
+        self.__rate = rate
+        self.__segment = max(8, int(segment))
+        self.__step = max(1, int(round(self.__segment * (1.0 - min(max(overlap, 0.0), 0.9)))))
+        self.__window = np.hanning(self.__segment)
+        # one-sided density in unit²/Hz, the DC and Nyquist bins are not doubled
+        self.__scale = np.full(self.__segment // 2 + 1, 2.0 / (rate * np.sum(self.__window ** 2)))
+        self.__scale[0] /= 2.0
+        if self.__segment % 2 == 0:
+            self.__scale[-1] /= 2.0
+        self.reset()
+
+    def reset(self):
+        self.__pending = np.empty(0)
+        self.__power = np.zeros(self.__segment // 2 + 1)
+        self.__segments = 0
+        self.__samples = 0
+
+    @property
+    def rate(self) -> float:
+        return self.__rate
+
+    @property
+    def segments(self) -> int:
+        """Number of segments averaged so far, 0 until `segment` samples are added"""
+        return self.__segments
+
+    @property
+    def samples(self) -> int:
+        return self.__samples
+
+    @property
+    def frequencies(self) -> np.ndarray:
+        return np.fft.rfftfreq(self.__segment, 1.0 / self.__rate)
+
+    @property
+    def psd(self) -> np.ndarray:
+        """The averaged density in unit²/Hz by frequency, zeros if no segment is complete"""
+        return self.__power / max(1, self.__segments)
+
+    def add(self, block : np.ndarray):
+        """Add samples to the stream
+
+        Args:
+            block (np.ndarray): the next samples
+        """
+        block = np.asarray(block, dtype=float)
+        self.__samples += len(block)
+        data = np.concatenate((self.__pending, block))
+        if len(data) < self.__segment:
+            self.__pending = data
+            return
+
+        segments = sliding_window_view(data, self.__segment)[::self.__step]
+        # each segment is detrended by its mean, the static load would hide the vibrations
+        segments = (segments - segments.mean(axis=1, keepdims=True)) * self.__window
+        spectrum = np.fft.rfft(segments, axis=1)
+        self.__power += np.sum(np.abs(spectrum) ** 2, axis=0) * self.__scale
+        self.__segments += len(segments)
+        self.__pending = data[len(segments) * self.__step:]
+
+class SpectrumAnalyser:
+    """The Welch PSD of each gauge of a station, fed with captures chunks or live readings"""
+    def __init__(self, rate : float, segment : int = DEFAULT_SEGMENT, overlap : float = DEFAULT_OVERLAP):
+        self.__rate = rate
+        self.__segment = segment
+        self.__overlap = overlap
+        self.__gauges = {}
+
+    @property
+    def rate(self) -> float:
+        return self.__rate
+
+    @property
+    def gauges(self) -> dict[str, WelchPSD]:
+        return dict(self.__gauges)
+
+    def add(self, weights : dict[str, np.ndarray]):
+        """Add samples of the gauges
+
+        Args:
+            weights (dict[str, np.ndarray]): the weights in grams by gauge name
+        """
+        for name, serie in weights.items():
+            if name not in self.__gauges:
+                self.__gauges[name] = WelchPSD(self.__rate, self.__segment, self.__overlap)
+            self.__gauges[name].add(serie)
+
+    def report(self) -> dict[str, dict]:
+        """The analysis of each gauge, see analyse_psd()"""
+        return {name: analyse_psd(psd.frequencies, psd.psd, psd.segments)
+                for name, psd in self.__gauges.items()}
+
+def analyse_psd(frequencies : np.ndarray, psd : np.ndarray, segments : int = 1) -> dict:
+    """Find the dominant disturbances of a spectrum and suggest a filter for them
+
+    Args:
+        frequencies (np.ndarray): the frequency of each bin in Hz
+        psd (np.ndarray): the density in g²/Hz of each bin
+        segments (int, optional): the number of averaged segments, reported for the confidence. Defaults to 1.
+
+    Returns:
+        dict: 'segments', 'resolution_hz', 'rms_g' the total noise without the static load,
+        'noise_floor_g' the noise of the median density over the whole band, 'peaks' a list of
+        {'frequency_hz', 'amplitude_g' (rms), 'snr_db'} by decreasing amplitude, and 'filter' a
+        suggested "filter" entry of the module in cgconfig.json, see cg_filter.FilterChain
+    """
+    resolution = frequencies[1] - frequencies[0]
+    rate = 2.0 * frequencies[-1]
+    band = frequencies >= max(MIN_FREQUENCY, resolution)
+    floor = float(np.median(psd[band])) if np.any(band) else 0.0
+
+    peaks = []
+    if floor > 0 and len(psd) > 2:
+        # local maxima well above the floor
+        candidates = np.flatnonzero((psd[1:-1] > psd[:-2]) & (psd[1:-1] >= psd[2:]) & (psd[1:-1] > PEAK_RATIO * floor)) + 1
+        candidates = candidates[band[candidates]]
+        for index in candidates:
+            # the Hann window spreads a sine over 3 bins
+            power = np.sum(psd[index - 1:index + 2]) * resolution
+            # parabolic interpolation of the log density, finer than the resolution
+            left, center, right = np.log(psd[index - 1:index + 2] + 1e-30)
+            curvature = left - 2.0 * center + right
+            shift = 0.5 * (left - right) / curvature if curvature < 0 else 0.0
+            peaks.append({'frequency_hz': float(frequencies[index] + shift * resolution),
+                          'amplitude_g': float(np.sqrt(power)),
+                          'snr_db': float(10.0 * np.log10(psd[index] / floor))})
+        peaks.sort(key=lambda peak: peak['amplitude_g'], reverse=True)
+        peaks = peaks[:MAX_PEAKS]
+
+    return {'segments': segments,
+            'resolution_hz': float(resolution),
+            'rms_g': float(np.sqrt(np.sum(psd[1:]) * resolution)),
+            'noise_floor_g': float(np.sqrt(floor * rate / 2.0)),
+            'peaks': peaks,
+            'filter': suggest_filter(rate, [peak['frequency_hz'] for peak in peaks])}
+
+def suggest_filter(rate : float, disturbances : list[float]) -> dict:
+    """A filter chain attenuating the disturbances: a low-pass at half the lowest one,
+    after a decimation keeping the output rate at least 4 times the cutoff
+
+    Args:
+        rate (float): the sample rate in Hz
+        disturbances (list[float]): the frequencies to remove in Hz
+
+    Returns:
+        dict: the "filter" entry of a module in cgconfig.json
+    """
+    cutoff = min(disturbances) / 2.0 if len(disturbances) > 0 else rate / 10.0
+    cutoff = float(min(max(cutoff, MIN_CUTOFF), rate / 4.0))
+    decimation = max(1, int(rate / (4.0 * cutoff)))
+    return {'rate': round(float(rate), 1), 'decimation': decimation, 'order': 2 if decimation > 1 else 1,
+            'cutoff': round(cutoff, 2)}
+
+def estimate_rate(times : np.ndarray) -> float:
+    """The sample rate of timestamped samples, from the median interval to ignore the gaps
+
+    Raises:
+        ValueError: if there are not enough increasing timestamps
+    """
+    intervals = np.diff(times)
+    intervals = intervals[intervals > 0]
+    if len(intervals) == 0:
+        raise ValueError('Not enough timestamps to estimate the sample rate')
+    return float(1.0 / np.median(intervals))
+
+def analyse_capture(filename : str, segment : int = DEFAULT_SEGMENT, rate : float = None,
+                    chunk_size : int = 65536) -> tuple[float, dict[str, dict]]:
+    """Analyse a capture of the headless mode by chunks, in bounded memory whatever its length
+
+    Args:
+        filename (str): the capture file, see capture.iter_capture()
+        segment (int, optional): the samples by Welch segment. Defaults to DEFAULT_SEGMENT.
+        rate (float, optional): the sample rate in Hz, None to estimate it from the first chunk. Defaults to None.
+        chunk_size (int, optional): the samples by chunk. Defaults to 65536.
+
+    Returns:
+        tuple[float, dict[str, dict]]: the sample rate and the analysis of each gauge, see analyse_psd()
+    """
+    analyser = None
+    for times, weights in iter_capture(filename, chunk_size):
+        if analyser is None:
+            analyser = SpectrumAnalyser(rate or estimate_rate(times), segment)
+        analyser.add(weights)
+    if analyser is None:
+        raise ValueError(f'The capture {filename} is empty')
+    return analyser.rate, analyser.report()
+
+def capture_live(meter, duration : float) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """Record a window of weights from a CGMeter. If the meter is not reading, it is read
+    sample by sample at full rate during the window, otherwise its readings are recorded as they come
+
+    Args:
+        meter (CGMeter): the initialized meter
+        duration (float): the window in seconds
+
+    Returns:
+        tuple[np.ndarray, dict[str, np.ndarray]]: the times in seconds and the weights in grams by gauge name
+    """
+    times = []
+    frames = []
+    lock = threading.Lock()
+
+    def on_readings(weights : dict):
+        if weights is not None:
+            with lock:
+                times.append(time.monotonic())
+                frames.append(weights)
+
+    if meter.reading:
+        meter.add_listener(on_readings)
+        try:
+            time.sleep(duration)
+        finally:
+            meter.remove_listener(on_readings)
+    else:
+        meter.start_reading(on_readings, readings=1, period=0.0)
+        try:
+            time.sleep(duration)
+        finally:
+            meter.stop_reading(wait=True)
+
+    with lock:
+        names = frames[0].keys() if len(frames) > 0 else []
+        return np.array(times), {name: np.array([frame.get(name, np.nan) for frame in frames]) for name in names}
+
+def analyse_live(meter, duration : float, segment : int = DEFAULT_SEGMENT) -> tuple[float, dict[str, dict]]:
+    """Analyse a live window of a CGMeter, see capture_live() and analyse_psd()"""
+    times, weights = capture_live(meter, duration)
+    if len(times) < segment:
+        raise ValueError(f'Only {len(times)} readings in {duration} s, at least {segment} are needed')
+    analyser = SpectrumAnalyser(estimate_rate(times), segment)
+    analyser.add(weights)
+    return analyser.rate, analyser.report()
+
+def format_report(rate : float, report : dict[str, dict]) -> str:
+    """The analysis as text, one paragraph by gauge"""
+    lines = [f'Sample rate {rate:.2f} Hz']
+    for name, gauge in report.items():
+        lines.append(f'{name}: rms {gauge["rms_g"]:.3f} g, noise floor {gauge["noise_floor_g"]:.3f} g '
+                     f'({gauge["segments"]} segments, {gauge["resolution_hz"]:.3f} Hz resolution)')
+        for peak in gauge['peaks']:
+            lines.append(f'  {peak["frequency_hz"]:7.3f} Hz  {peak["amplitude_g"]:.3f} g rms  {peak["snr_db"]:.1f} dB')
+        if len(gauge['peaks']) == 0:
+            lines.append('  no dominant disturbance')
+        lines.append(f'  suggested filter: {gauge["filter"]}')
+    return '\n'.join(lines)
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
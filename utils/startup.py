@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Startup timing breakdown
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import time
+import logging
+from constants import APP_NAME
+
+class StartupTimer:
+    """Record the startup stages of the application, it is a singleton
+
+    The first instantiation is the reference time, so it should be done as soon as possible.
+    """
+    _instance = None
+    def  __new__(cls):
+        if not cls._instance:
+            cls._instance = super(StartupTimer, cls).__new__(cls)
+            cls._instance.__start = time.perf_counter()
+            cls._instance.__boot_time = StartupTimer.__since_boot()
+            cls._instance.__marks = []
+            cls._instance.__logger = logging.getLogger(APP_NAME)
+        return cls._instance
+
+    def __init__(self):
+        """Nothing to do here, the singleton is already initialized and this method is instance called"""
+        pass
+
+    @staticmethod
+    def __since_boot() -> float:
+        # time elapsed since power-on, only available on linux
+        try:
+            return time.clock_gettime(time.CLOCK_BOOTTIME)
+        except (AttributeError, OSError):
+            return None
+
+    def mark(self, stage : str):
+        """Record the end of a startup stage
+
+        Args:
+            stage (str): the name of the stage
+        """
+        self.__marks.append((stage, time.perf_counter()))
+
+    def breakdown(self) -> list[tuple[str,float,float]]:
+        """Get the startup breakdown
+
+        Returns:
+            list[tuple[str,float,float]]: (stage, duration of the stage, elapsed since start) in milliseconds
+        """
+        result = []
+        previous = self.__start
+        for stage, stamp in self.__marks:
+            result.append((stage, (stamp - previous) * 1000.0, (stamp - self.__start) * 1000.0))
+            previous = stamp
+        return result
+
+    def log(self):
+        """Log the startup breakdown"""
+        if self.__boot_time is not None:
+            self.__logger.info("Startup: process started %.1f s after power-on", self.__boot_time)
+        for stage, duration, elapsed in self.breakdown():
+            self.__logger.info("Startup: %-24s %8.1f ms (at %8.1f ms)", stage, duration, elapsed)
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## Hot path timing of the measurement pipeline stages
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import time
+import bisect
+import logging
+import threading
+from constants import APP_NAME
+
+# the pipeline stages
+STAGE_READ = "read"           # one HX711 sample clocked out
+STAGE_FILTER = "filter"       # the samples of a frame averaged
+STAGE_CG = "cg"               # the CG computed from the weights
+STAGE_DISPLAY = "display"     # the UI updated with a frame, CG included
+STAGE_FRAME = "frame"         # a frame dispatched to its consumer, from the acquisition thread
+
+# upper bounds in seconds of the histogram buckets, 10 per decade from 1 µs to 10 s
+BUCKET_BOUNDS = [10 ** (exponent / 10) for exponent in range(-60, 11)]
+
+class Histogram:
+    """Durations counted in fixed buckets, recording is O(log buckets) and the memory is constant"""
+    def __init__(self):
+        self.__counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.__count = 0
+        self.__total = 0.0
+        self.__max = 0.0
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    def record(self, seconds : float):
+        self.__counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.__count += 1
+        self.__total += seconds
+        if seconds > self.__max:
+            self.__max = seconds
+
+    def percentile(self, p : float) -> float:
+        """Get a percentile, as the upper bound of its bucket
+
+        Args:
+            p (float): the percentile, from 0 to 100
+
+        Returns:
+            float: the duration in seconds, 0 if nothing is recorded
+        """
+        if self.__count == 0:
+            return 0.0
+        rank = p / 100.0 * self.__count
+        cumulated = 0
+        for index, count in enumerate(self.__counts):
+            cumulated += count
+            if cumulated >= rank and count > 0:
+                return min(BUCKET_BOUNDS[index], self.__max) if index < len(BUCKET_BOUNDS) else self.__max
+        return self.__max
+
+    def summary(self) -> dict:
+        """Get the count, mean, p50, p95, p99 and max, the durations in milliseconds"""
+        return {
+            'count': self.__count,
+            'mean_ms': self.__total / self.__count * 1000.0 if self.__count > 0 else 0.0,
+            'p50_ms': self.percentile(50) * 1000.0,
+            'p95_ms': self.percentile(95) * 1000.0,
+            'p99_ms': self.percentile(99) * 1000.0,
+            'max_ms': self.__max * 1000.0
+        }
+
+class PipelineTimer:
+    """Record the duration of the measurement pipeline stages in histograms, it is a singleton
+
+    Instrumented code does:
+        start = PipelineTimer().begin()
+        ... the stage ...
+        PipelineTimer().end(STAGE_READ, start)
+
+    When disabled, begin() returns None and end() returns at once, so the timing can stay in production code.
+    """
+    _instance = None
+    def  __new__(cls):
+        if not cls._instance:
+            cls._instance = super(PipelineTimer, cls).__new__(cls)
+            cls._instance.__enabled = False
+            cls._instance.__histograms = {}
+            cls._instance.__lock = threading.Lock()
+            cls._instance.__report_timer = None
+            cls._instance.__report_period = 0
+            cls._instance.__logger = logging.getLogger(APP_NAME)
+        return cls._instance
+
+    def __init__(self):
+        """Nothing to do here, the singleton is already initialized and this method is instance called"""
+        pass
+
+    @property
+    def enabled(self) -> bool:
+        return self.__enabled
+
+    @enabled.setter
+    def enabled(self, value : bool):
+        self.__enabled = value
+
+    def begin(self) -> float:
+        """Start timing a stage
+
+        Returns:
+            float: the start time, None if the timing is disabled
+        """
+        return time.perf_counter() if self.__enabled else None
+
+    def end(self, stage : str, start : float):
+        """Record the duration of a stage
+
+        Args:
+            stage (str): the stage name
+            start (float): the value returned by begin()
+        """
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        with self.__lock:
+            histogram = self.__histograms.get(stage)
+            if histogram is None:
+                histogram = self.__histograms[stage] = Histogram()
+            histogram.record(duration)
+
+    def percentiles(self, stage : str) -> tuple[float,float,float]:
+        """Get the p50, p95 and p99 of a stage
+
+        Args:
+            stage (str): the stage name
+
+        Returns:
+            tuple[float,float,float]: the p50, p95 and p99 in milliseconds, zeros if the stage is not recorded
+        """
+        with self.__lock:
+            histogram = self.__histograms.get(stage)
+            if histogram is None:
+                return (0.0, 0.0, 0.0)
+            return tuple(histogram.percentile(p) * 1000.0 for p in (50, 95, 99))
+
+    def summary(self) -> dict[str, dict]:
+        """Get the summary of every recorded stage, see Histogram.summary()"""
+        with self.__lock:
+            return {stage: histogram.summary() for stage, histogram in self.__histograms.items()}
+
+    def reset(self):
+        """Forget the recorded durations"""
+        with self.__lock:
+            self.__histograms = {}
+
+    def text(self) -> str:
+        """Short text of the p50/p95/p99 by stage, for an on-screen overlay"""
+        lines = []
+        for stage, summary in self.summary().items():
+            lines.append(f"{stage:<8}{summary['p50_ms']:7.2f}{summary['p95_ms']:7.2f}{summary['p99_ms']:7.2f} ms")
+        return "\n".join(lines)
+
+    def log(self):
+        """Log the summary of every recorded stage"""
+        for stage, summary in self.summary().items():
+            self.__logger.info("Timing: %-8s n=%-7d p50=%.3f ms p95=%.3f ms p99=%.3f ms max=%.3f ms", stage,
+                               summary['count'], summary['p50_ms'], summary['p95_ms'], summary['p99_ms'], summary['max_ms'])
+
+    def start_reporting(self, period : float):
+        """Enable the timing and log its summary periodically
+
+        Args:
+            period (float): seconds between two logs
+        """
+        self.__enabled = True
+        self.__report_period = period
+        self.__schedule_report()
+
+    def stop_reporting(self):
+        """Stop the periodic logs, the timing stays enabled"""
+        self.__report_period = 0
+        if self.__report_timer is not None:
+            self.__report_timer.cancel()
+            self.__report_timer = None
+
+    ''' Private methods'''
+    def __schedule_report(self):
+        if self.__report_period > 0:
+            self.__report_timer = threading.Timer(self.__report_period, self.__report)
+            self.__report_timer.daemon = True
+            self.__report_timer.start()
+
+    def __report(self):
+        self.log()
+        self.__schedule_report()
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
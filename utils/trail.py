@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+'''
+## A bounded history of the CG positions, downsampled to draw it at a constant cost
+
+Author: Wilfried Grousson
+Created Date: 2023/03/02
+------------------------------------
+MIT License
+
+Copyright (c) 2023 WG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import numpy as np
+
+TRAIL_CAPACITY = 3000   # CG positions kept, 5 minutes at 10 readings per second
+TRAIL_POINTS = 200      # points drawn at most
+
+class RingBuffer:
+    """A fixed capacity buffer of points, the oldest ones are overwritten"""
+    def __init__(self, capacity : int = TRAIL_CAPACITY, dimensions : int = 2):
+        """Constructor
+
+        Args:
+            capacity (int, optional): the number of points kept. Defaults to TRAIL_CAPACITY.
+            dimensions (int, optional): the coordinates of each point. Defaults to 2.
+        """
+        self.__data = np.zeros((max(1, capacity), dimensions))
+        self.__next = 0
+        self.__count = 0
+
+    def __len__(self) -> int:
+        return self.__count
+
+    @property
+    def capacity(self) -> int:
+        return len(self.__data)
+
+    def clear(self):
+        self.__next = 0
+        self.__count = 0
+
+    def append(self, point : tuple):
+        self.__data[self.__next] = point
+        self.__next = (self.__next + 1) % len(self.__data)
+        self.__count = min(self.__count + 1, len(self.__data))
+
+    def values(self) -> np.ndarray:
+        """The points from the oldest to the most recent one, as a new (N, dimensions) array"""
+        if self.__count < len(self.__data):
+            return self.__data[:self.__count].copy()
+        return np.roll(self.__data, -self.__next, axis=0)
+
+    def last(self) -> np.ndarray:
+        """The most recent point, None if empty"""
+        return self.__data[self.__next - 1].copy() if self.__count > 0 else None
+
+def lttb(points : np.ndarray, threshold : int = TRAIL_POINTS) -> np.ndarray:
+    """Downsample a path with the Largest Triangle Three Buckets algorithm
+
+    The path is split into buckets in its order, the first and last points are kept and in each bucket
+    the point forming the largest triangle with the point kept in the previous bucket and the mean of
+    the next bucket is kept. The turns of the path are preserved, unlike a plain decimation. As the
+    path is a CG trajectory, the triangles are measured in the (x,y) plane instead of against time.
+
+    Args:
+        points (np.ndarray): the (N,2) path
+        threshold (int, optional): the number of points kept. Defaults to TRAIL_POINTS.
+
+    Returns:
+        np.ndarray: the (M,2) downsampled path, M = min(N, threshold)
+    """
+    points = np.asarray(points, dtype=float)
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return points
+
+    # the bucket boundaries of the inner points, the first and last points are buckets of their own
+    edges = np.linspace(1, count - 1, threshold - 1).astype(int)
+    # the mean of each bucket, the target of the previous bucket triangles
+    sums = np.concatenate(([[0.0, 0.0]], np.cumsum(points, axis=0)))
+    means = (sums[edges[1:]] - sums[edges[:-1]]) / np.maximum(edges[1:] - edges[:-1], 1)[:, None]
+    means = np.vstack((means[1:], points[-1:]))
+
+    result = np.empty((threshold, 2))
+    result[0] = points[0]
+    result[-1] = points[-1]
+    previous = points[0]
+    for bucket in range(threshold - 2):
+        candidates = points[edges[bucket]:edges[bucket + 1]]
+        if len(candidates) == 0:
+            result[bucket + 1] = previous
+            continue
+        target = means[bucket]
+        # twice the triangle areas, the cross product of the two sides
+        areas = np.abs((previous[0] - target[0]) * (candidates[:, 1] - previous[1]) -
+                       (previous[0] - candidates[:, 0]) * (target[1] - previous[1]))
+        previous = candidates[np.argmax(areas)]
+        result[bucket + 1] = previous
+    return result
+
+if __name__ == "__main__":
+    raise Exception("This is a module, not a program. It should not be run directly.")
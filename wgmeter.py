@@ -31,12 +31,17 @@ SOFTWARE.
 '''
 
 import os
+import sys
+import argparse
 import logging
 import logging.handlers
 
 ''' Personal imports '''
-from constants import APP_NAME, LOG_LEVEL, LOG_CONSOLE, APP_VERSION, EMULATE_HX711
-from gui.cgmainapp import CGMainApp
+from utils.startup import StartupTimer
+StartupTimer()  # the reference time of the startup breakdown
+from constants import APP_NAME, LOG_LEVEL, LOG_CONSOLE, APP_VERSION, EMULATE_HX711, DEFAULT_STATION, TIMING_ENABLED, TIMING_PERIOD, ACQUISITION_PROCESS
+from utils.timing import PipelineTimer
+from utils.logqueue import QueueLogging
 
 '''GPIO import'''
 if not EMULATE_HX711:
@@ -46,14 +51,15 @@ if not EMULATE_HX711:
 export DISPLAY=:0;
 '''
 
-def __init_logging():
+def __init_logging() -> tuple[logging.Logger, QueueLogging]:
         logger = logging.getLogger(APP_NAME)
         logger.setLevel(LOG_LEVEL)
+        handlers = []
         if LOG_CONSOLE:
             stream_handler = logging.StreamHandler()
             stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s|%(module)s - %(levelname)s - %(message)s'))
             stream_handler.setLevel(LOG_LEVEL)
-            logger.addHandler(stream_handler)
+            handlers.append(stream_handler)
 
         log_file = os.path.join(os.path.realpath(os.path.dirname(__file__)), "log")
         if not os.path.exists(log_file):
@@ -64,25 +70,143 @@ def __init_logging():
         file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s|%(module)s - %(levelname)s - %(message)s'))
         file_handler.setLevel(LOG_LEVEL)
         file_handler.doRollover() if needRoll else None
-        logger.addHandler(file_handler)
- 
-        return logger
+        handlers.append(file_handler)
+
+        # the handlers run in a writer thread, a slow SD card does not stall the acquisition
+        log_queue = QueueLogging(logger, handlers)
+        log_queue.start()
+        return logger, log_queue
+
+def __parse_arguments():
+    parser = argparse.ArgumentParser(prog="wgmeter", description=APP_NAME + " v" + APP_VERSION)
+    parser.add_argument("--headless", action="store_true", help="stream the readings without display")
+    parser.add_argument("--plane", default=None, help="plane on the gauges, default is the first plane of the config file")
+    parser.add_argument("--tare", action="store_true", help="tare the gauges before reading")
+    parser.add_argument("--format", choices=["json", "csv"], default="json", help="output format, json lines or csv")
+    parser.add_argument("--output", default=None, help="output file, default is the standard output")
+    parser.add_argument("--rate", type=float, default=0.0, help="maximum frames per second, 0 for the full sensor rate")
+    parser.add_argument("--readings", type=int, default=6, help="number of samples averaged for each frame")
+    parser.add_argument("--count", type=int, default=0, help="number of frames to write, 0 to write until interrupted")
+    parser.add_argument("--snapshot", action="store_true", help="write a single snapshot of each station, with its uncertainty, and exit")
+    parser.add_argument("--record", action="store_true", help="record the last frame with a CG, or the snapshot, in the measurements history")
+    parser.add_argument("--station", action="append", default=None, metavar="NAME=CONFIG[,PLANE]",
+                        help="a station to read in headless mode, can be repeated, default is the station of config/cgconfig.json")
+    parser.add_argument("--serve", nargs="?", const="127.0.0.1:8765", default=None, metavar="HOST:PORT",
+                        help="broadcast the readings over WebSocket/HTTP, default is 127.0.0.1:8765")
+    parser.add_argument("--process", action="store_true", default=ACQUISITION_PROCESS,
+                        help="read the gauges in a child process in headless mode")
+    parser.add_argument("--timing", action="store_true", help="time the measurement pipeline stages and log their percentiles")
+    parser.add_argument("--spectrum", nargs="?", const="live", default=None, metavar="CAPTURE",
+                        help="analyse the vibrations of a capture of the headless mode, or of the gauges if no capture is given")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of live readings analysed by --spectrum")
+    parser.add_argument("--segment", type=int, default=256, help="samples by Welch segment of --spectrum, the resolution is rate/segment")
+    return parser.parse_args()
+
+def __parse_stations(args) -> list[tuple[str,str,str]]:
+    stations = []
+    for station in args.station or []:
+        name, _, rest = station.partition("=")
+        configfile, _, plane = rest.partition(",")
+        if not name or not configfile:
+            raise ValueError(f'Invalid station {station}, expected NAME=CONFIG[,PLANE]')
+        stations.append((name, configfile, plane or None))
+    return stations
+
+def __run_headless(args, logger):
+    # no tkinter nor PIL on this path
+    from utils.headless import HeadlessRunner
+    from utils.history import MeasurementHistory
+    from modules.cg_meter import CGMeter
+    stream = open(args.output, "w", newline="") if args.output is not None else sys.stdout
+    history = MeasurementHistory() if args.record else None
+    try:
+        if history is not None:
+            history.start()
+        runner = HeadlessRunner(stream, args.format, args.plane, args.tare, args.rate, args.readings,
+                                args.count, __parse_stations(args), history, args.process, args.snapshot)
+        written = runner.run()
+        logger.info("%d frame(s) written", written)
+    finally:
+        CGMeter.shutdown_all()
+        if history is not None:
+            history.stop()
+        if stream is not sys.stdout:
+            stream.close()
+
+def __run_spectrum(args, logger):
+    # no tkinter nor PIL on this path
+    from utils.spectrum import analyse_capture, analyse_live, format_report
+    if args.spectrum == "live":
+        from modules.cg_meter import CGMeter
+        from constants import APP_CG_FILENAME
+        meter = CGMeter()
+        meter.initialize(APP_CG_FILENAME, supervise=False)
+        logger.info("Analysing %.0f s of readings", args.duration)
+        try:
+            rate, report = analyse_live(meter, args.duration, args.segment)
+        finally:
+            meter.shutdown()
+    else:
+        rate, report = analyse_capture(args.spectrum, args.segment)
+    print(format_report(rate, report))
+
+def __start_server(address : str, stations : list[str]):
+    from utils.cgserver import CGServer
+    from modules.cg_meter import CGMeter
+    host, _, port = address.rpartition(":")
+    server = CGServer(host or "127.0.0.1", int(port))
+    server.start()
+    for station in stations:
+        server.attach(CGMeter(station))
+    return server
+
+def __run_gui():
+    # Create the main window, the GUI is imported only now to log its cost
+    from gui.cgmainapp import CGMainApp
+    StartupTimer().mark("gui imported")
+    from modules.cg_meter import CGMeter
+    app = CGMainApp()
+    StartupTimer().mark("window built")
+    try:
+        app.run()
+    finally:
+        # the window may be closed without the exit button
+        CGMeter.shutdown_all()
 
 if __name__ == "__main__":
+    args = __parse_arguments()
+    log_queue = None
+    server = None
     try:
         # start by initializing the RPi GPIO
         if not EMULATE_HX711:
             GPIO.setmode(GPIO.BCM)
 
-        logger = __init_logging()
+        logger, log_queue = __init_logging()
         logger.info("========== Starting " + APP_NAME + " v" + APP_VERSION + " ==========")
-        # Create the main window
-        app = CGMainApp()
-        app.run()
+        StartupTimer().mark("logging")
+        if TIMING_ENABLED or args.timing:
+            PipelineTimer().start_reporting(TIMING_PERIOD)
+        stations = [station[0] for station in __parse_stations(args)] or [DEFAULT_STATION]
+        server = __start_server(args.serve, stations) if args.serve is not None else None
+        if args.spectrum is not None:
+            __run_spectrum(args, logger)
+        elif args.headless:
+            __run_headless(args, logger)
+        else:
+            __run_gui()
+        if PipelineTimer().enabled:
+            PipelineTimer().stop_reporting()
+            PipelineTimer().log()
         logger.info("========== Ending " + APP_NAME + " v" + APP_VERSION + " ==========")
         
     except Exception as e:
         raise e
     finally:
+        # the server thread is stopped even if the run failed, its logs are still written
+        if server is not None:
+            server.stop()
         if not EMULATE_HX711:
-            GPIO.cleanup()
\ No newline at end of file
+            GPIO.cleanup()
+        if log_queue is not None:
+            log_queue.stop()
\ No newline at end of file